@@ -1,30 +1,116 @@
 """
 Step 1: Fetch product names from Supabase and convert to hind.ee URLs
 """
+import asyncio
+import json
 import os
 import re
-from supabase import create_client, Client
+from contextlib import AsyncExitStack
+from http_fetch import HttpFetcher
+from slug_cache import SEARCH_ENABLED
 
-# Initialize Supabase client from environment
+# Supabase credentials from environment
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY environment variables")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Product table settings (configurable via env)
+PRODUCTS_TABLE = os.getenv('PRODUCTS_TABLE', 'Lenovoarvutid')
+PRODUCTS_KEY_COLUMN = os.getenv('PRODUCTS_KEY_COLUMN', 'id')                # unique, sortable
+PRODUCTS_UPDATED_COLUMN = os.getenv('PRODUCTS_UPDATED_COLUMN', 'updated_at')  # for incremental sync
+PAGE_SIZE = int(os.getenv('PRODUCTS_PAGE_SIZE', '1000'))
+
+# 'full' re-reads the whole table; 'incremental' only reads rows changed since
+# the last sync and merges them into the local product list
+SYNC_MODE = os.getenv('PRODUCTS_SYNC_MODE', 'full')
+PRODUCT_LIST_PATH = os.getenv('PRODUCT_LIST_PATH', 'product_list.json')
+
+_supabase = None
+
+def get_supabase():
+    """
+    Supabase client, created on first use so importing this module needs
+    neither the supabase package nor credentials
+    """
+    global _supabase
+    if _supabase is None:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise RuntimeError("Missing SUPABASE_URL or SUPABASE_KEY environment variables")
+        from supabase import create_client
+        _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+def fetch_product_pages(page_size=PAGE_SIZE, since=None, with_updated=False):
+    """
+    Read the product table page by page with keyset pagination
+    (WHERE key > last_key ORDER BY key LIMIT n), so there is no row cap and
+    no OFFSET scan. With `since`, only rows whose updated column is newer
+    are read, ordered by (updated, key).
+    Yields lists of row dicts
+    """
+    key = PRODUCTS_KEY_COLUMN
+    updated = PRODUCTS_UPDATED_COLUMN
+    incremental = since is not None
+    columns = f"{key}, model" + (f", {updated}" if incremental or with_updated else "")
+    last_key = None
+    last_updated = since
+    client = get_supabase()
+    
+    while True:
+        query = client.table(PRODUCTS_TABLE).select(columns)
+        if not incremental:
+            if last_key is not None:
+                query = query.gt(key, last_key)
+            query = query.order(key)
+        else:
+            if last_key is None:
+                query = query.gt(updated, last_updated)
+            else:
+                query = query.or_(
+                    f'{updated}.gt."{last_updated}",'
+                    f'and({updated}.eq."{last_updated}",{key}.gt.{last_key})'
+                )
+            query = query.order(updated).order(key)
+        
+        rows = query.limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_key = rows[-1][key]
+        if incremental:
+            last_updated = rows[-1][updated]
+
+async def stream_product_pages(**options):
+    """
+    Async version of fetch_product_pages: the next page is requested
+    while the caller is still working on the current one
+    """
+    pages = fetch_product_pages(**options)
+    pending = asyncio.ensure_future(asyncio.to_thread(next, pages, None))
+    try:
+        while True:
+            rows = await pending
+            if rows is None:
+                return
+            pending = asyncio.ensure_future(asyncio.to_thread(next, pages, None))
+            yield rows
+    finally:
+        pending.cancel()
 
 def get_products_from_supabase():
     """
     Fetch product names from Supabase (Model column)
-    Returns a list of product names
+    Returns a list of product names; raises RuntimeError if the table cannot
+    be read (e.g. it has no PRODUCTS_KEY_COLUMN), rather than scraping nothing
     """
     try:
-        # Query the Model column from your table
-        # Update 'your_table_name' with your actual table name
-        response = supabase.table('Lenovoarvutid').select('model').execute()
+        # Query the Model column from your table, one page at a time
+        products = []
+        for rows in fetch_product_pages():
+            products.extend(item['model'] for item in rows if item.get('model'))
         
-        if response.data:
-            products = [item['model'] for item in response.data if item.get('model')]
+        if products:
             print(f"✅ Found {len(products)} products from Supabase")
             return products
         else:
@@ -33,7 +119,10 @@ def get_products_from_supabase():
     
     except Exception as e:
         print(f"❌ Error fetching from Supabase: {e}")
-        return []
+        raise RuntimeError(
+            f"Could not read {PRODUCTS_TABLE} (columns {PRODUCTS_KEY_COLUMN}, model; "
+            f"set PRODUCTS_KEY_COLUMN to its unique key column): {e}"
+        ) from e
 
 def product_name_to_hindee_url(product_name):
     """
@@ -57,9 +146,89 @@ def product_name_to_hindee_url(product_name):
     
     return full_url
 
-def fetch_all_product_urls():
+def load_product_list(path=PRODUCT_LIST_PATH):
+    """
+    Local product list from the last incremental sync, or None
+    Format: {"watermark": <max updated value>, "products": {key: model}}
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_product_list(product_list, path=PRODUCT_LIST_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(product_list, f)
+    os.replace(tmp_path, path)
+
+async def stream_product_urls(incremental=SYNC_MODE == 'incremental', path=PRODUCT_LIST_PATH,
+                              slug_cache=None, search=SEARCH_ENABLED):
+    """
+    Async generator of hind.ee URLs, yielded while later pages are still loading
+    In incremental mode the local product list is yielded straight away and
+    only rows changed since the last sync watermark are read from Supabase
+    With a `slug_cache` (slug_cache.SlugCache), known-dead URLs are skipped and,
+    if `search` is on, dead guesses are looked up once through hind.ee search
+    """
+    local = load_product_list(path) if incremental else None
+    products = dict(local['products']) if local else {}
+    watermark = local.get('watermark') if local else None
+    count = 0
+    
+    async with AsyncExitStack() as stack:
+        fetcher = None
+        if slug_cache is not None and search:
+            fetcher = await stack.enter_async_context(HttpFetcher())
+        
+        async def url_for(product_name):
+            if slug_cache is None:
+                return product_name_to_hindee_url(product_name)
+            url = slug_cache.url_for(product_name)
+            if url is None and fetcher is not None and slug_cache.needs_search(product_name):
+                url = await slug_cache.resolve_with_search(fetcher, product_name)
+            return url
+        
+        # Already-known products can be scraped before Supabase even answers
+        for product_name in list(products.values()):
+            url = await url_for(product_name)
+            if url:
+                count += 1
+                yield url
+        
+        # First incremental run: full read, but remember the watermark
+        since = watermark if local else None
+        page_no = 0
+        async for rows in stream_product_pages(since=since, with_updated=incremental):
+            page_no += 1
+            print(f"📄 Page {page_no}: {len(rows)} products from Supabase")
+            for row in rows:
+                product_name = row.get('model')
+                previous = products.get(str(row[PRODUCTS_KEY_COLUMN]))
+                if incremental:
+                    row_updated = row.get(PRODUCTS_UPDATED_COLUMN)
+                    if row_updated and (watermark is None or row_updated > watermark):
+                        watermark = row_updated
+                    if product_name:
+                        products[str(row[PRODUCTS_KEY_COLUMN])] = product_name
+                if product_name and product_name != previous:
+                    url = await url_for(product_name)
+                    if url:
+                        count += 1
+                        yield url
+    
+    if incremental:
+        save_product_list({'watermark': watermark, 'products': products}, path)
+        print(f"💾 Product list synced: {len(products)} products (watermark {watermark})")
+    if slug_cache is not None:
+        slug_cache.print_summary()
+    print(f"✅ Streamed {count} product URLs")
+
+def fetch_all_product_urls(slug_cache=None):
     """
     Main function: Get products from Supabase and convert to URLs
+    With a `slug_cache`, known-dead URLs are left out
     Returns list of URLs ready to scrape
     """
     product_names = get_products_from_supabase()
@@ -75,7 +244,13 @@ def fetch_all_product_urls():
     
     urls = []
     for product_name in product_names:
-        url = product_name_to_hindee_url(product_name)
+        if slug_cache is not None:
+            url = slug_cache.url_for(product_name)
+            if url is None:
+                print(f"🪦 {product_name} -> known dead, skipped")
+                continue
+        else:
+            url = product_name_to_hindee_url(product_name)
         urls.append(url)
         print(f"🔗 {product_name} -> {url}")
     
@@ -84,4 +259,3 @@ def fetch_all_product_urls():
 if __name__ == "__main__":
     urls = fetch_all_product_urls()
     print(f"\n✅ Generated {len(urls)} URLs ready to scrape")
-
@@ -3,137 +3,443 @@ Step 2: Scrape product data from hind.ee
 Takes a URL and returns structured product data
 """
 import asyncio
-import re
-from crawl4ai import AsyncWebCrawler
-from bs4 import BeautifulSoup
+import os
+import random
+import time
+from browser_pool import BrowserPool, MAX_PAGES_PER_BROWSER
+from scheduler import AdaptiveConcurrency, HostRateLimiter
+from readiness import ReadyHistogram, render_until_ready
+from http_fetch import HttpFetcher, FetchStats
+from page_cache import PageCache, CACHE_PATH, content_hash
+from html_archive import ARCHIVE_PATH, HtmlArchive
+from extraction import (
+    ParseError, extract_offers, extract_product_name, find_sellers_fragment, has_sellers_group
+)
+from metrics import timed
+from resources import (
+    BLOCK_RESOURCES, MAX_RSS_MB, MemoryWatch, TransferStats, install_resource_blocking
+)
 
-async def scrape_product_data(url):
+# Concurrency settings (configurable via env)
+CONCURRENCY = int(os.getenv('SCRAPER_CONCURRENCY', '4'))
+MAX_CONCURRENCY = int(os.getenv('SCRAPER_MAX_CONCURRENCY', '8'))
+HOST_RATE = float(os.getenv('SCRAPER_HOST_RATE', '2.0'))  # requests/sec per host
+HOST_BURST = int(os.getenv('SCRAPER_HOST_BURST', '2'))
+
+# 'auto': plain HTTP first, browser only if the HTML has no sellers-group
+# 'browser': always render in the browser, 'http': never use the browser
+FETCH_MODE = os.getenv('SCRAPER_FETCH_MODE', 'auto')
+
+# Quiet mode drops the per-page/per-offer console output (SCRAPER_QUIET=1 or --quiet)
+QUIET = os.getenv('SCRAPER_QUIET', '0') == '1'
+
+# Max URLs/results buffered between pipeline stages
+QUEUE_SIZE = int(os.getenv('SCRAPER_QUEUE_SIZE', '100'))
+
+# Failed URLs are retried at the end of the run, in up to RETRY_ROUNDS
+# rounds with jittered exponential backoff starting at RETRY_DELAY seconds
+RETRY_ROUNDS = int(os.getenv('SCRAPER_RETRY_ROUNDS', '2'))
+RETRY_DELAY = float(os.getenv('SCRAPER_RETRY_DELAY', '5'))
+# Max retries per error class: a page that rendered without sellers is
+# a real answer, a parse error gets one more look, timeouts/fetch errors
+# are usually transient
+RETRY_LIMITS = {'timeout': RETRY_ROUNDS, 'fetch_error': RETRY_ROUNDS,
+                'parse_error': 1, 'no_sellers': 0}
+
+async def render_page(crawler, url, histogram=None, timings=None):
+    """
+    Render a page with the given crawler and return its HTML
+    Returns as soon as the offers table is in the DOM (see readiness.py)
+    """
+    transfer = getattr(crawler, 'page_transfer', None)
+    if transfer is not None:
+        transfer['bytes'] = 0
+    result = await render_until_ready(crawler, url, histogram=histogram, timings=timings)
+    if timings is not None and transfer is not None:
+        timings['page_bytes'] = timings.get('page_bytes', 0) + transfer['bytes']
+    return result.html
+
+async def fetch_plain_html(fetcher, url, stats=None, headers=None):
+    """
+    Try the plain-HTTP fast path
+    Returns (status, html, response_headers); html is None when the page
+    needs the browser (or was not modified, status 304)
+    """
+    try:
+        status, html, response_headers = await fetcher.fetch(url, headers=headers)
+    except Exception as e:
+        print(f"⚠️ Plain HTTP failed for {url}: {type(e).__name__}: {e}")
+        if stats:
+            stats.http_errors += 1
+        return None, None, {}
+    
+    if status == 304:
+        # Conditional request: page unchanged since the cached copy
+        if stats:
+            stats.http += 1
+        return status, None, response_headers
+    
+    if status == 404:
+        # Product page does not exist, a browser will not help
+        if stats:
+            stats.not_found += 1
+        return status, html, response_headers
+    
+    if status == 200 and has_sellers_group(html):
+        if stats:
+            stats.http += 1
+        return status, html, response_headers
+    
+    if stats:
+        stats.fallback += 1
+    return status, None, response_headers
+
+async def scrape_product_data(url, pool=None, histogram=None, fetcher=None,
+                              stats=None, fetch_mode=FETCH_MODE, cache=None,
+                              timings=None, quiet=QUIET, profiler=None, archive=None,
+                              all_offers=False):
     """
     Scrape a single product from hind.ee
+    With a `fetcher`, plain HTTP is tried first and the browser is used only
+    when the HTML has no sellers-group (see FETCH_MODE)
+    Uses a browser from `pool` if given, otherwise launches a one-off browser
+    With a `cache` (page_cache.PageCache), unchanged pages skip extraction and
+    the cached product is returned with 'unchanged': True
+    With a `timings` dict, per-stage seconds, 'html_size' and 'page_bytes'
+    are filled in (see metrics.py); a cProfile `profiler` is enabled while parsing
+    With an `archive` (html_archive.HtmlArchive), every fetched page is archived
+    With all_offers=True the product also gets 'all_offers': every offer's
+    store and price as columns (see offer_analytics.py)
     Returns dictionary with product information
     """
-    async with AsyncWebCrawler(
-        verbose=False,
-        headless=True
-    ) as crawler:
-        result = await crawler.arun(
-            url=url,
-            delay_before_return_html=3.0
-        )
-        
-        soup = BeautifulSoup(result.html, 'html.parser')
-        
-        # Get product name
-        product_name = soup.find('h1')
-        product_name_text = product_name.text.strip() if product_name else 'Not found'
-        
-        print(f"\n📦 Scraping: {product_name_text}")
-        
-        # Find the sellers groups section
-        sellers_groups = soup.find('div', class_='sellers-group')
-        
-        if not sellers_groups:
-            print("⚠️ No sellers found")
-            return {
+    cached = cache.get(url) if cache is not None else None
+    if cached and all_offers and 'all_offers' not in cached['product']:
+        cached = None  # cached before offers were captured: extract it again
+    html = None
+    response_headers = {}
+    
+    if fetcher is not None and fetch_mode != 'browser':
+        conditional = cache.conditional_headers(cached) if cache is not None else None
+        with timed(timings, 'navigate'):
+            status, html, response_headers = await fetch_plain_html(fetcher, url, stats, conditional)
+        if timings is not None and status is not None:
+            length = response_headers.get('Content-Length')
+            timings['page_bytes'] = int(length) if length else len(html or '')
+        if status == 304 and cached:
+            return cache.reuse(url, cached, revalidated=True)
+        if html is None and fetch_mode == 'http':
+            if status != 200:
+                # Only a 200 is a page without sellers (a 404 has its html);
+                # 403/429/5xx or a failed fetch say nothing about the product
+                raise ConnectionError(f"plain HTTP fetch failed ({status}) for {url}")
+            html = ''
+    elif stats:
+        stats.browser += 1
+    
+    if html is None:
+        response_headers = {}
+        acquiring = time.perf_counter()
+        if pool is None:
+            from crawl4ai import AsyncWebCrawler
+            
+            async with AsyncWebCrawler(
+                verbose=False,
+                headless=True
+            ) as crawler:
+                if BLOCK_RESOURCES:
+                    install_resource_blocking(crawler)
+                if timings is not None:
+                    timings['acquire'] = time.perf_counter() - acquiring
+                html = await render_page(crawler, url, histogram, timings)
+        else:
+            async with pool.page() as crawler:
+                if timings is not None:
+                    timings['acquire'] = time.perf_counter() - acquiring
+                html = await render_page(crawler, url, histogram, timings)
+    if timings is not None:
+        timings['html_size'] = len(html)
+    if archive is not None and html:
+        archive.put(url, html)
+    
+    if cache is None:
+        return parse_product_html(html, url, quiet, timings, profiler, all_offers)
+    
+    with timed(timings, 'parse'):
+        page_hash = content_hash(html)
+    if cached and cached['content_hash'] == page_hash:
+        return cache.reuse(url, cached)
+    
+    product = parse_product_html(html, url, quiet, timings, profiler, all_offers)
+    cache.put(url, page_hash, product,
+              etag=response_headers.get('ETag'),
+              last_modified=response_headers.get('Last-Modified'))
+    return product
+
+def parse_product_html(html, url, quiet=QUIET, timings=None, profiler=None, all_offers=False):
+    """
+    Extract product name and top 3 offers from a rendered product page
+    (plus every offer as 'all_offers' columns with all_offers=True)
+    Raises ParseError if the page is not parseable
+    """
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with timed(timings, 'parse'):
+            product_name_text = extract_product_name(html)
+            # Only the sellers-group region is parsed (see extraction.py)
+            fragment = find_sellers_fragment(html)
+        if not quiet:
+            print(f"\n📦 Scraping: {product_name_text}")
+        if fragment is None:
+            if not quiet:
+                print("⚠️ No sellers found")
+            product = {
                 'product_name': product_name_text,
                 'product_url': url,
                 'offers': []
             }
+            if all_offers:
+                product['all_offers'] = {'stores': [], 'prices': []}
+            return product
         
-        # Find all item-table-wrap divs with offers
-        offers = sellers_groups.find_all('div', class_='item-table-wrap', itemprop='offers')
-        print(f"   Found {len(offers)} offers")
-        
-        # Collect all offers for this product
-        product_offers = []
-        
-        for i, offer in enumerate(offers[:3], 1):  # Top 3 cheapest
-            # Find the specific td with class "col-7" that contains store info
-            store_td = offer.find('td', class_='col-7')
-            
-            if store_td:
-                # Find the tablet-show div inside the td
-                tablet_show = store_td.find('div', class_='tablet-show')
-                
-                if tablet_show:
-                    # Get the store link
-                    store_data = tablet_show.find('a')
-                    store_link = store_data.get('href', 'No link found') if store_data else 'Not found'
-                    
-                    # Extract store name from onclick attribute
-                    onclick = store_data.get('onclick', '') if store_data else ''
-                    match = re.search(r"'eventCategory':\s*'([^']+)'", onclick)
-                    store_name = match.group(1) if match else "Unknown"
-                    
-                    # Get the price from inside the link
-                    price_div = store_data.find('div', class_='price') if store_data else None
-                    price_text = price_div.text.strip() if price_div else 'Not found'
-                    
-                    # Extract numeric price value
-                    price_match = re.search(r'(\d+\.?\d*)', price_text.replace('€', '').replace(',', '.'))
-                    price_value = float(price_match.group(1)) if price_match else 0.0
-                    
-                    offer_data = {
-                        'position': i,
-                        'store_name': store_name,
-                        'store_link': store_link,
-                        'price_text': price_text,
-                        'price_value': price_value
-                    }
-                    
-                    product_offers.append(offer_data)
-                    print(f"   {i}. {store_name} - {price_text}")
-        
-        return {
-            'product_name': product_name_text,
-            'product_url': url,
-            'offers': product_offers
-        }
+        with timed(timings, 'extract'):
+            offer_count, product_offers, columns = extract_offers(fragment, all_offers=all_offers)
+    except Exception as e:
+        raise ParseError(f"{type(e).__name__}: {e}") from e
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    if not quiet:
+        print(f"   Found {offer_count} offers")
+        for offer in product_offers:
+            print(f"   {offer['position']}. {offer['store_name']} - {offer['price_text']}")
+    
+    product = {
+        'product_name': product_name_text,
+        'product_url': url,
+        'offers': product_offers
+    }
+    if all_offers:
+        product['all_offers'] = columns
+    return product
 
 # Getting the URLS 
 
-async def scrape_multiple_products(urls):
+async def _iterate(urls):
     """
-    Scrape multiple product URLs
-    Returns list of product data dictionaries
+    Iterate a plain or async iterable of URLs
     """
-    all_products = []
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
 
-    # TEMP: collect failed URLs during this run
-    failed_urls = []  # TEMP
+async def scrape_products_stream(urls, concurrency=CONCURRENCY,
+                                 max_concurrency=MAX_CONCURRENCY,
+                                 host_rate=HOST_RATE, host_burst=HOST_BURST,
+                                 pool_size=None,
+                                 max_pages_per_browser=MAX_PAGES_PER_BROWSER,
+                                 fetch_mode=FETCH_MODE, queue_size=QUEUE_SIZE,
+                                 cache_path=CACHE_PATH, slug_cache=None,
+                                 journal=None, retry_rounds=RETRY_ROUNDS,
+                                 retry_delay=RETRY_DELAY, metrics=None, quiet=QUIET,
+                                 max_rss_mb=MAX_RSS_MB, archive_path=ARCHIVE_PATH,
+                                 all_offers=False):
+    """
+    Scrape product URLs concurrently and yield product dicts as they finish
+    `urls` can be a list or an (async) iterable that is still being produced.
+    One browser pool is opened for the whole run and reused for every URL.
+    Up to `concurrency` pages are in flight at once; the limit adapts between
+    1 and `max_concurrency` based on errors/empty results, and each host is
+    held to `host_rate` requests per second.
+    Pages are fetched over plain HTTP first unless `fetch_mode` is 'browser'.
+    URL and result queues hold at most `queue_size` items, so a slow consumer
+    slows the scrapers down instead of letting results pile up in memory.
+    Pages are checked against the page cache at `cache_path` ('' disables it);
+    unchanged products are yielded with 'unchanged': True.
+    With a `slug_cache` (slug_cache.SlugCache), URLs that come back with no
+    sellers are negative-cached (timeouts and errors are not).
+    Failed URLs are classified (timeout, no_sellers, parse_error, fetch_error)
+    and retried after the main pass, up to `retry_rounds` times as allowed by
+    RETRY_LIMITS. With a `journal` (run_journal.RunJournal) every attempt is
+    recorded and URLs it already has as done are skipped.
+    With `metrics` (metrics.Metrics) every URL's stage timings and outcome are
+    recorded; `quiet` drops the per-page console output.
+    Browsers block non-essential requests (see resources.py) and are
+    restarted while the process tree is over `max_rss_mb` (0 = no limit).
+    Fetched pages are kept in the raw HTML archive at `archive_path` ('' = off).
+    With all_offers=True every offer on a page is captured, not just the top 3
+    (the product's 'all_offers' columns, see offer_analytics.py).
+    """
+    limiter = AdaptiveConcurrency(initial=concurrency, maximum=max(concurrency, max_concurrency))
+    rate_limiter = HostRateLimiter(rate=host_rate, burst=host_burst)
+    histogram = ReadyHistogram()
+    fetch_stats = FetchStats()
+    transfer = TransferStats()
+    memory = MemoryWatch(max_rss_mb)
+    cache = PageCache(cache_path) if cache_path else None
+    archive = HtmlArchive(archive_path) if archive_path else None
+    url_queue = asyncio.Queue(maxsize=queue_size)
+    result_queue = asyncio.Queue(maxsize=queue_size)
+    workers = limiter.maximum
+    scraped = 0
+    attempts = {}      # url -> attempts in this run
+    retry_queue = []
+    gave_up = {}       # error class -> URLs given up on
 
-    # TEMP: debug show what we received
-    print(f"🔍 DEBUG: Received {len(urls)} URLs to scrape")  # TEMP
-    for i, dbg_url in enumerate(urls[:10], 1):  # TEMP: preview first 10
-        print(f"   {i}. {dbg_url}")  # TEMP
-    
-    for url in urls:
+    async def feed(source):
         try:
-            print(f"\n🌐 Scraping: {url}")  # TEMP
-            product_data = await scrape_product_data(url)
-            all_products.append(product_data)
+            async for url in _iterate(source):
+                if journal is not None and journal.is_done(url):
+                    continue
+                await url_queue.put(url)
+        finally:
+            for _ in range(workers):
+                await url_queue.put(None)
 
-            # TEMP: consider it failed if no offers collected
-            if not product_data.get('offers'):
-                failed_urls.append(url)
+    async def scrape_one(url, pool, fetcher):
+        """
+        Returns (product_data, error class or None)
+        """
+        await limiter.acquire()
+        outcome = 'error'
+        error = 'fetch_error'
+        product_data = None
+        timings = {}
+        try:
+            await rate_limiter.wait(url)
+            if not quiet:
+                print(f"\n🌐 Scraping: {url}")
+            product_data = await scrape_product_data(
+                url, pool=pool, histogram=histogram,
+                fetcher=fetcher, stats=fetch_stats, fetch_mode=fetch_mode,
+                cache=cache, timings=timings, quiet=quiet,
+                profiler=metrics.profiler if metrics is not None else None,
+                archive=archive, all_offers=all_offers
+            )
+            if product_data.get('offers'):
+                outcome, error = 'ok', None
+            else:
+                outcome, error = 'empty', 'no_sellers'
+        except asyncio.TimeoutError:
+            outcome, error = 'timeout', 'timeout'
+            print(f"❌ Timeout scraping {url}")
+        except ParseError as e:
+            error = 'parse_error'
+            print(f"❌ Could not parse {url}: {e}")
         except Exception as e:
-            failed_urls.append(url)
-            print(f"❌ Error scraping {url}: {e}")  # TEMP
-        
-        print("\n" + "="*80 + "\n")
-    
-    # TEMP: dump failed URLs at the end for copy/paste
-    if failed_urls:
-        print("⛔ Failed URLs (TEMP):")
-        for u in failed_urls:
-            print(u)
+            print(f"❌ Error scraping {url}: {type(e).__name__}: {e}")
+        finally:
+            await limiter.release(outcome)
+        if slug_cache is not None and outcome in ('ok', 'empty'):
+            slug_cache.record(url, found=outcome == 'ok')
+        if 'page_bytes' in timings:
+            transfer.add_page(timings['page_bytes'])
+        memory.sample()
+        if metrics is not None:
+            metrics.observe(url, timings, error or 'ok')
+        return product_data, error
+
+    async def worker(pool, fetcher):
+        nonlocal scraped
+        while True:
+            url = await url_queue.get()
+            if url is None:
+                return
+            attempt = attempts[url] = attempts.get(url, 0) + 1
+            if journal is not None:
+                journal.record(url, 'pending')
+            product_data, error = await scrape_one(url, pool, fetcher)
+            scraped += 1
+            if journal is not None:
+                journal.record(url, 'failed' if error else 'scraped', error)
+            if error is not None:
+                if attempt <= min(retry_rounds, RETRY_LIMITS.get(error, 0)):
+                    retry_queue.append(url)
+                    continue
+                gave_up.setdefault(error, []).append(url)
+            if product_data is not None:
+                await result_queue.put(product_data)
+
+    async def run_pass(source, pool, fetcher):
+        await asyncio.gather(feed(source), *(worker(pool, fetcher) for _ in range(workers)))
+
+    async def run_all(pool, fetcher):
+        try:
+            await run_pass(urls, pool, fetcher)
+            for round_no in range(1, retry_rounds + 1):
+                if not retry_queue:
+                    break
+                retry_urls = retry_queue[:]
+                retry_queue.clear()
+                # Jittered so reruns do not hit the site in lockstep
+                delay = retry_delay * 2 ** (round_no - 1) * random.uniform(0.5, 1.5)
+                print(f"🔁 Retry round {round_no}: {len(retry_urls)} failed URLs in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                await run_pass(retry_urls, pool, fetcher)
+        finally:
+            await result_queue.put(None)
+
+    started = time.perf_counter()
+    # Browsers are launched lazily, so an all-HTTP run never starts Chromium
+    async with HttpFetcher(connections=limiter.maximum * 2) as fetcher, \
+            BrowserPool(size=pool_size or limiter.maximum,
+                        max_pages=max_pages_per_browser, lazy=True,
+                        transfer=transfer, memory=memory) as pool:
+        runner = asyncio.create_task(run_all(pool, fetcher))
         try:
-            with open("failed_urls.txt", "w") as f:
-                f.write("\n".join(failed_urls))
-            print("💾 Wrote failed_urls.txt")
-        except Exception:
-            pass
+            while True:
+                product_data = await result_queue.get()
+                if product_data is None:
+                    break
+                yield product_data
+            await runner  # surface errors from the URL source
+        finally:
+            if not runner.done():
+                # Consumer stopped early: drop buffered results and stop the workers
+                runner.cancel()
+                while not result_queue.empty():
+                    result_queue.get_nowait()
+                await asyncio.gather(runner, return_exceptions=True)
+            if cache is not None:
+                cache.close()
+            if archive is not None:
+                archive.close()
+    elapsed = time.perf_counter() - started
 
+    rate = scraped / elapsed if elapsed > 0 else 0.0
+    print("\n" + "="*80)
+    print(f"⚡ Scraped {scraped} pages in {elapsed:.1f}s ({rate:.2f} pages/sec, "
+          f"peak concurrency {limiter.peak})")
+    fetch_stats.print_summary()
+    if cache is not None:
+        cache.print_summary()
+    histogram.print_summary()
+    if archive is not None:
+        archive.print_summary()
+    transfer.print_summary()
+    memory.print_summary()
+    if metrics is not None:
+        metrics.observe_memory(memory.peak)
+    if gave_up:
+        print("⛔ Gave up on " + ", ".join(
+            f"{len(failed)} {error}" for error, failed in sorted(gave_up.items())
+        ) + " URLs")
+    if journal is not None:
+        journal.print_summary()
+
+async def scrape_multiple_products(urls, **options):
+    """
+    Scrape multiple product URLs concurrently
+    Options are passed to scrape_products_stream
+    Returns list of product data dictionaries (in input order)
+    """
+    urls = list(urls)
+    order = {url: i for i, url in enumerate(urls)}
+    all_products = [product async for product in scrape_products_stream(urls, **options)]
+    all_products.sort(key=lambda product: order.get(product['product_url'], 0))
     return all_products
 
 async def main():
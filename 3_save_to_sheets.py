@@ -2,123 +2,241 @@
 Step 3: Save scraped product data to Google Sheets
 """
 import os
+import random
+import time
 from datetime import datetime
-import gspread
-from google.oauth2.service_account import Credentials
 import json
 import csv
 
-def save_to_google_sheets(products_data):
+# Google Sheets write settings (configurable via env)
+SHEETS_CHUNK_SIZE = int(os.getenv('SHEETS_CHUNK_SIZE', '500'))    # rows per append request
+SHEETS_MAX_RETRIES = int(os.getenv('SHEETS_MAX_RETRIES', '6'))
+SHEETS_MAX_BACKOFF = 64.0  # seconds, per Google's truncated exponential backoff advice
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Columns to export (in order)
+SHEETS_HEADERS = ['product_name', 'product_url', 'store_name', 'price_value', 'timestamp', 'change']
+
+# gspread and google-auth are imported where they are used, so CSV,
+# Supabase and history runs start without them
+_sheets_clients = {}
+
+def get_sheets_client(credentials_path):
+    """
+    Authorized gspread client, created once per credentials file and reused
+    """
+    client = _sheets_clients.get(credentials_path)
+    if client is None:
+        import gspread
+        from google.oauth2.service_account import Credentials
+        
+        scope = [
+            'https://www.googleapis.com/auth/spreadsheets',
+            'https://www.googleapis.com/auth/drive'
+        ]
+        creds = Credentials.from_service_account_file(credentials_path, scopes=scope)
+        client = _sheets_clients[credentials_path] = gspread.authorize(creds)
+    return client
+
+def _api_status(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+def sheets_call_with_retry(func, *args, max_retries=SHEETS_MAX_RETRIES, sleep=time.sleep, **kwargs):
+    """
+    Call a gspread method, retrying quota (429) and server errors with
+    exponential backoff plus jitter; honours Retry-After when sent
+    """
+    import gspread
+    
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = _api_status(e)
+            if status not in RETRYABLE_STATUS or attempt == max_retries:
+                raise
+            headers = getattr(getattr(e, 'response', None), 'headers', None) or {}
+            try:
+                delay = float(headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                delay = min(SHEETS_MAX_BACKOFF, 2 ** attempt) + random.random()
+            print(f"⏳ Sheets API {status}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            sleep(delay)
+
+def open_worksheet(spreadsheet, worksheet_name, rows_needed, cols=len(SHEETS_HEADERS), sleep=time.sleep):
+    """
+    Open the worksheet, creating it sized for the rows about to be written
+    """
+    import gspread
+    
+    try:
+        return sheets_call_with_retry(spreadsheet.worksheet, worksheet_name, sleep=sleep)
+    except gspread.WorksheetNotFound:
+        return sheets_call_with_retry(
+            spreadsheet.add_worksheet, title=worksheet_name, rows=max(rows_needed, 1), cols=cols,
+            sleep=sleep
+        )
+
+def save_to_google_sheets(products_data, client=None, chunk_size=SHEETS_CHUNK_SIZE, sleep=time.sleep,
+                          raise_errors=False):
     """
     Save product data to Google Sheets
     products_data should be a list of product dictionaries from scraper
+    Only row 1 is read (to check for the header); rows are appended in
+    chunks of about `chunk_size` (a product's rows are never split) with
+    quota-aware retries. A gspread-compatible `client` can be passed in
+    (e.g. a fake backend for testing)
+    With raise_errors=True failures are re-raised after being reported
+    (the pipeline's sink runner counts them); a failure after some chunks
+    were appended raises pipeline.PartialWriteError with the products
+    already in the sheet, so they are not appended again
+    Returns the number of rows saved
     """
+    import gspread
     
     # Google Sheets setup (configurable via env)
     credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', '/Users/indrekvaher/Downloads/lenovoarvutid-36b91c2f7a61.json')
     spreadsheet_name = os.getenv('SHEETS_SPREADSHEET', 'Lenovo')
     worksheet_name = os.getenv('SHEETS_WORKSHEET', 'Prices')
     
+    # Prepare data for insertion
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows_to_insert = []
+    chunks = []  # (products, rows), split between products
+    chunk_products, chunk_rows = [], []
+    for product in products_data:
+        for offer in product['offers']:
+            row = [
+                product['product_name'],
+                product['product_url'],
+                offer['store_name'],
+                offer['price_value'],
+                timestamp,
+                offer.get('change', ''),
+            ]
+            rows_to_insert.append(row)
+            chunk_rows.append(row)
+        chunk_products.append(product)
+        if len(chunk_rows) >= chunk_size:
+            chunks.append((chunk_products, chunk_rows))
+            chunk_products, chunk_rows = [], []
+    if chunk_rows:
+        chunks.append((chunk_products, chunk_rows))
+    
+    if not rows_to_insert:
+        print("⚠️ No data to save (empty offers)")
+        return 0
+    
+    saved = 0
+    written = []  # products whose rows are in the sheet
     try:
         # Authenticate with Google Sheets
-        scope = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        
-        creds = Credentials.from_service_account_file(credentials_path, scopes=scope)
-        client = gspread.authorize(creds)
+        if client is None:
+            client = get_sheets_client(credentials_path)
         
         # Open the spreadsheet
-        spreadsheet = client.open(spreadsheet_name)
-        try:
-            worksheet = spreadsheet.worksheet(worksheet_name)
-        except gspread.WorksheetNotFound:
-            worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=1000, cols=10)
-        
-        # Columns to export (in order)
-        headers = ['product_name', 'product_url', 'store_name', 'price_value', 'timestamp']
+        spreadsheet = sheets_call_with_retry(client.open, spreadsheet_name, sleep=sleep)
+        worksheet = open_worksheet(spreadsheet, worksheet_name, len(rows_to_insert) + 1, sleep=sleep)
         
-        # Ensure header row exists (append if empty)
-        existing = worksheet.get_all_values()
-        if not existing:
-            worksheet.append_row(headers)
+        # Ensure header row exists (only row 1 is fetched)
+        if not sheets_call_with_retry(worksheet.row_values, 1, sleep=sleep):
+            sheets_call_with_retry(worksheet.append_row, SHEETS_HEADERS, sleep=sleep)
         
-        # Prepare data for insertion
-        rows_to_insert = []
-        for product in products_data:
-            for offer in product['offers']:
-                row = [
-                    product['product_name'],
-                    product['product_url'],
-                    offer['store_name'],
-                    offer['price_value'],
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                ]
-                rows_to_insert.append(row)
+        for chunk_products, chunk in chunks:
+            try:
+                sheets_call_with_retry(worksheet.append_rows, chunk, sleep=sleep)
+            except Exception as e:
+                if not written:
+                    raise
+                from pipeline import PartialWriteError
+                
+                raise PartialWriteError(written, e) from e
+            saved += len(chunk)
+            written.extend(chunk_products)
         
-        if rows_to_insert:
-            result = worksheet.append_rows(rows_to_insert)
-            print(f"✅ Saved {len(rows_to_insert)} rows to Google Sheets")
-            print(f"   Sheet URL: https://docs.google.com/spreadsheets/d/{spreadsheet.id}")
-        else:
-            print("⚠️ No data to save (empty offers)")
+        print(f"✅ Saved {saved} rows to Google Sheets")
+        print(f"   Sheet URL: https://docs.google.com/spreadsheets/d/{spreadsheet.id}")
         
     except FileNotFoundError:
         print("❌ Credentials file not found. Please set GOOGLE_APPLICATION_CREDENTIALS")
+        if raise_errors:
+            raise
     except gspread.exceptions.SpreadsheetNotFound:
         print(f"❌ Spreadsheet '{spreadsheet_name}' not found. Please create & share with:")
         print("   lenovarvutid@lenovoarvutid.iam.gserviceaccount.com")
+        if raise_errors:
+            raise
     except gspread.exceptions.APIError as e:
-        print(f"❌ Google Sheets API Error: {e}")
+        print(f"❌ Google Sheets API Error after {saved}/{len(rows_to_insert)} rows: {e}")
+        if raise_errors:
+            raise
     except Exception as e:
         print(f"❌ Error saving to Google Sheets: {type(e).__name__}: {e}")
+        if raise_errors:
+            raise
         import traceback
         traceback.print_exc()
+    return saved
 
-def save_to_supabase(products_data):
+def save_to_supabase(products_data, sink=None, raise_errors=False):
     """
     Alternative: Save to Supabase instead
+    Upserts in parallel chunks through one shared client (see supabase_sink.py)
+    With raise_errors=True failures are re-raised (upserts are safe to retry)
+    Returns the number of offers saved
     """
-    from supabase import create_client
-    
-    url = "https://muegxjihaepqayvwuyjz.supabase.co"
-    key = "your-service-role-key-here"
-    supabase = create_client(url, key)
-    
-    all_offers = []
-    
-    for product in products_data:
-        for offer in product['offers']:
-            all_offers.append({
-                'product_name': product['product_name'],
-                'product_url': product['product_url'],
-                'store_name': offer['store_name'],
-                'store_link': offer['store_link'],
-                'price_text': offer['price_text'],
-                'price_value': offer['price_value'],
-                'position': offer['position'],
-                'scraped_at': datetime.now().isoformat()
-            })
+    from supabase_sink import SupabaseSink
     
     try:
-        result = supabase.table('laptop_prices').insert(all_offers).execute()
-        print(f"✅ Saved {len(all_offers)} offers to Supabase")
+        saved, failed = (sink or SupabaseSink()).write(products_data)
     except Exception as e:
         print(f"❌ Error saving to Supabase: {e}")
+        if raise_errors:
+            raise
+        return 0
+    if failed:
+        print(f"⚠️ Saved {saved} offers to Supabase, {failed} failed after retries")
+        if raise_errors:
+            raise RuntimeError(f"{failed} offers failed to upsert")
+    else:
+        print(f"✅ Saved {saved} offers to Supabase")
+    return saved
+
+def save_to_price_history(products_data, history=None, raise_errors=False):
+    """
+    Alternative: Append to the local columnar price history (see price_history.py)
+    Every run is kept, partitioned by scrape date; needs pyarrow
+    With raise_errors=True failures are re-raised after being reported
+    Returns the number of offers saved
+    """
+    from price_history import PriceHistory
+    
+    try:
+        saved = (history or PriceHistory()).write(products_data)
+    except Exception as e:
+        print(f"❌ Error saving to price history: {type(e).__name__}: {e}")
+        if raise_errors:
+            raise
+        return 0
+    print(f"✅ Saved {saved} offers to price history")
+    return saved
 
-def save_to_csv(products_data, filename='laptop_prices.csv'):
+def save_to_csv(products_data, filename='laptop_prices.csv', append=False):
     """
     Alternative: Save to CSV file
+    With append=True rows are added to the existing file (used for batches)
     """
     import csv
     
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+    write_header = not append or not os.path.exists(filename) or os.path.getsize(filename) == 0
+    with open(filename, 'a' if append else 'w', newline='', encoding='utf-8') as csvfile:
         fieldnames = ['timestamp', 'product_name', 'product_url', 'position', 
-                     'store_name', 'store_link', 'price_text', 'price_value']
+                     'store_name', 'store_link', 'price_text', 'price_value', 'change']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         
-        writer.writeheader()
+        if write_header:
+            writer.writeheader()
         
         for product in products_data:
             for offer in product['offers']:
@@ -130,7 +248,8 @@ def save_to_csv(products_data, filename='laptop_prices.csv'):
                     'store_name': offer['store_name'],
                     'store_link': offer['store_link'],
                     'price_text': offer['price_text'],
-                    'price_value': offer['price_value']
+                    'price_value': offer['price_value'],
+                    'change': offer.get('change', '')
                 })
     
     print(f"✅ Saved to {filename}")
@@ -156,5 +275,6 @@ if __name__ == "__main__":
     # Choose one of these:
     save_to_csv(test_data)
     # save_to_supabase(test_data)
+    # save_to_price_history(test_data)
     # save_to_google_sheets(test_data)
 
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark: offer extraction speed on stored product pages
+
+Compares the old full-page BeautifulSoup parse with extraction.py
+(sellers-group subtree only) and checks both return the same data.
+
+    python benchmarks/bench_extraction.py [fixtures_dir] [--rounds N]
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import extraction  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+
+def extract_with_full_soup(html, url):
+    """
+    The original scrape_product_data parse: full tree, nested find/find_all,
+    patterns compiled on every offer
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    product_name = soup.find('h1')
+    product_name_text = product_name.text.strip() if product_name else 'Not found'
+    sellers_groups = soup.find('div', class_='sellers-group')
+    if not sellers_groups:
+        return {'product_name': product_name_text, 'product_url': url, 'offers': []}
+    offers = sellers_groups.find_all('div', class_='item-table-wrap', itemprop='offers')
+    product_offers = []
+    for i, offer in enumerate(offers[:3], 1):
+        store_td = offer.find('td', class_='col-7')
+        if store_td:
+            tablet_show = store_td.find('div', class_='tablet-show')
+            if tablet_show:
+                store_data = tablet_show.find('a')
+                store_link = store_data.get('href', 'No link found') if store_data else 'Not found'
+                onclick = store_data.get('onclick', '') if store_data else ''
+                match = re.search(r"'eventCategory':\s*'([^']+)'", onclick)
+                store_name = match.group(1) if match else "Unknown"
+                price_div = store_data.find('div', class_='price') if store_data else None
+                price_text = price_div.text.strip() if price_div else 'Not found'
+                price_match = re.search(r'(\d+\.?\d*)', price_text.replace('€', '').replace(',', '.'))
+                price_value = float(price_match.group(1)) if price_match else 0.0
+                product_offers.append({
+                    'position': i,
+                    'store_name': store_name,
+                    'store_link': store_link,
+                    'price_text': price_text,
+                    'price_value': price_value
+                })
+    return {'product_name': product_name_text, 'product_url': url, 'offers': product_offers}
+
+
+def run(name, extract, pages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for url, html in pages:
+            extract(html, url)
+    elapsed = time.perf_counter() - started
+    rate = rounds * len(pages) / elapsed
+    print(f"   {name:<28} {rate:>10.1f} pages/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('fixtures', nargs='?', default=str(FIXTURES_DIR))
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    pages = []
+    for path in sorted(Path(args.fixtures).glob('*.html')):
+        url = f"https://www.hind.ee/p/{path.stem}"
+        pages.append((url, path.read_text(encoding='utf-8')))
+    if not pages:
+        print(f"❌ No .html fixtures in {args.fixtures}")
+        return
+
+    # Both paths must agree before timing means anything
+    for url, html in pages:
+        expected = extract_with_full_soup(html, url)
+        actual = extraction.extract_product(html, url)
+        if expected != actual:
+            print(f"❌ Mismatch on {url}:\n   old: {expected}\n   new: {actual}")
+            sys.exit(1)
+
+    backend = 'lxml' if extraction.lxml_html is not None else 'BeautifulSoup'
+    total_kb = sum(len(html) for _, html in pages) / 1024
+    print(f"📊 {len(pages)} fixtures ({total_kb:.0f} KB), {args.rounds} rounds, backend: {backend}")
+    old = run('full BeautifulSoup parse', extract_with_full_soup, pages, args.rounds)
+    new = run('sellers-group subtree', extraction.extract_product, pages, args.rounds)
+    print(f"⚡ Speedup: {new / old:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
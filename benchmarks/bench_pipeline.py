@@ -0,0 +1,263 @@
+"""
+End-to-end throughput benchmark against the local hind.ee stand-in
+
+For every configuration a stand-in server (standin_server.py) is started
+and the scraper is run against it in a fresh process, once per mode:
+
+    stream    step 2's scrape_multiple_products
+    pipeline  orchestrate.run_once: scrape stream, batching and a CSV sink
+
+Reported per run: pages/sec, p50/p95 page latency (sum of the per-page
+stages from metrics.py) and peak RSS of the scraper and its browsers.
+
+    python benchmarks/bench_pipeline.py [--configs http,flaky] [--pages 300]
+    python benchmarks/bench_pipeline.py --output bench.json
+    python benchmarks/bench_pipeline.py --baseline bench.json   # exit 1 on a regression
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import standin_server  # noqa: E402
+
+# Server options and scraper env per configuration
+CONFIGS = {
+    'http': {
+        'server': {'latency_ms': 30, 'jitter_ms': 10},
+        'env': {'SCRAPER_FETCH_MODE': 'http'},
+    },
+    'http-slow': {
+        'server': {'latency_ms': 300, 'jitter_ms': 100},
+        'env': {'SCRAPER_FETCH_MODE': 'http'},
+    },
+    'big-pages': {
+        'server': {'latency_ms': 30, 'page_kb': 400, 'offers': (20, 60)},
+        'env': {'SCRAPER_FETCH_MODE': 'http'},
+    },
+    'flaky': {
+        'server': {'latency_ms': 30, 'error_rate': 0.05, 'not_found_rate': 0.05},
+        'env': {'SCRAPER_FETCH_MODE': 'http', 'SCRAPER_RETRY_DELAY': '0.5'},
+    },
+    'browser-js': {
+        'server': {'latency_ms': 30, 'js_rate': 1.0, 'js_delay_ms': 300},
+        'env': {'SCRAPER_FETCH_MODE': 'auto'},
+    },
+}
+MODES = ('stream', 'pipeline')
+LATENCY_STAGES = ('acquire', 'navigate', 'render_wait', 'parse', 'extract')
+
+# Every run starts cold and only talks to the stand-in
+BASE_ENV = {
+    'SCRAPER_HOST_RATE': '0',
+    'SCRAPER_CACHE_PATH': '',
+    'SCRAPER_ARCHIVE_PATH': '',
+    'SCRAPER_ALLOWED_DOMAINS': '127.0.0.1',
+    'SCRAPER_QUIET': '1',
+    'SLUG_CACHE_PATH': '',
+    'PRICE_STATE_PATH': '',
+    'RUN_JOURNAL_PATH': '',
+    'METRICS_PROMETHEUS_PATH': '',
+}
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def _peak_rss(report):
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return max(report.get('peak_rss', 0), own + children)
+
+
+async def _run_child(mode, base_url, pages, report_path):
+    """
+    One benchmark run (in its own process, env already set)
+    Returns the metrics report
+    """
+    sys.path.insert(0, str(ROOT))
+    os.chdir(os.path.dirname(report_path))  # nothing the run writes lands in the repo
+    urls = [f"{base_url}/p/bench-model-{i}" for i in range(pages)]
+    if mode == 'stream':
+        from importlib.util import module_from_spec, spec_from_file_location
+        from metrics import Metrics
+
+        spec = spec_from_file_location('step2', ROOT / '2_scrape_product.py')
+        step2 = module_from_spec(spec)
+        spec.loader.exec_module(step2)
+        metrics = Metrics()
+        await step2.scrape_multiple_products(urls, metrics=metrics, quiet=True)
+        metrics.write(report_path, '', '')
+    else:
+        import orchestrate
+
+        args = orchestrate.parse_args(['--quiet', '--processes', '1'])
+        sink = orchestrate.csv_sink(os.path.join(os.path.dirname(report_path), 'bench.csv'))
+        await orchestrate.run_once(args, [sink], urls=urls)
+    with open(report_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def child_main(mode, base_url, pages):
+    report_path = os.environ['METRICS_REPORT_PATH']
+    started = time.perf_counter()
+    report = asyncio.run(_run_child(mode, base_url, pages, report_path))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(sum(row.get(stage, 0.0) for stage in LATENCY_STAGES)
+                       for row in report['urls'])
+    result = {
+        'pages': report['pages'],
+        'outcomes': report['outcomes'],
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(report['pages'] / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(_quantile(latencies, 0.5) * 1000, 1),
+        'p95_ms': round(_quantile(latencies, 0.95) * 1000, 1),
+        'peak_rss_mb': round(_peak_rss(report) / 2**20, 1),
+    }
+    print("RESULT " + json.dumps(result))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"stand-in server did not start on port {port}")
+
+
+def run_config(name, modes, pages, timeout):
+    config = CONFIGS[name]
+    port = _free_port()
+    # 'spawn' so the server does not inherit anything from this process
+    context = multiprocessing.get_context('spawn')
+    server = context.Process(target=standin_server.serve, args=('127.0.0.1', port),
+                             kwargs={'seed': 1, **config['server']}, daemon=True)
+    server.start()
+    results = {}
+    try:
+        _wait_for_port(port)
+        for mode in modes:
+            with tempfile.TemporaryDirectory(prefix='bench-') as tmp:
+                env = {**os.environ, **BASE_ENV, **config['env'],
+                       'METRICS_REPORT_PATH': os.path.join(tmp, 'report.json')}
+                try:
+                    done = subprocess.run(
+                        [sys.executable, __file__, '--child', mode,
+                         f"http://127.0.0.1:{port}", str(pages)],
+                        env=env, capture_output=True, text=True, timeout=timeout
+                    )
+                except subprocess.TimeoutExpired:
+                    results[mode] = {'error': f"timed out after {timeout:g}s"}
+                    continue
+                lines = [line for line in done.stdout.splitlines() if line.startswith('RESULT ')]
+                if done.returncode or not lines:
+                    error = (done.stderr.strip().splitlines() or ['no output'])[-1]
+                    results[mode] = {'error': error}
+                else:
+                    results[mode] = json.loads(lines[-1][len('RESULT '):])
+    finally:
+        server.terminate()
+        server.join()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions against a baseline results file: runs whose pages/sec dropped
+    or whose p95 latency / peak RSS grew by more than `tolerance`
+    """
+    regressions = []
+    for name, modes in results.items():
+        for mode, result in modes.items():
+            before = baseline.get(name, {}).get(mode)
+            if not before or 'error' in before:
+                continue
+            if 'error' in result:
+                regressions.append(f"{name}/{mode}: failed ({result['error']})")
+                continue
+            if result['pages_per_sec'] < before['pages_per_sec'] * (1 - tolerance):
+                regressions.append(f"{name}/{mode}: {result['pages_per_sec']} pages/sec "
+                                   f"(was {before['pages_per_sec']})")
+            for key in ('p95_ms', 'peak_rss_mb'):
+                if result[key] > before[key] * (1 + tolerance):
+                    regressions.append(f"{name}/{mode}: {key} {result[key]} (was {before[key]})")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'config':<12} {'mode':<9} {'pages':>6} {'pages/s':>9} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'peak MiB':>9}")
+    for name, modes in results.items():
+        for mode, result in modes.items():
+            if 'error' in result:
+                print(f"{name:<12} {mode:<9} ❌ {result['error']}")
+                continue
+            print(f"{name:<12} {mode:<9} {result['pages']:>6} {result['pages_per_sec']:>9.1f} "
+                  f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['peak_rss_mb']:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--configs', default=','.join(CONFIGS),
+                        help=f"comma-separated, from: {', '.join(CONFIGS)}")
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--timeout', type=float, default=600, help="seconds per run")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative slowdown before a run counts as a regression")
+    args = parser.parse_args(argv)
+
+    names = [name for name in args.configs.split(',') if name]
+    unknown = [name for name in names if name not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown config(s): {', '.join(unknown)}")
+    modes = [mode for mode in args.modes.split(',') if mode]
+
+    results = {}
+    for name in names:
+        print(f"🏁 {name}: {args.pages} pages, {', '.join(modes)}")
+        results[name] = run_config(name, modes, args.pages, args.timeout)
+    print()
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"📉 {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        child_main(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,157 @@
+"""
+Local hind.ee stand-in: synthetic product pages for benchmarks
+
+Pages have the real offers markup (sellers-group > item-table-wrap[itemprop=offers]
+> td.col-7 > div.tablet-show > a[onclick] > div.price), generated
+deterministically from the product slug. Latency, JS-delayed offers (the
+plain HTML has no sellers-group; a script inserts it after a delay, so the
+scraper has to fall back to the browser), dead products (404) and transient
+server errors (500) are configurable.
+
+    python benchmarks/standin_server.py --port 8900 --latency-ms 50 --error-rate 0.02
+    curl http://127.0.0.1:8900/p/bench-model-1
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+from aiohttp import web
+
+STORES = ['Itsupply.ee', 'Klick.ee', 'Arvutitark.ee', 'Photopoint.ee', 'Euronics.ee',
+          'Kaup24.ee', 'Onoff.ee', 'Pood.ee', 'Datakom.ee', 'Ordi.ee']
+
+DEFAULTS = {
+    'offers': (3, 25),       # offers per product (min, max)
+    'latency_ms': 50.0,      # server think time per request
+    'jitter_ms': 20.0,       # +/- uniform jitter on the latency
+    'js_rate': 0.0,          # share of products whose offers are inserted by JS
+    'js_delay_ms': 500.0,    # how long the script waits before inserting them
+    'not_found_rate': 0.0,   # share of products that do not exist (always 404)
+    'error_rate': 0.0,       # share of requests answered with 500 (transient)
+    'page_kb': 60,           # filler so pages are about the size of real ones
+}
+
+
+def _slug_random(slug):
+    seed = int.from_bytes(hashlib.blake2b(slug.encode('utf-8'), digest_size=8).digest(), 'big')
+    return random.Random(seed)
+
+
+def _share(slug, salt, rate):
+    # Stable per product: the same slug is always a 404 / always JS-rendered
+    return rate > 0 and _slug_random(salt + slug).random() < rate
+
+
+def _price_text(value):
+    return f"{value:.2f}".replace('.', ',') + " €"
+
+
+def sellers_html(slug, offers=DEFAULTS['offers']):
+    """
+    The sellers-group block of a product, offers sorted by price like hind.ee
+    """
+    rng = _slug_random(slug)
+    count = rng.randint(*offers)
+    base = rng.uniform(400, 2500)
+    prices = sorted(base * rng.uniform(1.0, 1.4) for _ in range(count))
+    rows = []
+    for i, price in enumerate(prices):
+        store = STORES[(i + rng.randrange(len(STORES))) % len(STORES)]
+        rows.append(
+            '<div class="item-table-wrap" itemprop="offers" itemscope>'
+            '<table class="item-table"><tr>'
+            f'<td class="col-1"><img src="/static/{store}.png" alt="{store}"></td>'
+            '<td class="col-7"><div class="tablet-show">'
+            f'<a href="https://www.hind.ee/go/{1000 + i}" rel="nofollow" '
+            f'onclick="ga(\'send\', \'event\', {{\'eventCategory\': \'{store}\', '
+            f'\'eventAction\': \'click\', \'eventLabel\': \'offer\'}})">'
+            f'<div class="price">{_price_text(price)}</div></a>'
+            '</div></td></tr></table></div>'
+        )
+    return '<div class="sellers-group">' + ''.join(rows) + '</div>'
+
+
+def product_page(slug, config):
+    title = slug.replace('-', ' ').title()
+    filler = ('<p class="spec">Lorem ipsum dolor sit amet, consectetur adipiscing elit. </p>'
+              * (config['page_kb'] * 1024 // 81))
+    if _share(slug, 'js', config['js_rate']):
+        offers = sellers_html(slug, config['offers']).replace('`', '')
+        body = (f'<div id="offers-root"></div>'
+                f'<script>setTimeout(() => {{ document.getElementById("offers-root").outerHTML = '
+                f'`{offers}`; }}, {int(config["js_delay_ms"])});</script>')
+    else:
+        body = sellers_html(slug, config['offers'])
+    return (f'<!DOCTYPE html><html><head><title>{title} | hind.ee</title></head><body>'
+            f'<header><nav>hind.ee</nav></header><h1>{title}</h1>'
+            f'{body}<section class="specs">{filler}</section></body></html>')
+
+
+def make_app(**options):
+    """
+    The stand-in application; options override DEFAULTS
+    """
+    config = {**DEFAULTS, **options}
+    app = web.Application()
+    app['requests'] = 0
+
+    async def handle_product(request):
+        app['requests'] += 1
+        slug = request.match_info['slug']
+        latency = config['latency_ms'] + random.uniform(-1, 1) * config['jitter_ms']
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+        if random.random() < config['error_rate']:
+            return web.Response(status=500, text="Internal Server Error")
+        if _share(slug, '404', config['not_found_rate']):
+            return web.Response(status=404, text='<html><h1>Lehte ei leitud</h1>'
+                                                 '<div class="page-404"></div></html>',
+                                content_type='text/html')
+        return web.Response(text=product_page(slug, config), content_type='text/html')
+
+    async def handle_stats(request):
+        return web.json_response({'requests': app['requests'], 'config': config})
+
+    app.router.add_get('/p/{slug}', handle_product)
+    app.router.add_get('/stats', handle_stats)
+    return app
+
+
+def _offers_range(value):
+    low, _, high = value.partition('-')
+    return int(low), int(high or low)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local hind.ee stand-in for benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--offers', type=_offers_range, default=DEFAULTS['offers'],
+                        help="offers per product, e.g. 3-25")
+    parser.add_argument('--latency-ms', type=float, default=DEFAULTS['latency_ms'])
+    parser.add_argument('--jitter-ms', type=float, default=DEFAULTS['jitter_ms'])
+    parser.add_argument('--js-rate', type=float, default=DEFAULTS['js_rate'])
+    parser.add_argument('--js-delay-ms', type=float, default=DEFAULTS['js_delay_ms'])
+    parser.add_argument('--not-found-rate', type=float, default=DEFAULTS['not_found_rate'])
+    parser.add_argument('--error-rate', type=float, default=DEFAULTS['error_rate'])
+    parser.add_argument('--page-kb', type=int, default=DEFAULTS['page_kb'])
+    parser.add_argument('--seed', type=int, help="seed for latency jitter and errors")
+    return parser.parse_args(argv)
+
+
+def serve(host, port, seed=None, **options):
+    if seed is not None:
+        random.seed(seed)
+    web.run_app(make_app(**options), host=host, port=port, print=None)
+
+
+def main(argv=None):
+    args = vars(parse_args(argv))
+    host, port = args.pop('host'), args.pop('port')
+    print(f"🧪 hind.ee stand-in on http://{host}:{port}/p/<slug>")
+    serve(host, port, **args)
+
+
+if __name__ == "__main__":
+    main()
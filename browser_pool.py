@@ -0,0 +1,244 @@
+"""
+Browser pool: keep a few headless crawlers alive for the whole run
+instead of launching a new browser for every product page
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from readiness import install_timing_hooks
+from resources import BLOCK_RESOURCES, install_resource_blocking
+
+# Defaults (configurable via env)
+POOL_SIZE = int(os.getenv('SCRAPER_POOL_SIZE', '2'))
+MAX_PAGES_PER_BROWSER = int(os.getenv('SCRAPER_MAX_PAGES_PER_BROWSER', '200'))
+MAX_ERRORS_PER_BROWSER = int(os.getenv('SCRAPER_MAX_ERRORS_PER_BROWSER', '3'))
+# Seconds between memory restarts, so the RSS of one restart is seen before the next
+MEMORY_RESTART_COOLDOWN = float(os.getenv('SCRAPER_MEMORY_RESTART_COOLDOWN', '30'))
+
+# Tiny inline page used to check that a browser still renders
+HEALTH_CHECK_URL = "raw:<html><body>ok</body></html>"
+HEALTH_CHECK_TIMEOUT = 15.0
+
+
+class PooledBrowser:
+    """
+    One crawler in the pool plus its usage counters
+    """
+    def __init__(self, crawler, browser_id):
+        self.crawler = crawler
+        self.browser_id = browser_id
+        self.pages = 0
+        self.errors = 0
+
+
+class BrowserPool:
+    """
+    Pool of long-lived AsyncWebCrawler instances
+
+    Browsers are started once and handed out one page at a time.
+    A browser is recycled after `max_pages` renders, or after
+    `max_errors` failed renders in a row. A browser that failed its
+    last render is health-checked before it is handed out again.
+    With `lazy=True` browsers are only launched when a page is first
+    requested, so runs that never need a browser never start one.
+    With `block_resources`, images/fonts/third-party requests are blocked
+    (see resources.py; counted in `transfer`, a TransferStats). With a
+    `memory` watch (resources.MemoryWatch), a browser handed back while the
+    process tree is over its RSS limit is restarted: one at a time, at most
+    once per `memory_cooldown` seconds, closing it before its replacement
+    is launched.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_BROWSER,
+                 max_errors=MAX_ERRORS_PER_BROWSER, lazy=False,
+                 block_resources=BLOCK_RESOURCES, transfer=None, memory=None,
+                 memory_cooldown=MEMORY_RESTART_COOLDOWN, **crawler_kwargs):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_errors = max_errors
+        self.lazy = lazy
+        self.block_resources = block_resources
+        self.transfer = transfer
+        self.memory = memory
+        self.memory_cooldown = memory_cooldown
+        self.crawler_kwargs = {'verbose': False, 'headless': True, **crawler_kwargs}
+        self._idle = asyncio.Queue()
+        self._browsers = []
+        self._next_id = 0
+        self._launching = 0
+        self._restarting = False
+        self._last_restart = None  # time.monotonic() of the last memory restart
+        self.launched = 0
+        self.recycled = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        """
+        Launch all browsers up front (unless the pool is lazy)
+        """
+        if self.lazy:
+            return
+        browsers = await asyncio.gather(*(self._launch() for _ in range(self.size)))
+        for browser in browsers:
+            self._idle.put_nowait(browser)
+        print(f"🧭 Browser pool ready ({self.size} browsers)")
+
+    async def close(self):
+        """
+        Shut down every browser in the pool
+        """
+        browsers, self._browsers = self._browsers, []
+        await asyncio.gather(*(self._shutdown(b) for b in browsers))
+        if not self.launched:
+            return
+        print(f"🧭 Browser pool closed (launched {self.launched}, recycled {self.recycled})")
+
+    async def _launch(self):
+        # crawl4ai (and Playwright) only load once a browser is needed:
+        # lazy pools in plain-HTTP runs never pay for the import
+        from crawl4ai import AsyncWebCrawler
+        
+        crawler = AsyncWebCrawler(**self.crawler_kwargs)
+        await crawler.__aenter__()
+        install_timing_hooks(crawler)
+        if self.block_resources:
+            install_resource_blocking(crawler, self.transfer)
+        self._next_id += 1
+        self.launched += 1
+        browser = PooledBrowser(crawler, self._next_id)
+        self._browsers.append(browser)
+        return browser
+
+    async def _shutdown(self, browser):
+        if browser in self._browsers:
+            self._browsers.remove(browser)
+        try:
+            await browser.crawler.__aexit__(None, None, None)
+        except Exception as e:
+            print(f"⚠️ Error closing browser #{browser.browser_id}: {e}")
+
+    async def _recycle(self, browser):
+        """
+        Replace a browser with a fresh one
+        If the new browser cannot be launched the old one is kept,
+        so the pool never loses capacity
+        """
+        try:
+            fresh = await self._launch()
+        except Exception as e:
+            print(f"⚠️ Could not relaunch browser #{browser.browser_id}: {e}")
+            browser.pages = 0
+            browser.errors = 0
+            return browser
+        await self._shutdown(browser)
+        self.recycled += 1
+        return fresh
+
+    def _memory_restart_due(self):
+        if self.memory is None or self._restarting:
+            return False
+        if (self._last_restart is not None
+                and time.monotonic() - self._last_restart < self.memory_cooldown):
+            return False
+        return self.memory.over_limit()
+
+    async def _restart(self, browser):
+        """
+        Close a browser, then launch its replacement, so the two never hold
+        memory at the same time
+        Returns None if the relaunch failed (see release())
+        """
+        self._restarting = True
+        self._launching += 1  # keeps acquire() from filling the slot meanwhile
+        try:
+            await self._shutdown(browser)
+            self.recycled += 1
+            return await self._launch()
+        except Exception as e:
+            print(f"⚠️ Could not relaunch browser #{browser.browser_id}: {e}")
+            return None
+        finally:
+            self._launching -= 1
+            self._restarting = False
+            self._last_restart = time.monotonic()
+
+    async def is_healthy(self, browser):
+        """
+        Render a tiny inline page to check the browser still works
+        """
+        try:
+            result = await asyncio.wait_for(
+                browser.crawler.arun(url=HEALTH_CHECK_URL),
+                timeout=HEALTH_CHECK_TIMEOUT
+            )
+            return bool(getattr(result, 'success', True))
+        except Exception:
+            return False
+
+    async def acquire(self):
+        """
+        Take a browser from the pool (waits until one is free)
+        """
+        if self._idle.empty() and len(self._browsers) + self._launching < self.size:
+            self._launching += 1
+            try:
+                return await self._launch()
+            finally:
+                self._launching -= 1
+        browser = await self._idle.get()
+        if browser is None:
+            # A slot left empty by a failed relaunch: launch into it now, and
+            # hand the slot on if this launch fails too
+            self._launching += 1
+            try:
+                return await self._launch()
+            except Exception:
+                self._idle.put_nowait(None)
+                raise
+            finally:
+                self._launching -= 1
+        if browser.errors and not await self.is_healthy(browser):
+            print(f"🩺 Browser #{browser.browser_id} failed health check, recycling")
+            browser = await self._recycle(browser)
+        return browser
+
+    async def release(self, browser, ok=True):
+        """
+        Return a browser to the pool, recycling it if it is worn out
+        """
+        browser.pages += 1
+        browser.errors = 0 if ok else browser.errors + 1
+        if browser.pages >= self.max_pages or browser.errors >= self.max_errors:
+            browser = await self._recycle(browser)
+        elif self._memory_restart_due():
+            print(f"🧠 RSS {self.memory.current / 2**20:.0f} MiB over the limit, "
+                  f"restarting browser #{browser.browser_id}")
+            self.memory.restarts += 1
+            browser = await self._restart(browser)
+            self.memory.sample(force=True)
+        # None marks an empty slot, so a caller already waiting in acquire()
+        # launches the missing browser instead of waiting for one forever
+        self._idle.put_nowait(browser)
+
+    @asynccontextmanager
+    async def page(self):
+        """
+        Borrow a crawler for one page render
+
+            async with pool.page() as crawler:
+                result = await crawler.arun(url=url)
+        """
+        browser = await self.acquire()
+        ok = False
+        try:
+            yield browser.crawler
+            ok = True
+        finally:
+            await self.release(browser, ok)
@@ -0,0 +1,40 @@
+"""
+Command line entry point: laptop-monitor <command> [options]
+
+Only the selected command's module is imported, and that module loads its
+backends (crawl4ai, supabase, gspread, pyarrow) when they are first used,
+so `--help`, archive replays and CSV-only runs start without them.
+
+    laptop-monitor run --sinks csv          # orchestrate.py
+    laptop-monitor serve --port 8080        # scrape_service.py
+    laptop-monitor archive stats            # html_archive.py
+"""
+import argparse
+import importlib
+import sys
+
+# command -> (module, function called with the remaining arguments, help)
+COMMANDS = {
+    'run': ('orchestrate', 'cli', "scrape the catalogue and save it to the selected sinks"),
+    'serve': ('scrape_service', 'main', "product lookups over a local HTTP/JSON API"),
+    'archive': ('html_archive', 'main', "replay or inspect the raw HTML archive"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='laptop-monitor', description="Laptop price monitoring",
+        epilog="run 'laptop-monitor <command> --help' for a command's options"
+    )
+    parser.add_argument('command', choices=COMMANDS,
+                        help="; ".join(f"{name}: {text}" for name, (_, _, text) in COMMANDS.items()))
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    module_name, function, _ = COMMANDS[args.command]
+    sys.argv[0] = f"laptop-monitor {args.command}"  # the command's own --help shows this
+    return getattr(importlib.import_module(module_name), function)(args.args)
+
+
+if __name__ == "__main__":
+    main()
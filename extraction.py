@@ -0,0 +1,198 @@
+"""
+Offer extraction shared by all scrapers
+
+Only the sellers-group region of the page is parsed: the region is cut out
+of the raw HTML with a cheap tag scan and handed to lxml (or BeautifulSoup
+when lxml is not installed). Patterns are compiled once at import.
+"""
+import html as html_lib
+import re
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # lxml is optional, fall back to BeautifulSoup
+    lxml_html = None
+
+MAX_OFFERS = 3  # Top 3 cheapest
+
+
+class ParseError(Exception):
+    """
+    A fetched page could not be parsed into product data
+    """
+
+
+# Precompiled patterns
+# A whole class token: not 'sellers-group-title', not a data-class attribute
+SELLERS_GROUP_RE = re.compile(
+    r'<div\b[^>]*?\sclass\s*=\s*["\'](?:[^"\']*\s)?sellers-group(?=[\s"\'])[^>]*>',
+    re.IGNORECASE
+)
+DIV_TAG_RE = re.compile(r'<(/?)div\b', re.IGNORECASE)
+H1_RE = re.compile(r'<h1\b[^>]*>(.*?)</h1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r'<[^>]+>')
+EVENT_CATEGORY_RE = re.compile(r"'eventCategory':\s*'([^']+)'")
+PRICE_RE = re.compile(r'(\d+\.?\d*)')
+
+if lxml_html is not None:
+    def _has_class(name):
+        return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+    OFFERS_XPATH = etree.XPath(".//div[%s][@itemprop='offers']" % _has_class('item-table-wrap'))
+    STORE_TD_XPATH = etree.XPath(".//td[%s]" % _has_class('col-7'))
+    TABLET_SHOW_XPATH = etree.XPath(".//div[%s]" % _has_class('tablet-show'))
+    LINK_XPATH = etree.XPath(".//a")
+    PRICE_XPATH = etree.XPath(".//div[%s]" % _has_class('price'))
+
+
+def has_sellers_group(html):
+    """
+    True if the HTML contains the sellers-group offers section
+    """
+    return bool(html) and SELLERS_GROUP_RE.search(html) is not None
+
+
+def find_sellers_fragment(html):
+    """
+    Cut the first sellers-group <div>...</div> out of the raw HTML
+    Returns the fragment string, or None if the page has no sellers-group
+    """
+    if not html:
+        return None
+    match = SELLERS_GROUP_RE.search(html)
+    if not match:
+        return None
+    depth = 1
+    for tag in DIV_TAG_RE.finditer(html, match.end()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            end = html.find('>', tag.end())
+            return html[match.start():end + 1 if end != -1 else len(html)]
+    # Unbalanced markup: take everything after the opening tag
+    return html[match.start():]
+
+
+def extract_product_name(html):
+    """
+    Text of the first <h1>, or 'Not found'
+    """
+    match = H1_RE.search(html or '')
+    if not match:
+        return 'Not found'
+    return html_lib.unescape(TAG_RE.sub('', match.group(1))).strip()
+
+
+def parse_price(price_text):
+    """
+    '1 234,56 €' style text -> float (0.0 if no number)
+    """
+    price_match = PRICE_RE.search(price_text.replace('€', '').replace(',', '.'))
+    return float(price_match.group(1)) if price_match else 0.0
+
+
+def _offer_dict(position, store_link, onclick, price_text):
+    match = EVENT_CATEGORY_RE.search(onclick)
+    return {
+        'position': position,
+        'store_name': match.group(1) if match else "Unknown",
+        'store_link': store_link,
+        'price_text': price_text,
+        'price_value': parse_price(price_text)
+    }
+
+
+def _first(xpath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+
+def _offer_fields_lxml(offer):
+    store_td = _first(STORE_TD_XPATH, offer)
+    tablet_show = _first(TABLET_SHOW_XPATH, store_td) if store_td is not None else None
+    if tablet_show is None:
+        return None
+    store_data = _first(LINK_XPATH, tablet_show)
+    if store_data is None:
+        return 'Not found', '', 'Not found'
+    price_div = _first(PRICE_XPATH, store_data)
+    return (store_data.get('href', 'No link found'), store_data.get('onclick', ''),
+            price_div.text_content().strip() if price_div is not None else 'Not found')
+
+
+def _offer_fields_soup(offer):
+    store_td = offer.find('td', class_='col-7')
+    tablet_show = store_td.find('div', class_='tablet-show') if store_td else None
+    if not tablet_show:
+        return None
+    store_data = tablet_show.find('a')
+    if not store_data:
+        return 'Not found', '', 'Not found'
+    price_div = store_data.find('div', class_='price')
+    return (store_data.get('href', 'No link found'), store_data.get('onclick', ''),
+            price_div.text.strip() if price_div else 'Not found')
+
+
+def _collect_offers(offers, offer_fields, max_offers, all_offers):
+    product_offers = []
+    columns = {'stores': [], 'prices': []} if all_offers else None
+    # Past the top `max_offers` only store and price are kept, as columns
+    for i, offer in enumerate(offers if all_offers else offers[:max_offers], 1):
+        fields = offer_fields(offer)
+        if fields is None:
+            continue
+        if i <= max_offers:
+            product_offers.append(_offer_dict(i, *fields))
+        if columns is not None:
+            store_link, onclick, price_text = fields
+            price = parse_price(price_text)
+            if price > 0:
+                match = EVENT_CATEGORY_RE.search(onclick)
+                columns['stores'].append(match.group(1) if match else "Unknown")
+                columns['prices'].append(price)
+    return product_offers, columns
+
+
+def _extract_offers_lxml(fragment, max_offers, all_offers=False):
+    root = lxml_html.fragment_fromstring(fragment, create_parent='div')
+    offers = OFFERS_XPATH(root)
+    product_offers, columns = _collect_offers(offers, _offer_fields_lxml, max_offers, all_offers)
+    return len(offers), product_offers, columns
+
+
+def _extract_offers_soup(fragment, max_offers, all_offers=False):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(fragment, 'html.parser')
+    offers = soup.find_all('div', class_='item-table-wrap', itemprop='offers')
+    product_offers, columns = _collect_offers(offers, _offer_fields_soup, max_offers, all_offers)
+    offer_count = len(offers)
+    # Soup trees are full of reference cycles; break them now instead of
+    # leaving the tree to the garbage collector
+    soup.decompose()
+    return offer_count, product_offers, columns
+
+
+def extract_offers(fragment, max_offers=MAX_OFFERS, all_offers=False):
+    """
+    Parse a sellers-group fragment
+    Returns (number of offers on the page, list of the first `max_offers`
+    offer dicts, columns). With all_offers=True columns holds every priced
+    offer on the page as {'stores': [...], 'prices': [...]} (see
+    offer_analytics.py), otherwise it is None
+    """
+    extract = _extract_offers_lxml if lxml_html is not None else _extract_offers_soup
+    return extract(fragment, max_offers, all_offers)
+
+
+def extract_product(html, url, max_offers=MAX_OFFERS):
+    """
+    Extract product name and offers from a product page
+    Returns the same dict as scrape_product_data
+    """
+    fragment = find_sellers_fragment(html)
+    _, offers, _ = extract_offers(fragment, max_offers) if fragment else (0, [], None)
+    return {
+        'product_name': extract_product_name(html),
+        'product_url': url,
+        'offers': offers
+    }
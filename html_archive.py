@@ -0,0 +1,281 @@
+"""
+Raw HTML archive: every fetched page, compressed and content-addressed
+
+Pages are stored once per distinct content (SHA-256 of the HTML), appended
+to pack files, and indexed in SQLite by URL and scrape time. Each writer
+process appends to its own pack file, so sharded runs can share an archive.
+
+Replay runs the extraction over archived pages with no browser and no
+network: pack files are memory-mapped and the pages are decompressed and
+parsed in a process pool, so a markup fix or a new field can be backfilled
+at parse speed.
+
+    python html_archive.py replay --since 2025-01-01 --output replay.jsonl
+    python html_archive.py stats
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from extraction import extract_product
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, zlib is always there
+    zstandard = None
+
+# Archive settings (configurable via env)
+ARCHIVE_PATH = os.getenv('SCRAPER_ARCHIVE_PATH', '')  # directory; '' disables the archive
+ARCHIVE_PACK_MB = float(os.getenv('SCRAPER_ARCHIVE_PACK_MB', '256'))  # start a new pack after this
+ARCHIVE_COMMIT_EVERY = 50  # pages per index commit
+REPLAY_CHUNK = 256         # pages per process pool task
+COMPRESSION_LEVEL = 3
+
+
+def _compress(data):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(data)
+    return 'zlib', zlib.compress(data, COMPRESSION_LEVEL)
+
+
+def _decompress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _connect(path):
+    os.makedirs(path, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(path, 'index.sqlite'), timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")  # sharded writers and replay readers at once
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            pack TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            codec TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pages (
+            url TEXT NOT NULL,
+            scraped_at REAL NOT NULL,
+            hash TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS pages_url ON pages (url, scraped_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS pages_time ON pages (scraped_at)")
+    return conn
+
+
+class HtmlArchive:
+    """
+    Writer side: put(url, html) appends the page (if its content is new)
+    and records that `url` had it at `scraped_at`
+    """
+
+    def __init__(self, path=ARCHIVE_PATH, pack_mb=ARCHIVE_PACK_MB):
+        self.path = path
+        self.pack_bytes = pack_mb * 1024 * 1024
+        self.conn = _connect(path)
+        os.makedirs(os.path.join(path, 'packs'), exist_ok=True)
+        self.pack_name = None
+        self.pack = None
+        self.pages = 0
+        self.stored = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.pack is not None:
+            self.pack.flush()
+            os.fsync(self.pack.fileno())
+            self.pack.close()
+            self.pack = None
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def _open_pack(self):
+        if self.pack is not None:
+            self.pack.close()
+        # One pack per writer process: appends never interleave
+        self.pack_name = f"pack-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.stored}.bin"
+        self.pack = open(os.path.join(self.path, 'packs', self.pack_name), 'ab')
+
+    def put(self, url, html, scraped_at=None):
+        """
+        Archive one fetched page
+        Returns the content hash
+        """
+        data = html.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        known = self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        if known is None:
+            codec, compressed = _compress(data)
+            if self.pack is None or self.pack.tell() + len(compressed) > self.pack_bytes:
+                self._open_pack()
+            offset = self.pack.tell()
+            self.pack.write(compressed)
+            # The index only points at bytes that reached the file
+            self.pack.flush()
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, self.pack_name, offset, len(compressed), len(data), codec)
+            )
+            self.stored += 1
+            self.stored_bytes += len(compressed)
+        self.conn.execute("INSERT INTO pages VALUES (?, ?, ?)",
+                          (url, scraped_at or time.time(), digest))
+        self.pages += 1
+        self.raw_bytes += len(data)
+        self._uncommitted += 1
+        if self._uncommitted >= ARCHIVE_COMMIT_EVERY:
+            self.conn.commit()
+            self._uncommitted = 0
+        return digest
+
+    def print_summary(self):
+        if not self.pages:
+            return
+        print(f"🗄️ Archive: {self.pages} pages, {self.stored} new blobs, "
+              f"{self.raw_bytes / 2**20:.1f} MiB HTML stored as {self.stored_bytes / 2**20:.1f} MiB")
+
+
+# Replay workers keep their pack files mapped between tasks
+_mapped = {}
+
+
+def _pack_view(path, pack, end):
+    view = _mapped.get(pack)
+    if view is None or len(view) < end:  # (re)map packs a live writer has grown
+        with open(os.path.join(path, 'packs', pack), 'rb') as f:
+            view = _mapped[pack] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return view
+
+
+def _replay_chunk(path, rows):
+    """
+    Process pool task: decompress and extract a chunk of archived pages
+    Returns (products, errors)
+    """
+    products = []
+    errors = 0
+    for url, scraped_at, pack, offset, length, codec in rows:
+        try:
+            view = _pack_view(path, pack, offset + length)
+            html = _decompress(codec, view[offset:offset + length]).decode('utf-8')
+            product = extract_product(html, url)
+        except Exception:
+            errors += 1
+            continue
+        product['scraped_at'] = scraped_at
+        products.append(product)
+    return products, errors
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def replay(path=ARCHIVE_PATH, since=None, until=None, latest=False, workers=None,
+           chunk=REPLAY_CHUNK):
+    """
+    Generator of products re-extracted from archived pages (with 'scraped_at')
+    `since`/`until` limit the scrape time (epoch seconds); `latest` keeps only
+    the newest page per URL. Pages are read in pack order so each worker walks
+    its mapped files sequentially.
+    """
+    conn = _connect(path)
+    where, params = [], []
+    if since is not None:
+        where.append("p.scraped_at >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("p.scraped_at < ?")
+        params.append(until)
+    if latest:
+        where.append("p.scraped_at = (SELECT MAX(scraped_at) FROM pages WHERE url = p.url)")
+    query = ("SELECT p.url, p.scraped_at, b.pack, b.offset, b.length, b.codec "
+             "FROM pages p JOIN blobs b ON b.hash = p.hash"
+             + (" WHERE " + " AND ".join(where) if where else "")
+             + " ORDER BY b.pack, b.offset")
+    rows = conn.execute(query, params)
+    errors = 0
+    # 'spawn' like the sharded scraper; workers only need extraction.py
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = []
+        limit = (workers or os.cpu_count() or 1) * 2
+        while True:
+            batch = rows.fetchmany(chunk)
+            if batch:
+                pending.append(pool.submit(_replay_chunk, path, batch))
+            # Bounded in flight: the index is streamed, not loaded whole
+            while pending and (len(pending) >= limit or not batch):
+                products, failed = pending.pop(0).result()
+                errors += failed
+                yield from products
+            if not batch:
+                break
+    conn.close()
+    if errors:
+        print(f"⚠️ {errors} archived pages could not be extracted")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Raw HTML archive")
+    parser.add_argument('--path', default=ARCHIVE_PATH or 'html_archive')
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help="re-extract archived pages (no browser, no network)")
+    replay_parser.add_argument('--since', help="ISO date/time, inclusive")
+    replay_parser.add_argument('--until', help="ISO date/time, exclusive")
+    replay_parser.add_argument('--latest', action='store_true', help="only the newest page per URL")
+    replay_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    replay_parser.add_argument('--output', default='replay.jsonl', help="products as JSON lines")
+    commands.add_parser('stats', help="archive size and page counts")
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        conn = _connect(args.path)
+        pages, urls = conn.execute("SELECT COUNT(*), COUNT(DISTINCT url) FROM pages").fetchone()
+        blobs, size, stored = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM blobs"
+        ).fetchone()
+        conn.close()
+        print(f"🗄️ {pages} pages of {urls} URLs, {blobs} distinct; "
+              f"{size / 2**20:.1f} MiB distinct HTML in {stored / 2**20:.1f} MiB")
+        return
+
+    started = time.perf_counter()
+    count = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for product in replay(args.path, _timestamp(args.since), _timestamp(args.until),
+                              args.latest, args.workers):
+            f.write(json.dumps(product, ensure_ascii=False) + "\n")
+            count += 1
+    elapsed = time.perf_counter() - started
+    print(f"✅ Replayed {count} pages in {elapsed:.1f}s "
+          f"({count / elapsed if elapsed else 0:.0f} pages/sec) → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Plain-HTTP fetching: a pooled keep-alive client for pages whose offers
+table is already in the server-rendered HTML (no browser needed)
+"""
+import os
+import aiohttp
+
+# Fetch settings (configurable via env)
+HTTP_CONNECTIONS = int(os.getenv('SCRAPER_HTTP_CONNECTIONS', '16'))
+HTTP_TIMEOUT = float(os.getenv('SCRAPER_HTTP_TIMEOUT', '15'))  # seconds
+
+DEFAULT_HEADERS = {
+    'User-Agent': ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/124.0 Safari/537.36'),
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'et,en;q=0.8',
+}
+
+
+class HttpFetcher:
+    """
+    Shared aiohttp session with keep-alive connection pooling and compression
+    """
+
+    def __init__(self, connections=HTTP_CONNECTIONS, timeout=HTTP_TIMEOUT, headers=None):
+        self.connections = connections
+        self.timeout = timeout
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.connections,
+            keepalive_timeout=30,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            auto_decompress=True
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self, url, headers=None):
+        """
+        GET a page
+        Returns (status, html, response_headers)
+        """
+        async with self.session.get(url, headers=headers, allow_redirects=True) as response:
+            html = await response.text(errors='replace')
+            return response.status, html, response.headers.copy()
+
+
+class FetchStats:
+    """
+    Counts how many pages were served by each fetch path
+    """
+
+    def __init__(self):
+        self.http = 0          # offers found in plain HTML
+        self.not_found = 0     # HTTP 404, no browser needed
+        self.fallback = 0      # plain HTML had no offers, rendered in browser
+        self.http_errors = 0   # HTTP request failed, rendered in browser
+        self.browser = 0       # browser-only mode
+
+    def print_summary(self):
+        total = self.http + self.not_found + self.fallback + self.http_errors + self.browser
+        if not total:
+            return
+        print(f"🛣️ Fetch paths: {self.http} plain HTTP, {self.not_found} HTTP 404, "
+              f"{self.fallback} browser fallback, {self.http_errors} HTTP errors → browser, "
+              f"{self.browser} browser only")
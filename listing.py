@@ -0,0 +1,328 @@
+"""
+Listing-page bulk mode: lowest price and offer count for many products per fetch
+
+hind.ee category and search result pages list dozens of products with their
+lowest price and number of shops. The bulk mode walks those pages first,
+then renders a product page (the normal scrape_product_data path) only when
+the product's listing entry changed since its last detail scrape, when it
+is not on any listing, or when its detail is older than LISTING_DETAIL_MAX_HOURS.
+Everything else reuses the stored top-3 detail, flagged 'unchanged'.
+
+Listing markup is matched by class names (LISTING_*_CLASS env vars) so a
+layout change only needs new settings, not code.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+from browser_pool import BrowserPool
+from extraction import lxml_html, parse_price
+from http_fetch import HttpFetcher
+
+if lxml_html is not None:
+    from lxml import etree
+
+# Listing settings (configurable via env)
+LISTING_URLS = [u for u in os.getenv('LISTING_URLS', '').split(',') if u]  # category/search pages
+LISTING_STATE_PATH = os.getenv('LISTING_STATE_PATH', 'listing_state.sqlite')
+LISTING_MAX_PAGES = int(os.getenv('LISTING_MAX_PAGES', '50'))     # per listing URL
+LISTING_PAGE_PARAM = os.getenv('LISTING_PAGE_PARAM', 'page')
+LISTING_DETAIL_MAX_AGE = float(os.getenv('LISTING_DETAIL_MAX_HOURS', '24')) * 3600
+# Class names of a product entry, its price and its "N shops" text
+LISTING_ITEM_CLASS = os.getenv('LISTING_ITEM_CLASS', 'product-item')
+LISTING_PRICE_CLASS = os.getenv('LISTING_PRICE_CLASS', 'price')
+LISTING_OFFERS_CLASS = os.getenv('LISTING_OFFERS_CLASS', 'shops-count')
+LISTING_READY_TIMEOUT = 15.0   # seconds for a rendered listing to show its entries
+LISTING_RENDER_TIMEOUT = 30.0  # hard cap per rendered listing page
+LISTING_QUEUE_SIZE = 100
+
+# Evaluated by the browser until it returns true (see readiness.WAIT_FOR_JS):
+# JS listings are read once their product entries are in the DOM
+LISTING_WAIT_FOR_JS = """js:() => {
+    if (document.querySelector('.%s')) return true;
+    return /404/.test(document.title);
+}""" % LISTING_ITEM_CLASS
+
+PRODUCT_PATH_RE = re.compile(r'^/p/[^/?#]+')
+COUNT_RE = re.compile(r'\d+')
+
+
+def product_key(url):
+    """
+    Listing links and our URLs differ in host/scheme; match on the /p/<slug> path
+    """
+    return urlparse(url).path.rstrip('/').lower()
+
+
+def page_url(listing_url, page_no, param=LISTING_PAGE_PARAM):
+    """
+    URL of page `page_no` (1-based) of a listing
+    """
+    if page_no == 1:
+        return listing_url
+    parts = urlparse(listing_url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != param] + [(param, str(page_no))]
+    return urlunparse(parts._replace(query=urlencode(query)))
+
+
+def _listing_price(text):
+    # Listing prices have thousands separators ("1 249,00 €")
+    return parse_price(text.replace('\xa0', '').replace(' ', ''))
+
+
+def _listing_count(text):
+    match = COUNT_RE.search(text or '')
+    return int(match.group()) if match else None
+
+
+def _parse_lxml(html, base_url, item_class, price_class, offers_class):
+    def has_class(name):
+        return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+    root = lxml_html.fromstring(html)
+    items = []
+    for item in root.xpath("descendant-or-self::*[%s]" % has_class(item_class)):
+        links = [a.get('href') for a in item.xpath(".//a[@href]")]
+        link = next((href for href in links if PRODUCT_PATH_RE.match(urlparse(href).path)), None)
+        if link is None:
+            continue
+        price = item.xpath(".//*[%s]" % has_class(price_class))
+        offers = item.xpath(".//*[%s]" % has_class(offers_class))
+        items.append({
+            'product_url': urljoin(base_url, link),
+            'product_name': (item.xpath("string(.//a[@href][normalize-space()][1])") or '').strip(),
+            'lowest_price': _listing_price(price[0].text_content()) if price else None,
+            'offer_count': _listing_count(offers[0].text_content()) if offers else None,
+        })
+    return items
+
+
+def _parse_soup(html, base_url, item_class, price_class, offers_class):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    items = []
+    for item in soup.find_all(class_=item_class):
+        links = [a for a in item.find_all('a', href=True)
+                 if PRODUCT_PATH_RE.match(urlparse(a['href']).path)]
+        if not links:
+            continue
+        price = item.find(class_=price_class)
+        offers = item.find(class_=offers_class)
+        items.append({
+            'product_url': urljoin(base_url, links[0]['href']),
+            'product_name': next((text for text in (a.get_text(' ', strip=True) for a in links)
+                                  if text), ''),
+            'lowest_price': _listing_price(price.get_text()) if price else None,
+            'offer_count': _listing_count(offers.get_text()) if offers else None,
+        })
+    soup.decompose()
+    return items
+
+
+def parse_listing(html, base_url, item_class=LISTING_ITEM_CLASS,
+                  price_class=LISTING_PRICE_CLASS, offers_class=LISTING_OFFERS_CLASS):
+    """
+    Product entries of a listing page
+    Returns a list of dicts: product_url, product_name, lowest_price, offer_count
+    (price/count are None when the entry does not show them)
+    """
+    if not html:
+        return []
+    if lxml_html is not None:
+        try:
+            return _parse_lxml(html, base_url, item_class, price_class, offers_class)
+        except (etree.ParserError, ValueError):
+            return []
+    return _parse_soup(html, base_url, item_class, price_class, offers_class)
+
+
+class ListingState:
+    """
+    SQLite table: product path -> listing entry seen at its last detail
+    scrape, plus that scrape's product
+    """
+
+    def __init__(self, path=LISTING_STATE_PATH, detail_max_age=LISTING_DETAIL_MAX_AGE):
+        self.detail_max_age = detail_max_age
+        self.reused = 0
+        self.rendered = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS listing (
+                key TEXT PRIMARY KEY,
+                lowest_price REAL,
+                offer_count INTEGER,
+                product TEXT NOT NULL,
+                scraped_at REAL NOT NULL
+            )
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def reusable(self, url, entry):
+        """
+        The stored product if `entry` (this run's listing entry, or None) shows
+        nothing changed since its detail scrape, otherwise None
+        """
+        if entry is None or entry['lowest_price'] is None:
+            return None
+        row = self.conn.execute(
+            "SELECT lowest_price, offer_count, product, scraped_at FROM listing WHERE key = ?",
+            (product_key(url),)
+        ).fetchone()
+        if row is None or time.time() - row[3] > self.detail_max_age:
+            return None
+        if (row[0], row[1]) != (entry['lowest_price'], entry['offer_count']):
+            return None
+        return {**json.loads(row[2]), 'product_url': url, 'unchanged': True}
+
+    def record(self, product, entry):
+        """
+        Store a freshly scraped product with the listing entry it was checked against
+        """
+        self.conn.execute(
+            "INSERT OR REPLACE INTO listing VALUES (?, ?, ?, ?, ?)",
+            (product_key(product['product_url']),
+             entry['lowest_price'] if entry else None,
+             entry['offer_count'] if entry else None,
+             json.dumps({k: v for k, v in product.items() if k != 'unchanged'}),
+             time.time())
+        )
+
+
+async def _iterate(urls):
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+def listing_render_kwargs(timeout=LISTING_READY_TIMEOUT):
+    """
+    Keyword arguments for crawler.arun() on a listing page
+    """
+    return {
+        'wait_for': LISTING_WAIT_FOR_JS,
+        'page_timeout': int(timeout * 1000),
+        'delay_before_return_html': 0.1,
+    }
+
+
+async def walk_listings(listing_urls, fetcher, pool=None, max_pages=LISTING_MAX_PAGES):
+    """
+    Fetch every page of every listing (until a page adds no new products)
+    Pages with no entries in the plain HTML are rendered with `pool` if given;
+    a page that fails or times out there counts as having no entries
+    Returns {product key: listing entry}
+    """
+    entries = {}
+    fetched = 0
+    for listing_url in listing_urls:
+        for page_no in range(1, max_pages + 1):
+            url = page_url(listing_url, page_no)
+            try:
+                status, html, _ = await fetcher.fetch(url)
+            except Exception as e:
+                print(f"⚠️ Listing fetch failed for {url}: {type(e).__name__}: {e}")
+                status, html = None, None
+            fetched += 1
+            items = parse_listing(html, url) if status == 200 else []
+            if not items and pool is not None and status != 404:
+                try:
+                    async with pool.page() as crawler:
+                        result = await asyncio.wait_for(
+                            crawler.arun(url=url, **listing_render_kwargs()), LISTING_RENDER_TIMEOUT
+                        )
+                    items = parse_listing(result.html, url)
+                except asyncio.TimeoutError:
+                    print(f"⚠️ Listing render timed out for {url}")
+                except Exception as e:
+                    print(f"⚠️ Listing render failed for {url}: {type(e).__name__}: {e}")
+            new = 0
+            for item in items:
+                key = product_key(item['product_url'])
+                if key not in entries:
+                    entries[key] = item
+                    new += 1
+            if not new:
+                break
+    print(f"📋 Listings: {len(entries)} products from {fetched} listing pages")
+    return entries
+
+
+async def scrape_with_listings(urls, scrape_stream, listing_urls=None, state_path=LISTING_STATE_PATH,
+                               max_pages=LISTING_MAX_PAGES, fetch_mode='auto', quiet=False):
+    """
+    Bulk mode around a scrape stream (urls -> async generator of products)
+    Listing pages are walked first; URLs whose listing entry is unchanged
+    since their last detail scrape are yielded from the listing state
+    ('unchanged': True), the rest go through `scrape_stream`
+    """
+    listing_urls = LISTING_URLS if listing_urls is None else listing_urls
+    if not listing_urls:
+        print("⚠️ Bulk mode needs LISTING_URLS, scraping every product page")
+        async for product in scrape_stream(urls):
+            yield product
+        return
+
+    with ListingState(state_path) as state:
+        # A browser is only launched if a listing page needs rendering
+        async with HttpFetcher() as fetcher, BrowserPool(size=1, lazy=True) as pool:
+            entries = await walk_listings(listing_urls, fetcher,
+                                          None if fetch_mode == 'http' else pool, max_pages)
+        results = asyncio.Queue(maxsize=LISTING_QUEUE_SIZE)
+
+        async def detail_urls():
+            async for url in _iterate(urls):
+                product = state.reusable(url, entries.get(product_key(url)))
+                if product is None:
+                    state.rendered += 1
+                    yield url
+                    continue
+                state.reused += 1
+                if not quiet:
+                    print(f"📋 Unchanged on listing: {url}")
+                await results.put(product)
+
+        async def run_details():
+            try:
+                async for product in scrape_stream(detail_urls()):
+                    state.record(product, entries.get(product_key(product['product_url'])))
+                    await results.put(product)
+            finally:
+                await results.put(None)
+
+        runner = asyncio.create_task(run_details())
+        try:
+            while True:
+                product = await results.get()
+                if product is None:
+                    break
+                yield product
+            await runner
+        finally:
+            if not runner.done():
+                runner.cancel()
+                while not results.empty():
+                    results.get_nowait()
+                await asyncio.gather(runner, return_exceptions=True)
+        total = state.reused + state.rendered
+        print(f"📋 Bulk mode: {state.reused}/{total} products answered by listings, "
+              f"{state.rendered} product pages rendered")
@@ -0,0 +1,273 @@
+"""
+Run metrics: per-URL stage timings, outcome counters and run reports
+
+Stages timed per URL:
+    acquire      waiting for a browser from the pool (includes launching one)
+    navigate     HTTP fetch, or browser navigation until the page loaded
+    render_wait  waiting in the browser for the offers table to appear
+    parse        finding the product name and sellers-group region (and hashing it)
+    extract      building the offer dicts from the sellers-group region
+    sink         writing the batch the product went out in (per batch)
+
+plus the HTML size and bytes transferred per page, and the peak RSS of the run.
+
+At the end of a run a JSON report and a Prometheus text-format file
+(for node_exporter's textfile collector) are written. With profiling on,
+the parse and extract stages run under cProfile and the stats are saved.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Metrics settings (configurable via env)
+REPORT_PATH = os.getenv('METRICS_REPORT_PATH', 'run_metrics.json')      # '' disables
+PROMETHEUS_PATH = os.getenv('METRICS_PROMETHEUS_PATH', 'run_metrics.prom')  # '' disables
+PROFILE_PATH = os.getenv('METRICS_PROFILE_PATH', 'parse.prof')
+
+STAGES = ('acquire', 'navigate', 'render_wait', 'parse', 'extract', 'sink')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Add the time spent in the block to timings[stage] (no-op without timings)
+    """
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def _quantile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _summary(values):
+    ordered = sorted(values)
+    total = sum(ordered)
+    summary = {'count': len(ordered), 'sum': total,
+               'mean': total / len(ordered) if ordered else 0.0,
+               'max': ordered[-1] if ordered else 0.0}
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = _quantile(ordered, q)
+    return summary
+
+
+class Metrics:
+    """
+    Collects observations from the scrapers and sinks for one run
+    """
+
+    def __init__(self, profile=False):
+        self.started = time.time()
+        self.finished = None
+        self.stages = {stage: [] for stage in STAGES}
+        self.html_sizes = []
+        self.page_bytes = []
+        self.peak_rss = 0
+        self.outcomes = Counter()   # ok / no_sellers / timeout / parse_error / fetch_error
+        self.sinks = {}             # name -> {'batches', 'products', 'failed', 'rows', 'retries', 'seconds'}
+        self.sink_seconds = {}      # name -> batch write times
+        self.urls = []
+        self.profiler = cProfile.Profile() if profile else None
+
+    def observe(self, url, timings, outcome):
+        """
+        Record one scraped URL: its stage timings (seconds, 'html_size' in
+        characters) and its outcome ('ok' or an error class)
+        """
+        self.outcomes[outcome] += 1
+        for stage, seconds in timings.items():
+            if stage in self.stages:
+                self.stages[stage].append(seconds)
+        if 'html_size' in timings:
+            self.html_sizes.append(timings['html_size'])
+        if 'page_bytes' in timings:
+            self.page_bytes.append(timings['page_bytes'])
+        self.urls.append({'url': url, 'outcome': outcome,
+                          **{key: round(value, 6) for key, value in timings.items()}})
+
+    def observe_sink(self, name, seconds, products, ok=True, rows=0, retries=0):
+        """
+        Record one sink batch write (`rows` offer rows, after `retries` retries)
+        """
+        sink = self.sinks.setdefault(
+            name, {'batches': 0, 'products': 0, 'failed': 0, 'rows': 0, 'retries': 0, 'seconds': 0.0}
+        )
+        sink['batches'] += 1
+        sink['seconds'] += seconds
+        sink['retries'] += retries
+        if ok:
+            sink['products'] += products
+            sink['rows'] += rows
+        else:
+            sink['failed'] += products
+        self.sink_seconds.setdefault(name, []).append(seconds)
+        self.stages['sink'].append(seconds)
+
+    def observe_memory(self, peak_rss):
+        """
+        Record a peak RSS (bytes); the run keeps the highest one seen
+        """
+        self.peak_rss = max(self.peak_rss, peak_rss or 0)
+
+    def report(self):
+        """
+        The run report as a JSON-serializable dict
+        """
+        finished = self.finished or time.time()
+        return {
+            'started': self.started,
+            'finished': finished,
+            'duration': finished - self.started,
+            'pages': sum(self.outcomes.values()),
+            'outcomes': dict(self.outcomes),
+            'stages': {stage: _summary(values) for stage, values in self.stages.items()},
+            'html_size': _summary(self.html_sizes),
+            'page_bytes': _summary(self.page_bytes),
+            'peak_rss': self.peak_rss,
+            'sinks': {name: {**sink, 'latency': _summary(self.sink_seconds.get(name, []))}
+                      for name, sink in self.sinks.items()},
+            'urls': self.urls,
+        }
+
+    def prometheus(self):
+        """
+        The run's metrics in Prometheus text exposition format
+        """
+        report = self.report()
+        lines = [
+            "# HELP scraper_pages_total Pages scraped in the last run, by outcome",
+            "# TYPE scraper_pages_total counter",
+        ]
+        for outcome, count in sorted(report['outcomes'].items()):
+            lines.append(f'scraper_pages_total{{outcome="{outcome}"}} {count}')
+        lines += [
+            "# HELP scraper_stage_seconds Time per page (per batch for sink) spent in each stage",
+            "# TYPE scraper_stage_seconds summary",
+        ]
+        for stage, summary in report['stages'].items():
+            for q in QUANTILES:
+                lines.append(f'scraper_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{summary[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'scraper_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]:.6f}')
+            lines.append(f'scraper_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        html = report['html_size']
+        lines += [
+            "# HELP scraper_html_size_chars Size of the fetched page HTML",
+            "# TYPE scraper_html_size_chars summary",
+        ]
+        for q in QUANTILES:
+            lines.append(f'scraper_html_size_chars{{quantile="{q}"}} {html[f"p{int(q * 100)}"]}')
+        lines.append(f"scraper_html_size_chars_sum {html['sum']}")
+        lines.append(f"scraper_html_size_chars_count {html['count']}")
+        transferred = report['page_bytes']
+        lines += [
+            "# HELP scraper_page_bytes Bytes transferred per page (HTTP body or all browser responses)",
+            "# TYPE scraper_page_bytes summary",
+        ]
+        for q in QUANTILES:
+            lines.append(f'scraper_page_bytes{{quantile="{q}"}} {transferred[f"p{int(q * 100)}"]}')
+        lines.append(f"scraper_page_bytes_sum {transferred['sum']}")
+        lines.append(f"scraper_page_bytes_count {transferred['count']}")
+        lines += [
+            "# HELP scraper_sink_products_total Products written per sink",
+            "# TYPE scraper_sink_products_total counter",
+        ]
+        for name, sink in sorted(report['sinks'].items()):
+            lines.append(f'scraper_sink_products_total{{sink="{name}",result="ok"}} {sink["products"]}')
+            lines.append(f'scraper_sink_products_total{{sink="{name}",result="failed"}} {sink["failed"]}')
+        lines += [
+            "# HELP scraper_sink_rows_total Offer rows written per sink",
+            "# TYPE scraper_sink_rows_total counter",
+        ]
+        for name, sink in sorted(report['sinks'].items()):
+            lines.append(f'scraper_sink_rows_total{{sink="{name}"}} {sink["rows"]}')
+        lines += [
+            "# HELP scraper_sink_write_seconds Time per batch write, by sink (including retries)",
+            "# TYPE scraper_sink_write_seconds summary",
+        ]
+        for name, sink in sorted(report['sinks'].items()):
+            latency = sink['latency']
+            for q in QUANTILES:
+                lines.append(f'scraper_sink_write_seconds{{sink="{name}",quantile="{q}"}} '
+                             f'{latency[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'scraper_sink_write_seconds_sum{{sink="{name}"}} {latency["sum"]:.6f}')
+            lines.append(f'scraper_sink_write_seconds_count{{sink="{name}"}} {latency["count"]}')
+        lines += [
+            "# HELP scraper_peak_rss_bytes Peak resident memory of the scraper and its browsers",
+            "# TYPE scraper_peak_rss_bytes gauge",
+            f"scraper_peak_rss_bytes {report['peak_rss']}",
+            "# HELP scraper_run_duration_seconds Wall time of the last run",
+            "# TYPE scraper_run_duration_seconds gauge",
+            f"scraper_run_duration_seconds {report['duration']:.3f}",
+            "# HELP scraper_run_finished_timestamp_seconds When the last run finished",
+            "# TYPE scraper_run_finished_timestamp_seconds gauge",
+            f"scraper_run_finished_timestamp_seconds {report['finished']:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, report_path=REPORT_PATH, prometheus_path=PROMETHEUS_PATH,
+              profile_path=PROFILE_PATH):
+        """
+        Finish the run and write the JSON report, the Prometheus file and the
+        parse profile; files are replaced atomically so collectors never read
+        a half-written one
+        """
+        self.finished = time.time()
+        outputs = []
+        if report_path:
+            outputs.append((report_path, json.dumps(self.report(), indent=2)))
+        if prometheus_path:
+            outputs.append((prometheus_path, self.prometheus()))
+        for path, text in outputs:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        if self.profiler is not None and profile_path:
+            self.profiler.dump_stats(profile_path)
+        written = [path for path in (report_path, prometheus_path) if path]
+        if written:
+            print(f"📈 Metrics written to {', '.join(written)}")
+
+    def print_summary(self):
+        report = self.report()
+        outcomes = ", ".join(f"{count} {outcome}" for outcome, count in
+                             sorted(report['outcomes'].items())) or "no pages"
+        print(f"📈 Outcomes: {outcomes}")
+        for stage, summary in report['stages'].items():
+            if summary['count']:
+                print(f"   {stage:>11}: p50 {summary['p50'] * 1000:8.1f} ms, "
+                      f"p95 {summary['p95'] * 1000:8.1f} ms, total {summary['sum']:.1f}s")
+        if self.html_sizes:
+            print(f"   {'html size':>11}: p50 {report['html_size']['p50'] / 1024:.0f} KiB, "
+                  f"max {report['html_size']['max'] / 1024:.0f} KiB")
+        if self.page_bytes:
+            print(f"   {'transferred':>11}: p50 {report['page_bytes']['p50'] / 1024:.0f} KiB/page, "
+                  f"total {report['page_bytes']['sum'] / 2**20:.1f} MiB")
+        if self.peak_rss:
+            print(f"   {'peak RSS':>11}: {self.peak_rss / 2**20:.0f} MiB")
+        for name, sink in sorted(report['sinks'].items()):
+            latency = sink['latency']
+            print(f"💾 Sink {name}: {sink['rows']} rows / {sink['products']} products in "
+                  f"{sink['batches']} batches, {sink['failed']} products failed, "
+                  f"{sink['retries']} retries; write p50 {latency['p50'] * 1000:.0f} ms, "
+                  f"p95 {latency['p95'] * 1000:.0f} ms")
+        if self.profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(15)
+            print("🔬 Parse profile (top 15 by cumulative time):")
+            print(out.getvalue())
@@ -0,0 +1,283 @@
+"""
+Per-run price analytics over every offer of every product
+
+With --analytics the scraper keeps all offers of a page, not just the top 3
+(the product's 'all_offers' columns, see extraction.py). OfferTable packs
+them into typed arrays as products stream past: per-product offsets into a
+float64 price column and an int32 store column (store names interned).
+
+At the end of the run analyze() computes, per product and in one pass of
+numpy array operations (no Python loop over offers): lowest and median
+price, spread, offer count, cheapest store, change of the lowest price
+against the previous run, and flags for anomalous drops. The summary is
+printed and written to ANALYTICS_REPORT_PATH next to the sink writes; the
+per-product stats are kept in ANALYTICS_STATE_PATH for the next run.
+
+Requires numpy (optional: pip install numpy)
+"""
+import json
+import os
+import sqlite3
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the analytics stage needs it
+    np = None
+
+# Analytics settings (configurable via env)
+ANALYTICS_STATE_PATH = os.getenv('ANALYTICS_STATE_PATH', 'offer_stats.sqlite')
+ANALYTICS_REPORT_PATH = os.getenv('ANALYTICS_REPORT_PATH', 'offer_analytics.json')  # '' = no file
+# Flag a product whose lowest price fell more than this since the previous run
+ANALYTICS_DROP_PCT = float(os.getenv('ANALYTICS_DROP_PCT', '20'))
+# ... or whose lowest price is this far below the median of its own offers
+# (a mispriced or wrong-model listing), given at least OUTLIER_MIN_OFFERS offers
+ANALYTICS_OUTLIER_PCT = float(os.getenv('ANALYTICS_OUTLIER_PCT', '40'))
+OUTLIER_MIN_OFFERS = 3
+SUMMARY_TOP = 10  # biggest drops / outliers listed in the summary
+
+
+class OfferTable:
+    """
+    Every captured offer of a run in typed columns: the offers of product p
+    are prices[offsets[p]:offsets[p + 1]] and store_ids[...] (indexes into
+    `stores`)
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.names = []
+        self.offsets = array('q', [0])
+        self.prices = array('d')
+        self.store_ids = array('i')
+        self._store_index = {}  # store name -> id, in id order
+
+    def __len__(self):
+        return len(self.urls)
+
+    @property
+    def stores(self):
+        return list(self._store_index)
+
+    def add(self, product):
+        """
+        Append one product's offers (its 'all_offers' columns, or the top
+        offers for products stored before offers were captured)
+        """
+        columns = product.get('all_offers')
+        if columns is None:
+            columns = {'stores': [offer['store_name'] for offer in product['offers']],
+                       'prices': [offer['price_value'] for offer in product['offers']]}
+        index = self._store_index
+        self.urls.append(product['product_url'])
+        self.names.append(product.get('product_name', ''))
+        self.prices.extend(columns['prices'])
+        self.store_ids.extend(index.setdefault(store, len(index)) for store in columns['stores'])
+        self.offsets.append(len(self.prices))
+
+
+def analyze(table, previous_lows=None, drop_pct=ANALYTICS_DROP_PCT,
+            outlier_pct=ANALYTICS_OUTLIER_PCT):
+    """
+    Per-product stats of an OfferTable, as numpy columns in table order
+    `previous_lows` holds last run's lowest price per product (NaN if unknown)
+    Returns a dict: count, low, median, high, spread, spread_pct, cheapest
+    (store id, -1 if no offers), previous, change, change_pct, drop, outlier
+    """
+    if np is None:
+        raise ImportError("offer analytics needs numpy: pip install numpy")
+    offsets = np.frombuffer(table.offsets, dtype=np.int64)
+    prices = np.frombuffer(table.prices, dtype=np.float64)
+    store_ids = np.frombuffer(table.store_ids, dtype=np.int32)
+    counts = np.diff(offsets)
+    products = len(counts)
+    starts = offsets[:-1]
+
+    # Sort every product's offers by price in one argsort: each product's
+    # prices are shifted into a range of their own (much faster than lexsort)
+    span = float(prices.max() - prices.min()) + 1.0 if len(prices) else 1.0
+    order = np.argsort(np.repeat(np.arange(products) * span, counts) + prices)
+    ordered = prices[order]
+    has = counts > 0
+    first = starts[has]
+    low, median, high = (np.full(products, np.nan) for _ in range(3))
+    low[has] = ordered[first]
+    high[has] = ordered[first + counts[has] - 1]
+    median[has] = (ordered[first + (counts[has] - 1) // 2] + ordered[first + counts[has] // 2]) / 2
+    cheapest = np.full(products, -1, dtype=np.int32)
+    cheapest[has] = store_ids[order[first]]
+
+    if previous_lows is None:
+        previous_lows = np.full(products, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = high - low
+        spread_pct = spread / low * 100
+        change = low - previous_lows
+        change_pct = change / previous_lows * 100
+    # NaN compares False: products without offers or history are never flagged
+    drop = change_pct < -drop_pct
+    outlier = (counts >= OUTLIER_MIN_OFFERS) & (low < median * (1 - outlier_pct / 100))
+    return {
+        'count': counts, 'low': low, 'median': median, 'high': high,
+        'spread': spread, 'spread_pct': spread_pct, 'cheapest': cheapest,
+        'previous': previous_lows, 'change': change, 'change_pct': change_pct,
+        'drop': drop, 'outlier': outlier,
+    }
+
+
+def _number(value, digits=2):
+    return None if value != value else round(float(value), digits)  # NaN -> None
+
+
+class OfferAnalytics:
+    """
+    Analytics stage of a pipeline run: every scraped product is add()ed
+    (or the scrape stream is wrapped with observing()), finish() analyzes
+    the run, stores this run's lowest prices and reports
+    """
+
+    def __init__(self, state_path=ANALYTICS_STATE_PATH, report_path=ANALYTICS_REPORT_PATH,
+                 drop_pct=ANALYTICS_DROP_PCT, outlier_pct=ANALYTICS_OUTLIER_PCT):
+        if np is None:
+            raise ImportError("offer analytics needs numpy: pip install numpy")
+        self.state_path = state_path
+        self.report_path = report_path
+        self.drop_pct = drop_pct
+        self.outlier_pct = outlier_pct
+        self.table = OfferTable()
+
+    def add(self, product):
+        self.table.add(product)
+
+    def observing(self, scrape_stream):
+        """
+        Wrap a scrape stream (urls -> async generator of products) so every
+        product it yields is added to this run's table
+        """
+        async def stream(urls):
+            async for product in scrape_stream(urls):
+                self.add(product)
+                yield product
+        return stream
+
+    def _connect(self):
+        conn = sqlite3.connect(self.state_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS lows (
+                url TEXT PRIMARY KEY,
+                lowest REAL NOT NULL,
+                median REAL NOT NULL,
+                offers INTEGER NOT NULL,
+                scraped_at REAL NOT NULL
+            )
+        """)
+        return conn
+
+    def finish(self):
+        """
+        Analyze the run, remember its lowest prices, print and write the summary
+        Returns the summary dict (None if nothing was scraped)
+        """
+        table = self.table
+        if not len(table):
+            return None
+        started = time.perf_counter()
+        conn = self._connect() if self.state_path else None
+        previous = {}
+        if conn is not None:
+            previous = dict(conn.execute("SELECT url, lowest FROM lows"))
+        previous_lows = np.fromiter((previous.get(url, np.nan) for url in table.urls),
+                                    dtype=np.float64, count=len(table))
+        stats = analyze(table, previous_lows, self.drop_pct, self.outlier_pct)
+        elapsed = time.perf_counter() - started
+
+        if conn is not None:
+            # Products without offers this run keep their last known price
+            has = np.flatnonzero(stats['count'] > 0)
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO lows VALUES (?, ?, ?, ?, ?)",
+                ((table.urls[i], float(stats['low'][i]), float(stats['median'][i]),
+                  int(stats['count'][i]), now) for i in has.tolist())
+            )
+            conn.commit()
+            conn.close()
+
+        summary = self.summarize(stats, elapsed)
+        self.print_summary(summary)
+        if self.report_path:
+            self.write(summary, stats)
+        return summary
+
+    def _row(self, stats, i, stores):
+        cheapest = int(stats['cheapest'][i])
+        return {
+            'product_url': self.table.urls[i],
+            'product_name': self.table.names[i],
+            'offers': int(stats['count'][i]),
+            'lowest': _number(stats['low'][i]),
+            'median': _number(stats['median'][i]),
+            'spread_pct': _number(stats['spread_pct'][i], 1),
+            'cheapest_store': stores[cheapest] if cheapest >= 0 else None,
+            'previous_lowest': _number(stats['previous'][i]),
+            'change_pct': _number(stats['change_pct'][i], 1),
+            'drop': bool(stats['drop'][i]),
+            'outlier': bool(stats['outlier'][i]),
+        }
+
+    def summarize(self, stats, elapsed=0.0):
+        counts = stats['count']
+        change = stats['change']
+        compared = ~np.isnan(change)
+        stores = self.table.stores
+        drops = np.flatnonzero(stats['drop'])
+        drops = drops[np.argsort(stats['change_pct'][drops])][:SUMMARY_TOP]
+        outliers = np.flatnonzero(stats['outlier'])
+        outliers = outliers[np.argsort(stats['low'][outliers] / stats['median'][outliers])][:SUMMARY_TOP]
+        return {
+            'products': len(counts),
+            'offers': int(counts.sum()),
+            'stores': len(stores),
+            'priced': int((counts > 0).sum()),
+            'offers_per_product': {'mean': _number(counts.mean(), 1),
+                                   'median': _number(np.median(counts), 1),
+                                   'max': int(counts.max())},
+            'median_spread_pct': _number(np.nanmedian(stats['spread_pct']), 1)
+                                 if (counts > 0).any() else None,
+            'compared': int(compared.sum()),
+            'cheaper': int((change[compared] < 0).sum()),
+            'dearer': int((change[compared] > 0).sum()),
+            'unchanged': int((change[compared] == 0).sum()),
+            'drops': [self._row(stats, i, stores) for i in drops.tolist()],
+            'drop_count': int(stats['drop'].sum()),
+            'outliers': [self._row(stats, i, stores) for i in outliers.tolist()],
+            'outlier_count': int(stats['outlier'].sum()),
+            'analysis_ms': round(elapsed * 1000, 1),
+        }
+
+    def write(self, summary, stats):
+        """
+        JSON report: the summary plus one row per product
+        """
+        stores = self.table.stores
+        report = {**summary, 'generated_at': time.time(),
+                  'rows': [self._row(stats, i, stores) for i in range(len(self.table))]}
+        tmp_path = self.report_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False)
+        os.replace(tmp_path, self.report_path)
+
+    @staticmethod
+    def print_summary(summary):
+        print(f"📈 Offers: {summary['offers']} from {summary['stores']} stores over "
+              f"{summary['products']} products ({summary['offers_per_product']['mean']} per product, "
+              f"median spread {summary['median_spread_pct']}%), analyzed in {summary['analysis_ms']} ms")
+        if summary['compared']:
+            print(f"📈 Lowest price vs last run: {summary['cheaper']} cheaper, {summary['dearer']} dearer, "
+                  f"{summary['unchanged']} unchanged")
+        for row in summary['drops']:
+            print(f"🚨 {row['product_name'] or row['product_url']}: {row['previous_lowest']} → "
+                  f"{row['lowest']} € ({row['change_pct']}%, {row['cheapest_store']})")
+        if summary['outlier_count']:
+            print(f"🔎 {summary['outlier_count']} products with a lowest offer far below their median")
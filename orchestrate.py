@@ -1,52 +1,286 @@
 """
 Main orchestrator: Combines all three steps into one workflow
 """
+import argparse
 import asyncio
+import os
+import time
+from contextlib import ExitStack
 from datetime import datetime
+from functools import partial
 
-# Import our three steps
+# Only light modules are imported here; the three steps (and through them
+# crawl4ai, supabase, gspread) are loaded on first use, see load_step()
 import importlib.util
+import pipeline
+from price_state import PriceState, STATE_PATH
+from refresh_scheduler import BUDGET, CATALOGUE_REFRESH, SCHEDULE_PATH, TICK, RefreshScheduler
+from metrics import Metrics
+from run_journal import RunJournal, JOURNAL_PATH
+from sharding import PROCESSES, scrape_sharded, shard_filter
+from slug_cache import SlugCache, SLUG_CACHE_PATH
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STEP_FILES = {
+    'step1': '1_fetch_product_urls.py',
+    'step2': '2_scrape_product.py',
+    'step3': '3_save_to_sheets.py',
+}
+_steps = {}
 
 # Load module from filename with numbers
-def load_module(filepath):
-    spec = importlib.util.spec_from_file_location("module", filepath)
+def load_module(filepath, name="module"):
+    spec = importlib.util.spec_from_file_location(name, filepath)
     module = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(module)
     return module
 
-step1 = load_module('1_fetch_product_urls.py')
-step2 = load_module('2_scrape_product.py')
-step3 = load_module('3_save_to_sheets.py')
+def load_step(name):
+    """
+    One of the three step modules, loaded on first use and then reused
+    """
+    module = _steps.get(name)
+    if module is None:
+        module = _steps[name] = load_module(os.path.join(ROOT, STEP_FILES[name]), name)
+    return module
+
+def __getattr__(name):
+    # orchestrate.step1/step2/step3 keep working for callers, loaded on access
+    if name in STEP_FILES:
+        return load_step(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def csv_sink(filename='laptop_prices.csv'):
+    """
+    CSV sink for batched writes: the first batch of the run replaces
+    the file, later batches are appended (a snapshot sink, so the file
+    holds every offer of the run, not only the price-state changes)
+    """
+    first_batch = [True]
+    
+    def save_batch(products_data):
+        load_step('step3').save_to_csv(products_data, filename, append=not first_batch[0])
+        first_batch[0] = False
+    
+    save_batch.__name__ = 'save_to_csv'
+    return save_batch
+
+# Sink backends by config name. Retries are off where a retried batch would
+# be written twice (appends); Sheets retries quota errors itself and gets a
+# deep queue so its API pauses are absorbed without a backlog. CSV and the
+# history get full snapshots: the CSV is rewritten every run, and the
+# history's queries also see prices that did not change.
+# Each backend's client library is imported by its save function, i.e. only
+# if the sink is selected
+SINK_BACKENDS = {
+    'csv': lambda: pipeline.Sink('csv', csv_sink(), retries=0, snapshots=True),
+    'supabase': lambda: pipeline.Sink(
+        'supabase', partial(load_step('step3').save_to_supabase, raise_errors=True)),
+    'sheets': lambda: pipeline.Sink(
+        'sheets', partial(load_step('step3').save_to_google_sheets, raise_errors=True),
+        retries=0, queue_size=5000),
+    'history': lambda: pipeline.Sink(
+        'history', partial(load_step('step3').save_to_price_history, raise_errors=True),
+        snapshots=True),
+}
+SINKS = os.getenv('PIPELINE_SINKS', 'sheets')  # comma-separated names from SINK_BACKENDS
+ANALYTICS = os.getenv('OFFER_ANALYTICS', '0') == '1'
+
+def build_sinks(names):
+    """
+    Sink objects for a comma-separated list of backend names
+    """
+    sinks = []
+    for name in (n.strip() for n in names.split(',')):
+        if not name:
+            continue
+        if name not in SINK_BACKENDS:
+            raise ValueError(f"unknown sink '{name}' (choose from {', '.join(SINK_BACKENDS)})")
+        sinks.append(SINK_BACKENDS[name]())
+    return sinks
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Laptop price monitoring pipeline")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the last run: skip URLs the run journal has as done")
+    parser.add_argument('--processes', type=int, default=PROCESSES,
+                        help="scraper worker processes, each with its own browser pool")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="split the catalogue over this many machines")
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help="which slice this machine scrapes (0 .. shards-1)")
+    parser.add_argument('--quiet', action='store_true', default=None,
+                        help="no per-page/per-offer console output (default SCRAPER_QUIET)")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the parse stage with cProfile (saved to METRICS_PROFILE_PATH)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running, scraping products as they come due (volatile ones more often)")
+    parser.add_argument('--budget', type=int, default=BUDGET,
+                        help="daemon mode: max products scraped per tick")
+    parser.add_argument('--bulk', action='store_true',
+                        help="walk listing pages first, render product pages only where the listing changed")
+    parser.add_argument('--listing', action='append', dest='listings',
+                        help="category/search page for --bulk (repeatable, default LISTING_URLS)")
+    parser.add_argument('--analytics', action='store_true', default=ANALYTICS,
+                        help="capture every offer (not just the top 3) and report per-product "
+                             "price stats and anomalous drops (needs numpy)")
+    parser.add_argument('--sinks', default=SINKS,
+                        help=f"where to save, comma-separated: {', '.join(SINK_BACKENDS)} "
+                             "(each batches and retries on its own)")
+    args = parser.parse_args(argv)
+    if not 0 <= args.shard_index < args.shards:
+        parser.error("--shard-index must be between 0 and --shards - 1")
+    unknown = [name for name in args.sinks.split(',') if name and name.strip() not in SINK_BACKENDS]
+    if unknown:
+        parser.error(f"unknown sink(s): {', '.join(unknown)}")
+    return args
 
-async def main():
+def catalogue_urls(args, slug_cache=None):
+    """
+    Product URLs from step 1, limited to this machine's shard
+    """
+    urls = load_step('step1').stream_product_urls(slug_cache=slug_cache)
+    if args.shards > 1:
+        # URLs are split by stable hash, so each machine keeps the same products
+        urls = shard_filter(urls, args.shards, args.shard_index)
+    return urls
+
+def open_slug_cache(stack):
+    # Known-dead slugs are skipped; set SLUG_CACHE_PATH='' to try every guess
+    if not SLUG_CACHE_PATH:
+        return None
+    return stack.enter_context(SlugCache(load_step('step1').product_name_to_hindee_url,
+                                         SLUG_CACHE_PATH))
+
+async def run_once(args, sinks, urls=None, scheduler=None):
+    """
+    One pipeline run over `urls` (default: the whole catalogue)
+    With a `scheduler` (refresh_scheduler.RefreshScheduler) every scraped
+    product is reported to it
+    Returns the number of products scraped
+    """
+    step2 = load_step('step2')
+    quiet = step2.QUIET if args.quiet is None else args.quiet
+    with ExitStack() as stack:
+        slug_cache = open_slug_cache(stack)
+        
+        # Only new/changed/removed offers are written (full snapshot every
+        # PRICE_STATE_SNAPSHOT_HOURS); set PRICE_STATE_PATH='' to write everything
+        price_state = stack.enter_context(PriceState(STATE_PATH)) if STATE_PATH else None
+        
+        # Every URL's progress goes to the run journal so --resume can pick up
+        # after a crash; set RUN_JOURNAL_PATH='' to run without it
+        journal = None
+        if JOURNAL_PATH:
+            journal = stack.enter_context(RunJournal(JOURNAL_PATH, resume=args.resume))
+        elif args.resume:
+            print("⚠️ --resume needs RUN_JOURNAL_PATH, scraping everything")
+        
+        # Per-URL stage timings and outcomes, written as a JSON report and a
+        # Prometheus text file at the end (see metrics.py)
+        metrics = Metrics(profile=args.profile)
+        
+        # Every offer of every page, analyzed at the end of the run
+        # (see offer_analytics.py)
+        analytics = None
+        if args.analytics:
+            from offer_analytics import OfferAnalytics
+            
+            analytics = OfferAnalytics()
+        
+        if urls is None:
+            urls = catalogue_urls(args, slug_cache)
+        if args.processes > 1:
+            scrape_stream = partial(scrape_sharded, processes=args.processes,
+                                    host_rate=step2.HOST_RATE,
+                                    slug_cache=slug_cache, journal=journal,
+                                    metrics=metrics, quiet=quiet,
+                                    all_offers=analytics is not None)
+        else:
+            scrape_stream = partial(step2.scrape_products_stream, slug_cache=slug_cache,
+                                    journal=journal, metrics=metrics, quiet=quiet,
+                                    all_offers=analytics is not None)
+        if args.bulk:
+            from listing import LISTING_URLS, scrape_with_listings
+            
+            scrape_stream = partial(scrape_with_listings, scrape_stream=scrape_stream,
+                                    listing_urls=args.listings or LISTING_URLS,
+                                    fetch_mode=step2.FETCH_MODE, quiet=quiet)
+        if analytics is not None:
+            scrape_stream = analytics.observing(scrape_stream)
+        if scheduler is not None:
+            scrape_stream = scheduler.observing(scrape_stream)
+        try:
+            scraped = await pipeline.run_pipeline(urls, scrape_stream, sinks,
+                                                  price_state=price_state, metrics=metrics,
+                                                  journal=journal)
+        finally:
+            metrics.print_summary()
+            metrics.write()
+        if analytics is not None:
+            analytics.finish()
+        return scraped
+
+async def run_daemon(args, sinks):
+    """
+    Keep running: every tick scrape only the products that are due, at most
+    `args.budget` of them; volatile products come due more often than stable
+    ones (see refresh_scheduler.py). The catalogue is re-read every
+    REFRESH_CATALOGUE_HOURS to pick up new products. --resume only applies to
+    the first tick: later ticks scrape everything that is due
+    """
+    with RefreshScheduler(SCHEDULE_PATH) as scheduler:
+        synced = None
+        while True:
+            if synced is None or time.monotonic() - synced >= CATALOGUE_REFRESH:
+                with ExitStack() as stack:
+                    await scheduler.sync(catalogue_urls(args, open_slug_cache(stack)))
+                synced = time.monotonic()
+            
+            due = scheduler.pop_due(args.budget)
+            if due:
+                print(f"\n🗓️ {datetime.now():%Y-%m-%d %H:%M} tick: {len(due)} products due")
+                await run_once(args, sinks, urls=due, scheduler=scheduler)
+                scheduler.print_summary()
+                # Products done in this tick are due again later, not skipped
+                args = argparse.Namespace(**{**vars(args), 'resume': False})
+            
+            # A full budget means more is waiting: come back next tick
+            wait = scheduler.seconds_until_due()
+            if wait is None or len(due) >= args.budget:
+                wait = TICK
+            await asyncio.sleep(max(1.0, min(TICK, wait)))
+
+async def main(args):
     print("🚀 Starting laptop price monitoring pipeline\n")
     print("="*80 + "\n")
     
-    # Step 1: Fetch product URLs from Supabase
-    print("📊 STEP 1: Fetching product URLs from Supabase")
-    print("-" * 80)
-    urls = step1.fetch_all_product_urls()
-    print(f"✅ Got {len(urls)} URLs\n")
-    
-    # Step 2: Scrape all products
+    # Step 1: Stream product URLs from Supabase (pages load while scraping starts)
+    # Step 2 + 3: Scrape products and stream them into storage in batches
+    print("📊 STEP 1: Streaming product URLs from Supabase")
     print("🔍 STEP 2: Scraping product data")
+    print("💾 STEP 3: Saving data (in batches while scraping)")
     print("-" * 80)
-    products_data = await step2.scrape_multiple_products(urls)
-    print(f"✅ Scraped {len(products_data)} products\n")
     
-    # Step 3: Save to storage
-    print("💾 STEP 3: Saving data")
-    print("-" * 80)
+    # Storage backends come from --sinks / PIPELINE_SINKS (see SINK_BACKENDS);
+    # they write concurrently, each with its own batching and retries
+    sinks = build_sinks(args.sinks)
+    print(f"💾 Sinks: {', '.join(sink.name for sink in sinks)}")
     
-    # Choose your storage method:
-    # step3.save_to_csv(products_data)
-    # save_to_supabase(products_data)
-    step3.save_to_google_sheets(products_data)  # Requires credentials setup
+    if args.daemon:
+        await run_daemon(args, sinks)
+        return
+    
+    scraped = await run_once(args, sinks)
+    print(f"✅ Scraped and saved {scraped} products\n")
     
     print("\n" + "="*80)
     print("✅ Pipeline complete!")
     print("="*80)
 
+def cli(argv=None):
+    asyncio.run(main(parse_args(argv)))
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli()
 
@@ -0,0 +1,149 @@
+"""
+Persistent page cache keyed by product URL
+
+Stores, per product page: a hash of the sellers-group fragment, the HTTP
+validators (ETag / Last-Modified) for conditional requests, and the last
+extracted product. When a page comes back unchanged the cached product is
+reused and flagged 'unchanged', so extraction and sink writes are skipped.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from extraction import extract_product_name, find_sellers_fragment
+
+# Cache settings (configurable via env)
+CACHE_PATH = os.getenv('SCRAPER_CACHE_PATH', 'page_cache.sqlite')  # '' disables the cache
+CACHE_TTL = float(os.getenv('SCRAPER_CACHE_TTL', str(24 * 3600)))   # seconds
+CACHE_MAX_ENTRIES = int(os.getenv('SCRAPER_CACHE_MAX_ENTRIES', '50000'))
+
+
+def content_hash(html):
+    """
+    Hash of the parts of a page we extract from (product name + sellers-group)
+    Ads, timestamps and the rest of the page do not affect it
+    """
+    fragment = find_sellers_fragment(html) or ''
+    digest = hashlib.sha256()
+    digest.update(extract_product_name(html).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(fragment.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    SQLite-backed cache with TTL and size-based eviction
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0          # page unchanged, cached product reused
+        self.revalidated = 0   # server answered 304 Not Modified
+        self.misses = 0        # not cached, expired, or changed
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                product TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+        self.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.evict()
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def get(self, url):
+        """
+        Cached entry for a URL as a dict, or None if missing/expired
+        """
+        row = self.conn.execute(
+            "SELECT content_hash, etag, last_modified, product, stored_at FROM pages WHERE url = ?",
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl and time.time() - row[4] > self.ttl:
+            self.conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            return None
+        return {
+            'content_hash': row[0],
+            'etag': row[1],
+            'last_modified': row[2],
+            'product': json.loads(row[3]),
+        }
+
+    def conditional_headers(self, entry):
+        """
+        If-None-Match / If-Modified-Since headers for a cached entry
+        """
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def reuse(self, url, entry, revalidated=False):
+        """
+        Count a hit and return the cached product flagged as unchanged
+        """
+        if revalidated:
+            self.revalidated += 1
+        else:
+            self.hits += 1
+        self.conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return {**entry['product'], 'unchanged': True}
+
+    def put(self, url, page_hash, product, etag=None, last_modified=None):
+        """
+        Store the latest extraction for a URL (counts a miss)
+        """
+        self.misses += 1
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, page_hash, etag, last_modified, json.dumps(product), now, now)
+        )
+
+    def evict(self):
+        """
+        Drop expired entries, then the least recently used ones above max_entries
+        """
+        if self.ttl:
+            self.conn.execute("DELETE FROM pages WHERE stored_at < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            self.conn.execute("""
+                DELETE FROM pages WHERE url IN (
+                    SELECT url FROM pages ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+        self.conn.commit()
+
+    def print_summary(self):
+        lookups = self.hits + self.revalidated + self.misses
+        if not lookups:
+            return
+        rate = 100.0 * (self.hits + self.revalidated) / lookups
+        print(f"🗃️ Page cache: {self.hits} unchanged, {self.revalidated} not modified (304), "
+              f"{self.misses} misses ({rate:.0f}% hit rate)")
@@ -0,0 +1,364 @@
+"""
+Streaming pipeline: URLs -> scrapers -> sinks, connected by bounded queues
+
+Products are handed to the sinks while the scrape is still running, in
+batches flushed by size or by time, so a late crash only loses the batch
+in flight and memory stays flat however big the catalogue gets. Sinks are
+fanned out: each one batches, retries and fails on its own.
+"""
+import asyncio
+import collections
+import os
+import random
+import time
+
+# Pipeline settings (configurable via env)
+BATCH_SIZE = int(os.getenv('PIPELINE_BATCH_SIZE', '50'))          # products per sink write
+FLUSH_INTERVAL = float(os.getenv('PIPELINE_FLUSH_INTERVAL', '30'))  # seconds
+QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '200'))         # products buffered per sink
+# Products a sink may fall behind the fastest sink before its surplus is dropped
+# (sinks price state does not resend to pause the scrape there instead)
+MAX_BACKLOG = int(os.getenv('PIPELINE_MAX_BACKLOG', '5000'))
+SINK_RETRIES = int(os.getenv('PIPELINE_SINK_RETRIES', '2'))       # per failed batch
+SINK_RETRY_DELAY = 2.0     # seconds, doubled per retry
+SINK_MAX_FAILURES = 3      # failed batches in a row before a sink is switched off
+
+
+class PartialWriteError(Exception):
+    """
+    Raised by a sink that wrote only part of a batch before failing;
+    `written` holds the products that made it, so the pipeline still
+    records them (price state, journal) and a later run does not write
+    them twice
+    """
+
+    def __init__(self, written, error):
+        super().__init__(f"failed after {len(written)} products: {type(error).__name__}: {error}")
+        self.written = written
+
+
+async def call_sink(sink, batch):
+    """
+    Call a sink with a batch; plain functions run in a worker thread
+    so blocking API clients do not stall the scrapers
+    """
+    if asyncio.iscoroutinefunction(sink):
+        await sink(batch)
+    else:
+        await asyncio.to_thread(sink, batch)
+
+
+class Sink:
+    """
+    A named batch writer plus its own batching, buffering and retry settings
+    `write` takes a list of products (plain functions run in a worker thread)
+    and raises on failure. Settings not given are read from
+    SINK_<NAME>_BATCH_SIZE / _FLUSH_INTERVAL / _QUEUE_SIZE / _MAX_BACKLOG /
+    _RETRIES env vars, then fall back to the pipeline defaults.
+    A `snapshots` sink (e.g. an append-only history) gets every scraped
+    product with all its offers: no price-state diff, unchanged pages included
+    """
+
+    def __init__(self, name, write, batch_size=None, flush_interval=None, queue_size=None,
+                 retries=None, retry_delay=SINK_RETRY_DELAY, max_failures=SINK_MAX_FAILURES,
+                 max_backlog=None, snapshots=False):
+        self.name = name
+        self.write = write
+        prefix = f"SINK_{name.upper()}_"
+        self.batch_size = batch_size or int(os.getenv(prefix + 'BATCH_SIZE', '0')) or None
+        self.flush_interval = flush_interval or float(os.getenv(prefix + 'FLUSH_INTERVAL', '0')) or None
+        self.queue_size = queue_size or int(os.getenv(prefix + 'QUEUE_SIZE', '0')) or None
+        self.max_backlog = max_backlog or int(os.getenv(prefix + 'MAX_BACKLOG', '0')) or None
+        retries_env = os.getenv(prefix + 'RETRIES')
+        self.retries = int(retries_env) if retries_env else retries
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+        self.snapshots = snapshots
+
+
+def as_sink(sink, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE):
+    """
+    Wrap a plain batch function in a Sink; fill in unset settings of a Sink
+    """
+    if not isinstance(sink, Sink):
+        sink = Sink(getattr(sink, '__name__', type(sink).__name__), sink)
+    sink.batch_size = sink.batch_size or batch_size
+    sink.flush_interval = sink.flush_interval or flush_interval
+    sink.queue_size = sink.queue_size or queue_size
+    sink.max_backlog = sink.max_backlog or MAX_BACKLOG
+    if sink.retries is None:
+        sink.retries = SINK_RETRIES
+    return sink
+
+
+async def write_with_retry(sink, batch):
+    """
+    Write a batch, retrying up to `sink.retries` times with jittered backoff
+    Returns the number of retries used; raises the last error
+    A PartialWriteError is not retried: the batch is no longer whole
+    """
+    for attempt in range(sink.retries + 1):
+        try:
+            await call_sink(sink.write, batch)
+            return attempt
+        except Exception as e:
+            if attempt == sink.retries or isinstance(e, PartialWriteError):
+                raise
+            delay = sink.retry_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            print(f"🔁 Sink {sink.name}: {type(e).__name__}: {e}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def batch_consumer(queue, sink, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                         metrics=None, price_state=None, on_written=None):
+    """
+    Read products from `queue` and write them to `sink` in batches
+    A batch is flushed when it reaches the sink's batch size, when its oldest
+    product is its flush interval old, or when None (end of stream) arrives.
+    Failed writes are retried (see write_with_retry); after `max_failures`
+    batches in a row fail for good the sink is switched off for the rest of
+    the run and only drains its queue, so it cannot hold up the other sinks.
+    Batch write times go to `metrics` (metrics.Metrics) if given. With a
+    `price_state` the changes of a batch are recorded once it is written,
+    and `on_written` (if given) is called with every written batch
+    Returns the number of products written
+    """
+    sink = as_sink(sink, batch_size, flush_interval)
+    batch = []
+    deadline = None
+    written = 0
+    failures = 0
+
+    writing = None  # the batch write in flight; the next batch fills meanwhile
+
+    async def write_batch(to_write):
+        nonlocal written, failures
+        rows = sum(len(product.get('offers', ())) for product in to_write)
+        if sink.max_failures and failures >= sink.max_failures:
+            if metrics is not None:
+                metrics.observe_sink(sink.name, 0.0, len(to_write), ok=False, rows=rows)
+            return
+        started = time.perf_counter()
+        ok = False
+        retries = 0
+        try:
+            retries = await write_with_retry(sink, to_write)
+            if price_state is not None and not sink.snapshots:
+                price_state.record(to_write, sink.name)
+            if on_written is not None:
+                on_written(to_write)
+            written += len(to_write)
+            failures = 0
+            ok = True
+        except Exception as e:
+            if isinstance(e, PartialWriteError) and e.written:
+                if price_state is not None and not sink.snapshots:
+                    price_state.record(e.written, sink.name)
+                if on_written is not None:
+                    on_written(e.written)
+            retries = sink.retries
+            failures += 1
+            print(f"❌ Sink {sink.name} failed on a batch of {len(to_write)}: {type(e).__name__}: {e}")
+            if sink.max_failures and failures >= sink.max_failures:
+                print(f"⛔ Sink {sink.name} switched off after {failures} failed batches in a row")
+        if metrics is not None:
+            metrics.observe_sink(sink.name, time.perf_counter() - started, len(to_write), ok,
+                                 rows=rows, retries=retries)
+
+    async def flush():
+        nonlocal batch, writing
+        if not batch:
+            return
+        to_write, batch = batch, []
+        if writing is not None:
+            await writing
+        writing = asyncio.create_task(write_batch(to_write))
+
+    try:
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                product = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush()
+                continue
+            if product is None:
+                await flush()
+                break
+            batch.append(product)
+            if len(batch) == 1:
+                deadline = time.monotonic() + sink.flush_interval
+            if len(batch) >= sink.batch_size:
+                await flush()
+    finally:
+        if writing is not None:
+            await writing
+    return written
+
+
+class SinkFeed:
+    """
+    One sink's end of the fan-out: products go straight into the sink's
+    bounded queue while it has room; otherwise they wait in the sink's own
+    backlog, which a feeder task moves into the queue as the sink drains it.
+    Past `max_backlog` waiting products the sink's surplus is dropped
+    (counted in `dropped`) rather than held in memory, unless the feed is
+    `lossless`: then nothing is dropped and the scrape waits for it (see full)
+    """
+
+    def __init__(self, sink, progress, lossless=False):
+        self.sink = sink
+        self.lossless = lossless
+        self.queue = asyncio.Queue(maxsize=sink.queue_size)
+        self.backlog = collections.deque()
+        self.dropped = 0
+        self._progress = progress  # set whenever a product leaves a backlog
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.task = asyncio.create_task(self._feed())
+
+    def put(self, product):
+        """
+        Returns False if the product was dropped
+        """
+        if not self.backlog and not self.queue.full():
+            self.queue.put_nowait(product)
+        elif len(self.backlog) >= self.sink.max_backlog and not self.lossless:
+            self.dropped += 1
+            return False
+        else:
+            self.backlog.append(product)
+            self._ready.set()
+        return True
+
+    @property
+    def full(self):
+        """
+        True if a lossless feed's backlog is at its limit
+        """
+        return self.lossless and len(self.backlog) >= self.sink.max_backlog
+
+    async def _feed(self):
+        while True:
+            while self.backlog:
+                await self.queue.put(self.backlog[0])
+                self.backlog.popleft()
+                self._progress.set()
+            if self._closed:
+                await self.queue.put(None)
+                return
+            self._ready.clear()
+            await self._ready.wait()
+
+    async def close(self):
+        """
+        End of stream: the backlog, then None, go into the queue
+        """
+        self._closed = True
+        self._ready.set()
+        await self.task
+
+
+async def run_pipeline(urls, scrape_stream, sinks, batch_size=BATCH_SIZE,
+                       flush_interval=FLUSH_INTERVAL, queue_size=QUEUE_SIZE,
+                       skip_unchanged=True, price_state=None, metrics=None, journal=None):
+    """
+    Stream `urls` through `scrape_stream` (an async generator of product dicts)
+    into every sink in `sinks` (Sink objects or plain batch functions)
+    Each sink runs as its own consumer with its own bounded queue, batching
+    and retries, fed by its own SinkFeed, so a slow sink does not delay the
+    others' writes. The scrapers pause (backpressure) when every sink's
+    queue is full. A sink more than its `max_backlog` behind the others has
+    the surplus dropped and reported if price state will resend it next run;
+    sinks it does not resend to (snapshot sinks, or all sinks without a
+    `price_state`) pause the scrapers at that point instead
+    Products flagged 'unchanged' by the page cache are not written again
+    unless `skip_unchanged` is False. With a `price_state`
+    (price_state.PriceState) each sink receives only the offers that are
+    new/changed/removed since it last wrote them. Snapshot sinks get every
+    product whole either way
+    Sink batch timings are recorded in `metrics` (metrics.Metrics) if given
+    With a `journal` (run_journal.RunJournal) a product's URL is marked done
+    once every sink it was sent to has written it
+    Returns the number of products scraped
+    """
+    sinks = [as_sink(sink, batch_size, flush_interval, queue_size) for sink in sinks]
+    progress = asyncio.Event()
+    feeds = [SinkFeed(sink, progress, lossless=price_state is None or sink.snapshots)
+             for sink in sinks]
+    unwritten = {}  # product URL -> sinks that still have to write it
+
+    def written(products):
+        for product in products:
+            url = product['product_url']
+            left = unwritten.get(url)
+            if left is None:
+                continue
+            if left > 1:
+                unwritten[url] = left - 1
+            else:
+                del unwritten[url]
+                journal.written(url)
+
+    consumers = [
+        asyncio.create_task(batch_consumer(feed.queue, feed.sink, metrics=metrics,
+                                           price_state=price_state,
+                                           on_written=written if journal is not None else None))
+        for feed in feeds
+    ]
+    scraped = 0
+    unchanged = 0
+    no_sellers = 0
+    try:
+        async for product in scrape_stream(urls):
+            scraped += 1
+            skipped = False
+            sent = 0
+            dropped = False
+            for feed in feeds:
+                if feed.sink.snapshots:
+                    to_write = product
+                elif price_state is not None:
+                    to_write = price_state.diff(product, feed.sink.name)
+                elif skip_unchanged and product.get('unchanged'):
+                    to_write = None
+                else:
+                    to_write = product
+                if to_write is None:
+                    skipped = True
+                elif feed.put(to_write):
+                    sent += 1
+                else:
+                    dropped = True
+            if skipped and product['offers']:
+                unchanged += 1
+            elif skipped:
+                no_sellers += 1  # nothing listed now, nor when last written
+            # Dropped products stay unwritten in the journal: --resume scrapes them again
+            if journal is not None and not dropped:
+                url = product['product_url']
+                if sent:
+                    unwritten[url] = unwritten.get(url, 0) + sent
+                elif url not in unwritten:
+                    journal.written(url)
+            # Backpressure once no sink can keep up, instead of buffering everything
+            while feeds and (all(feed.backlog for feed in feeds)
+                             or any(feed.full for feed in feeds)):
+                progress.clear()
+                await progress.wait()
+    finally:
+        # End of stream (or crash): let every sink flush what it already has
+        for feed in feeds:
+            await feed.close()
+        await asyncio.gather(*consumers)
+    if unchanged:
+        print(f"⏭️ Skipped writing {unchanged} unchanged products")
+    if no_sellers:
+        print(f"⏭️ Skipped writing {no_sellers} products without sellers")
+    for feed in feeds:
+        if feed.dropped:
+            print(f"⚠️ Sink {feed.sink.name} fell behind: dropped {feed.dropped} products "
+                  f"(written next run)")
+    if price_state is not None:
+        price_state.print_summary()
+    return scraped
@@ -0,0 +1,202 @@
+"""
+Append-only price history: every offer written by the pipeline, stored as
+Parquet files partitioned by scrape date
+
+    price_history/scrape_date=2024-06-10/part-1718000000000-1a2b3c4d.parquet
+
+The pipeline's history sink gets full snapshots: every offer of every
+scraped product, changed or not, so each scrape of a product is complete
+on its own. Each write adds a new file and nothing is ever rewritten.
+Columns are typed, dictionary-encoded and compressed. Queries only read the
+date partitions and columns they need, and run as Arrow compute kernels, so
+they stay sub-second over millions of rows.
+
+Requires pyarrow (optional: pip install pyarrow)
+"""
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only this store needs it
+    pa = None
+
+# History settings (configurable via env)
+HISTORY_PATH = os.getenv('PRICE_HISTORY_PATH', 'price_history')
+
+if pa is not None:
+    OFFER_SCHEMA = pa.schema([
+        ('scraped_at', pa.timestamp('s')),
+        ('product_name', pa.string()),
+        ('product_url', pa.string()),
+        ('position', pa.int16()),
+        ('store_name', pa.string()),
+        ('store_link', pa.string()),
+        ('price_text', pa.string()),
+        ('price_value', pa.float64()),
+        ('change', pa.string()),
+    ])
+    PARTITIONING = ds.partitioning(pa.schema([('scrape_date', pa.date32())]), flavor='hive')
+    DATASET_SCHEMA = OFFER_SCHEMA.append(pa.field('scrape_date', pa.date32()))
+
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+
+class PriceHistory:
+    """
+    Write offers with write(products_data); query with lowest_prices(),
+    price_series() and latest_snapshot(), which return pyarrow Tables
+    (use .to_pylist() for plain dicts)
+    """
+
+    def __init__(self, path=HISTORY_PATH):
+        if pa is None:
+            raise ImportError("price history needs pyarrow: pip install pyarrow")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, products_data, scraped_at=None):
+        """
+        Append every offer of `products_data` as one new file in today's partition
+        Returns the number of offers written
+        """
+        scraped_at = (scraped_at or datetime.now()).replace(microsecond=0)
+        columns = {name: [] for name in OFFER_SCHEMA.names}
+        for product in products_data:
+            for offer in product['offers']:
+                columns['scraped_at'].append(scraped_at)
+                columns['product_name'].append(product['product_name'])
+                columns['product_url'].append(product['product_url'])
+                columns['position'].append(offer['position'])
+                columns['store_name'].append(offer['store_name'])
+                columns['store_link'].append(offer.get('store_link'))
+                columns['price_text'].append(offer.get('price_text'))
+                columns['price_value'].append(offer['price_value'])
+                columns['change'].append(offer.get('change'))
+        rows = len(columns['scraped_at'])
+        if not rows:
+            return 0
+
+        table = pa.table(columns, schema=OFFER_SCHEMA)
+        partition = os.path.join(self.path, f"scrape_date={scraped_at.date().isoformat()}")
+        os.makedirs(partition, exist_ok=True)
+        name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+        # Written under a temp name first so readers never see a half-written file
+        tmp_path = os.path.join(partition, f".{name}.tmp")
+        pq.write_table(table, tmp_path, compression='zstd', use_dictionary=True)
+        os.replace(tmp_path, os.path.join(partition, name))
+        return rows
+
+    def _scan(self, columns, start=None, end=None, where=None):
+        """
+        Read `columns` for offers scraped in [start, end); date partitions
+        outside the range are not opened
+        """
+        dataset = ds.dataset(self.path, schema=DATASET_SCHEMA, format='parquet',
+                             partitioning=PARTITIONING, exclude_invalid_files=True)
+        start, end = _as_datetime(start), _as_datetime(end)
+        filters = [] if where is None else [where]
+        if start is not None:
+            filters.append(ds.field('scrape_date') >= start.date())
+            filters.append(ds.field('scraped_at') >= pa.scalar(start, pa.timestamp('s')))
+        if end is not None:
+            filters.append(ds.field('scrape_date') <= end.date())
+            filters.append(ds.field('scraped_at') < pa.scalar(end, pa.timestamp('s')))
+        expression = None
+        for condition in filters:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression)
+
+    @staticmethod
+    def _first_per(table, keys, columns):
+        """
+        First row per `keys` group in the table's current sort order
+        """
+        grouped = table.group_by(keys, use_threads=False).aggregate(
+            [(column, 'first') for column in columns]
+        )
+        return pa.table({name: grouped[name if name in keys else f"{name}_first"]
+                         for name in keys + columns})
+
+    @staticmethod
+    def _priced(table):
+        # Disappeared offers carry their last price, not a current one
+        keep = pc.and_(pc.is_valid(table['price_value']),
+                       pc.invert(pc.fill_null(pc.equal(table['change'], 'removed'), False)))
+        return table.filter(keep)
+
+    def lowest_prices(self, start=None, end=None):
+        """
+        Lowest price per product over [start, end), with the store and time it was seen
+        Columns: product_url, product_name, price_value, store_name, scraped_at
+        """
+        table = self._priced(self._scan(
+            ['product_url', 'product_name', 'price_value', 'store_name', 'scraped_at', 'change'],
+            start, end
+        ))
+        # Hash-aggregate the minimum, then join back for the store/time it was seen at
+        minimum = table.group_by('product_url').aggregate([('price_value', 'min')])
+        minimum = minimum.rename_columns(
+            ['price_value' if name == 'price_value_min' else name for name in minimum.column_names]
+        )
+        lowest = table.join(minimum, ['product_url', 'price_value'], join_type='inner')
+        lowest = lowest.sort_by([('product_url', 'ascending'), ('scraped_at', 'ascending')])
+        return self._first_per(lowest, ['product_url'],
+                               ['product_name', 'price_value', 'store_name', 'scraped_at'])
+
+    def price_series(self, product_url, store_name=None, start=None, end=None):
+        """
+        Price over time for one product, per store (or for one store)
+        Columns: store_name, scraped_at, price_value, change
+        """
+        where = ds.field('product_url') == product_url
+        if store_name is not None:
+            where = where & (ds.field('store_name') == store_name)
+        table = self._scan(['store_name', 'scraped_at', 'price_value', 'change'], start, end, where)
+        return table.sort_by([('store_name', 'ascending'), ('scraped_at', 'ascending')])
+
+    def latest_snapshot(self, as_of=None, days=None):
+        """
+        Offers of each product's latest scrape up to `as_of` (a full snapshot,
+        so stores that stopped listing it are left out), one row per store
+        With `days`, only history from the last `days` days before `as_of` is read
+        Columns: product_url, store_name, product_name, position, price_value, scraped_at
+        """
+        as_of = _as_datetime(as_of)
+        start = None
+        if days is not None:
+            start = (as_of or datetime.now()) - timedelta(days=days)
+        table = self._scan(
+            ['product_url', 'store_name', 'product_name', 'position', 'price_value',
+             'scraped_at', 'change'],
+            start, as_of
+        )
+        newest = table.group_by('product_url').aggregate([('scraped_at', 'max')])
+        newest = newest.rename_columns(
+            ['scraped_at' if name == 'scraped_at_max' else name for name in newest.column_names]
+        )
+        table = table.join(newest, ['product_url', 'scraped_at'], join_type='inner')
+        # A store listed twice in one scrape keeps its best position
+        table = table.sort_by([('position', 'ascending')])
+        latest = self._first_per(table, ['product_url', 'store_name'],
+                                 ['product_name', 'position', 'price_value', 'scraped_at', 'change'])
+        latest = self._priced(latest).drop_columns(['change'])
+        return latest.sort_by([('product_url', 'ascending'), ('position', 'ascending')])
+
+
+if __name__ == "__main__":
+    history = PriceHistory()
+    since = date.today() - timedelta(days=30)
+    print(f"📉 Lowest prices since {since}:")
+    for row in history.lowest_prices(start=since).to_pylist():
+        print(f"   {row['product_name']}: {row['price_value']:.2f} € at {row['store_name']} "
+              f"({row['scraped_at']:%Y-%m-%d})")
@@ -0,0 +1,148 @@
+"""
+Local price-state store: remembers the last known offers per product so
+sinks only receive new, changed or disappeared offers instead of full
+snapshots on every run
+
+State is kept per sink and only recorded once the sink has written the
+change, so a batch that fails for good is sent again on the next run
+"""
+import os
+import sqlite3
+import time
+
+# State settings (configurable via env)
+STATE_PATH = os.getenv('PRICE_STATE_PATH', 'price_state.sqlite')  # '' disables deltas
+SNAPSHOT_INTERVAL = float(os.getenv('PRICE_STATE_SNAPSHOT_HOURS', '24')) * 3600  # 0 = never
+
+
+class PriceState:
+    """
+    SQLite table of (sink, product_url, position) -> (store_name, price_value, ...)
+
+    diff() compares a scraped product with the offers a sink last wrote and
+    returns a product holding only the offers that changed, each tagged with
+    'change': 'new' | 'changed' | 'removed'. During a full snapshot every
+    current offer is returned ('unchanged' ones included). record() stores
+    those changes once the sink has written them.
+    """
+
+    def __init__(self, path=STATE_PATH, snapshot_interval=SNAPSHOT_INTERVAL,
+                 full_snapshot=False):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sink_offers (
+                sink TEXT NOT NULL,
+                product_url TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                store_name TEXT,
+                price_value REAL,
+                product_name TEXT,
+                store_link TEXT,
+                price_text TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (sink, product_url, position)
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        last = self.conn.execute("SELECT value FROM meta WHERE key = 'last_snapshot'").fetchone()
+        last_snapshot = float(last[0]) if last else 0.0
+        self.full_snapshot = full_snapshot or (
+            snapshot_interval > 0 and time.time() - last_snapshot >= snapshot_interval
+        )
+        self.counts = {}  # sink -> {'new': n, 'changed': n, 'removed': n, 'unchanged': n}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(completed=exc_type is None)
+
+    def close(self, completed=True):
+        """
+        Commit and close; a completed full-snapshot run resets the snapshot clock
+        """
+        if self.conn is None:
+            return
+        if completed and self.full_snapshot:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('last_snapshot', ?)", (str(time.time()),)
+            )
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
+
+    def diff(self, product, sink=''):
+        """
+        Compare a scraped product with what `sink` last wrote (state is not
+        changed here, see record())
+        Returns a product dict with only the changed offers, or None if
+        nothing changed (and this is not a full-snapshot run)
+        """
+        url = product['product_url']
+        previous = {
+            row[0]: row for row in self.conn.execute(
+                "SELECT position, store_name, price_value, product_name, store_link, price_text "
+                "FROM sink_offers WHERE sink = ? AND product_url = ?", (sink, url)
+            )
+        }
+        counts = self.counts.setdefault(sink, {'new': 0, 'changed': 0, 'removed': 0, 'unchanged': 0})
+        delta = []
+        for offer in product['offers']:
+            old = previous.pop(offer['position'], None)
+            if old is None:
+                change = 'new'
+            elif old[1] != offer['store_name'] or old[2] != offer['price_value']:
+                change = 'changed'
+            else:
+                change = 'unchanged'
+            counts[change] += 1
+            if change != 'unchanged' or self.full_snapshot:
+                delta.append({**offer, 'change': change})
+
+        # Whatever is left was listed last time but not any more
+        for position, store_name, price_value, _, store_link, price_text in previous.values():
+            counts['removed'] += 1
+            delta.append({
+                'position': position,
+                'store_name': store_name,
+                'store_link': store_link,
+                'price_text': price_text,
+                'price_value': price_value,
+                'change': 'removed'
+            })
+
+        if not delta:
+            return None
+        delta.sort(key=lambda offer: offer['position'])
+        changed = {key: value for key, value in product.items() if key != 'unchanged'}
+        changed['offers'] = delta
+        return changed
+
+    def record(self, products, sink=''):
+        """
+        Store the changes of diff()ed products once `sink` has written them
+        """
+        now = time.time()
+        for product in products:
+            url = product['product_url']
+            for offer in product['offers']:
+                change = offer.get('change')
+                if change in ('new', 'changed'):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO sink_offers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (sink, url, offer['position'], offer['store_name'], offer['price_value'],
+                         product['product_name'], offer['store_link'], offer['price_text'], now)
+                    )
+                elif change == 'removed':
+                    self.conn.execute(
+                        "DELETE FROM sink_offers WHERE sink = ? AND product_url = ? AND position = ?",
+                        (sink, url, offer['position'])
+                    )
+        self.conn.commit()
+
+    def print_summary(self):
+        mode = "full snapshot" if self.full_snapshot else "changes only"
+        for sink, counts in self.counts.items():
+            print(f"📉 Price state{f' for {sink}' if sink else ''} ({mode}): {counts['new']} new, "
+                  f"{counts['changed']} changed, {counts['removed']} removed, "
+                  f"{counts['unchanged']} unchanged offers")
@@ -0,0 +1,147 @@
+"""
+Page readiness: return the rendered page as soon as the offers table
+(or a "not found"/"no sellers" marker) is in the DOM, instead of
+sleeping a fixed delay on every page
+"""
+import asyncio
+import bisect
+import os
+import time
+
+# 'ready' waits for the selectors below, 'fixed' keeps the old flat delay
+RENDER_MODE = os.getenv('SCRAPER_RENDER_MODE', 'ready')
+FIXED_DELAY = 3.0
+READY_TIMEOUT = float(os.getenv('SCRAPER_READY_TIMEOUT', '15'))  # seconds
+
+# Page is ready when any of these match
+READY_SELECTORS = [
+    'div.sellers-group div.item-table-wrap[itemprop=offers]',
+]
+# Page will never get offers when any of these match
+NOT_FOUND_SELECTORS = [
+    'div.sellers-group:empty',
+    '.no-sellers',
+    '.page-404',
+    '.error-404',
+]
+
+# Evaluated by the browser until it returns true (or the timeout hits)
+WAIT_FOR_JS = """js:() => {
+    const ready = %s;
+    const missing = %s;
+    if (ready.some(s => document.querySelector(s))) return true;
+    if (missing.some(s => document.querySelector(s))) return true;
+    return /404/.test(document.title);
+}""" % (READY_SELECTORS, NOT_FOUND_SELECTORS)
+
+
+class ReadyHistogram:
+    """
+    Histogram of time-to-ready per page (seconds)
+    """
+    BUCKETS = [0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 15.0, 30.0]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.timeouts = 0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def print_summary(self):
+        if not self.count:
+            return
+        print(f"⏱️ Time to ready: {self.count} pages, avg {self.total / self.count:.2f}s, "
+              f"{self.timeouts} timeouts")
+        lower = 0.0
+        for upper, n in zip(self.BUCKETS + [float('inf')], self.counts):
+            if n:
+                label = f"{lower:g}-{upper:g}s" if upper != float('inf') else f">{lower:g}s"
+                print(f"   {label:>10} {'█' * max(1, round(40 * n / self.count))} {n}")
+            lower = upper
+
+
+def install_timing_hooks(crawler):
+    """
+    Note when browser navigation starts and ends (crawl4ai before/after_goto
+    hooks) in crawler.page_timings, so render_until_ready can tell navigation
+    and render wait apart
+    """
+    strategy = getattr(crawler, 'crawler_strategy', None)
+    if strategy is None or not hasattr(strategy, 'set_hook'):
+        return
+    marks = crawler.page_timings = {}
+
+    async def before_goto(page, *args, **kwargs):
+        marks['before_goto'] = time.perf_counter()
+        return page
+
+    async def after_goto(page, *args, **kwargs):
+        marks['after_goto'] = time.perf_counter()
+        return page
+
+    strategy.set_hook('before_goto', before_goto)
+    strategy.set_hook('after_goto', after_goto)
+
+
+def render_kwargs(mode=RENDER_MODE, timeout=READY_TIMEOUT):
+    """
+    Keyword arguments for crawler.arun() for the given render mode
+    """
+    if mode == 'fixed':
+        return {'delay_before_return_html': FIXED_DELAY}
+    return {
+        'wait_for': WAIT_FOR_JS,
+        'page_timeout': int(timeout * 1000),
+        'delay_before_return_html': 0.1,
+    }
+
+
+async def render_until_ready(crawler, url, histogram=None, mode=RENDER_MODE,
+                             timeout=READY_TIMEOUT, timings=None):
+    """
+    Render a page and return the crawl4ai result once it is ready
+    Raises asyncio.TimeoutError if the page never became ready, and
+    ConnectionError for any other failed render (navigation or network
+    errors, HTTP error pages other than 404), so it is never parsed as a
+    page without sellers
+    With a `timings` dict, 'navigate' and 'render_wait' seconds are added to it
+    (all of it counts as render wait if the crawler has no timing hooks)
+    """
+    marks = getattr(crawler, 'page_timings', None)
+    if marks is not None:
+        marks.clear()
+    started = time.perf_counter()
+    try:
+        # Hard cap on top of the browser-side timeout (navigation + wait)
+        result = await asyncio.wait_for(
+            crawler.arun(url=url, **render_kwargs(mode, timeout)),
+            timeout=timeout * 2 + FIXED_DELAY
+        )
+    except asyncio.TimeoutError:
+        if histogram:
+            histogram.timeouts += 1
+        raise
+    error = getattr(result, 'error_message', '') or ''
+    if not getattr(result, 'success', True) and getattr(result, 'status_code', None) != 404:
+        if 'timeout' in error.lower():
+            if histogram:
+                histogram.timeouts += 1
+            raise asyncio.TimeoutError(f"Page not ready after {timeout:g}s: {url}")
+        raise ConnectionError(f"Render failed for {url}: {error or 'no error message'}")
+    finished = time.perf_counter()
+    if histogram:
+        histogram.record(finished - started)
+    if timings is not None:
+        loaded = marks.get('after_goto') if marks else None
+        if loaded:
+            navigate = loaded - marks.get('before_goto', started)
+            timings['navigate'] = timings.get('navigate', 0.0) + navigate
+            timings['render_wait'] = finished - loaded
+        else:
+            timings['render_wait'] = finished - started
+    return result
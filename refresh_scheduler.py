@@ -0,0 +1,227 @@
+"""
+Adaptive refresh scheduling: scrape volatile products more often
+
+Every product URL has a refresh interval. When a scrape finds its offers
+changed, the interval is halved (down to MIN_INTERVAL). When nothing
+changed, it grows by half (up to MAX_INTERVAL). So a model whose price
+moves hourly is checked hourly, and one that has not moved in weeks only
+every few days. Each change is logged, and the share of checks that found
+a change (an exponentially weighted average) is kept as the product's
+volatility.
+
+Due products come off a heapq priority queue ordered by next-due time,
+most overdue first, at most `budget` per tick.
+"""
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import time
+
+# Scheduler settings (configurable via env)
+SCHEDULE_PATH = os.getenv('REFRESH_SCHEDULE_PATH', 'refresh_schedule.sqlite')
+MIN_INTERVAL = float(os.getenv('REFRESH_MIN_HOURS', '1')) * 3600
+MAX_INTERVAL = float(os.getenv('REFRESH_MAX_HOURS', '72')) * 3600
+INITIAL_INTERVAL = float(os.getenv('REFRESH_INITIAL_HOURS', '6')) * 3600
+TICK = float(os.getenv('REFRESH_TICK_MINUTES', '15')) * 60
+BUDGET = int(os.getenv('REFRESH_BUDGET', '200'))             # URLs scraped per tick
+CATALOGUE_REFRESH = float(os.getenv('REFRESH_CATALOGUE_HOURS', '6')) * 3600
+
+SHRINK = 0.5          # interval factor after a change
+GROW = 1.5            # interval factor after an unchanged check
+VOLATILITY_ALPHA = 0.3
+# A URL handed out but never reported back (scrape failed) is due again after this
+RETRY_LEASE = 1800.0
+
+
+def offers_fingerprint(product):
+    """
+    Hash of what we track per product: each offer's store and price
+    """
+    offers = sorted((offer['position'], offer['store_name'], offer['price_value'])
+                    for offer in product['offers'] if offer.get('change') != 'removed')
+    return hashlib.sha1(json.dumps(offers).encode('utf-8')).hexdigest()
+
+
+class RefreshScheduler:
+    """
+    SQLite-backed per-product schedule plus an in-memory heap of (next_due, url)
+    """
+
+    def __init__(self, path=SCHEDULE_PATH, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL, initial_interval=INITIAL_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS schedule (
+                url TEXT PRIMARY KEY,
+                interval REAL NOT NULL,
+                next_due REAL NOT NULL,
+                fingerprint TEXT,
+                volatility REAL NOT NULL DEFAULT 0,
+                checks INTEGER NOT NULL DEFAULT 0,
+                changes INTEGER NOT NULL DEFAULT 0,
+                last_checked REAL,
+                last_changed REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                url TEXT NOT NULL,
+                changed_at REAL NOT NULL,
+                interval REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS changes_url ON changes (url, changed_at)")
+        self._load_heap()
+        self.checked = 0
+        self.changed = 0
+
+    def _load_heap(self):
+        self.heap = [(next_due, url) for url, next_due in
+                     self.conn.execute("SELECT url, next_due FROM schedule")]
+        heapq.heapify(self.heap)
+        self.scheduled = len(self.heap)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def add(self, url, now=None):
+        """
+        Schedule a URL we have not seen before (due straight away)
+        Returns True if it was new
+        """
+        now = now or time.time()
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO schedule (url, interval, next_due) VALUES (?, ?, ?)",
+            (url, self.initial_interval, now)
+        )
+        if cursor.rowcount:
+            self.scheduled += 1
+            heapq.heappush(self.heap, (now, url))
+            return True
+        return False
+
+    async def sync(self, urls):
+        """
+        Add every not-yet-scheduled URL of a (sync or async) URL source
+        Returns the number of new URLs
+        """
+        added = 0
+        if hasattr(urls, '__aiter__'):
+            async for url in urls:
+                added += self.add(url)
+        else:
+            for url in urls:
+                added += self.add(url)
+        self.conn.commit()
+        print(f"🗓️ Schedule: {added} new products, {self.scheduled} scheduled")
+        return added
+
+    def _next_due(self, url):
+        row = self.conn.execute("SELECT next_due FROM schedule WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def pop_due(self, budget=BUDGET, now=None):
+        """
+        Take up to `budget` due URLs off the queue, most overdue first
+        Each is leased: if it is never reported back it is due again after RETRY_LEASE
+        """
+        now = now or time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now and len(due) < budget:
+            next_due, url = heapq.heappop(self.heap)
+            if self._next_due(url) != next_due:
+                continue  # stale heap entry, the URL was rescheduled since
+            lease = now + min(RETRY_LEASE, self.max_interval)
+            self.conn.execute("UPDATE schedule SET next_due = ? WHERE url = ?", (lease, url))
+            heapq.heappush(self.heap, (lease, url))
+            due.append(url)
+        self.conn.commit()
+        if len(self.heap) > 2 * self.scheduled + 1000:
+            self._load_heap()  # drop the stale entries rescheduling left behind
+        return due
+
+    def seconds_until_due(self, now=None):
+        """
+        Seconds until the next URL is due (None when nothing is scheduled)
+        """
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - (now or time.time()))
+
+    def observe(self, product, now=None):
+        """
+        Record a scrape result and schedule the product's next check
+        Returns True if its offers changed since the last check
+        """
+        now = now or time.time()
+        url = product['product_url']
+        row = self.conn.execute(
+            "SELECT interval, fingerprint, volatility FROM schedule WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            self.add(url, now)
+            row = (self.initial_interval, None, 0.0)
+        interval, fingerprint, volatility = row
+        new_fingerprint = offers_fingerprint(product)
+        changed = fingerprint is not None and new_fingerprint != fingerprint
+        if fingerprint is not None:
+            interval *= SHRINK if changed else GROW
+            volatility += VOLATILITY_ALPHA * ((1.0 if changed else 0.0) - volatility)
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        next_due = now + interval
+        self.conn.execute(
+            "UPDATE schedule SET interval = ?, next_due = ?, fingerprint = ?, volatility = ?, "
+            "checks = checks + 1, changes = changes + ?, last_checked = ?, "
+            "last_changed = CASE WHEN ? THEN ? ELSE last_changed END WHERE url = ?",
+            (interval, next_due, new_fingerprint, volatility, int(changed), now,
+             changed, now, url)
+        )
+        if changed:
+            self.conn.execute("INSERT INTO changes VALUES (?, ?, ?)", (url, now, interval))
+            self.changed += 1
+        self.checked += 1
+        heapq.heappush(self.heap, (next_due, url))
+        return changed
+
+    def observing(self, scrape_stream):
+        """
+        Wrap a scrape stream (urls -> async generator of products) so every
+        product it yields is recorded with observe()
+        """
+        async def stream(urls):
+            async for product in scrape_stream(urls):
+                self.observe(product)
+                yield product
+        return stream
+
+    def history(self, url):
+        """
+        Times (epoch seconds) the product's offers were seen to change
+        """
+        return [changed_at for (changed_at,) in self.conn.execute(
+            "SELECT changed_at FROM changes WHERE url = ? ORDER BY changed_at", (url,)
+        )]
+
+    def print_summary(self):
+        self.conn.commit()
+        scheduled, fast, slow = self.conn.execute(
+            "SELECT COUNT(*), SUM(interval <= ?), SUM(interval >= ?) FROM schedule",
+            (self.min_interval * 2, self.max_interval / 2)
+        ).fetchone()
+        print(f"🗓️ Refresh: {self.changed}/{self.checked} checked products changed; "
+              f"{scheduled} scheduled, {fast or 0} volatile (≤{self.min_interval * 2 / 3600:g}h), "
+              f"{slow or 0} stable (≥{self.max_interval / 2 / 3600:g}h)")
@@ -0,0 +1,201 @@
+"""
+Resource control for long runs
+
+- Blocking: the browser only fetches what the offers table needs. Images,
+  fonts, media and stylesheets are aborted, and so is anything from a
+  third-party domain (ads, analytics, trackers). Installed as a crawl4ai
+  on_page_context_created hook that routes every request of the page.
+- Memory: the RSS of the scraper's whole process tree (Python plus the
+  browsers it started) is sampled; above the threshold the browser pool
+  restarts browsers as they are handed back.
+- Reporting: bytes transferred per page, blocked requests and peak RSS.
+"""
+import os
+import time
+from urllib.parse import urlparse
+
+try:
+    import psutil
+except ImportError:  # psutil is optional, /proc is read directly on Linux
+    psutil = None
+
+# Resource settings (configurable via env)
+BLOCK_RESOURCES = os.getenv('SCRAPER_BLOCK_RESOURCES', '1') == '1'
+BLOCKED_RESOURCE_TYPES = frozenset(
+    os.getenv('SCRAPER_BLOCKED_TYPES', 'image,media,font,stylesheet').split(',')
+)
+# Requests to any other domain are blocked ('' allows every domain)
+ALLOWED_DOMAINS = tuple(d for d in os.getenv('SCRAPER_ALLOWED_DOMAINS', 'hind.ee').split(',') if d)
+MAX_RSS_MB = float(os.getenv('SCRAPER_MAX_RSS_MB', '2048'))  # 0 disables memory restarts
+RSS_SAMPLE_INTERVAL = 2.0  # seconds
+
+
+def is_allowed_domain(url, domains=ALLOWED_DOMAINS):
+    """
+    True if `url` is on one of `domains` (or a subdomain), or is not an http(s) URL
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not domains:
+        return True
+    host = parsed.hostname or ''
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+def should_block(resource_type, url, blocked_types=BLOCKED_RESOURCE_TYPES,
+                 domains=ALLOWED_DOMAINS):
+    """
+    True if the scraper has no use for this request
+    """
+    if resource_type == 'document':
+        return False  # never block the page itself (or a redirect target)
+    return resource_type in blocked_types or not is_allowed_domain(url, domains)
+
+
+class TransferStats:
+    """
+    Request counters for the whole run
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+        self.pages = 0
+
+    def add_page(self, page_bytes):
+        self.pages += 1
+        self.bytes += page_bytes
+
+    def print_summary(self):
+        if not self.pages:
+            return
+        print(f"📦 Transfer: {self.bytes / self.pages / 1024:.0f} KiB/page over {self.pages} pages, "
+              f"{self.blocked}/{self.requests} browser requests blocked")
+
+
+def install_resource_blocking(crawler, stats=None, blocked_types=BLOCKED_RESOURCE_TYPES,
+                              domains=ALLOWED_DOMAINS):
+    """
+    Route every request of the crawler's pages through should_block() and
+    count the bytes each page pulls in (crawler.page_transfer['bytes'],
+    reset by the caller before each render)
+    """
+    strategy = getattr(crawler, 'crawler_strategy', None)
+    if strategy is None or not hasattr(strategy, 'set_hook'):
+        return
+    transfer = crawler.page_transfer = {'bytes': 0}
+
+    async def route_request(route):
+        request = route.request
+        if stats is not None:
+            stats.requests += 1
+        if should_block(request.resource_type, request.url, blocked_types, domains):
+            if stats is not None:
+                stats.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def request_finished(request):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        transfer['bytes'] += sizes.get('responseBodySize', 0) + sizes.get('responseHeadersSize', 0)
+
+    async def on_page_context_created(page, *args, **kwargs):
+        await page.route('**/*', route_request)
+        page.on('requestfinished', request_finished)
+        return page
+
+    strategy.set_hook('on_page_context_created', on_page_context_created)
+
+
+def _proc_children():
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                # The command name may contain spaces; fields resume after ')'
+                fields = f.read().rsplit(b')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    return children
+
+
+def _proc_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def process_tree_rss(pid=None):
+    """
+    Resident memory (bytes) of `pid` and all its descendants, e.g. the
+    scraper plus its Playwright driver and browser processes
+    Returns None where it cannot be measured
+    """
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            total = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+        except psutil.Error:
+            return None
+    if not os.path.isdir('/proc'):
+        return None
+    children = _proc_children()
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += _proc_rss(current)
+        stack.extend(children.get(current, ()))
+    return total
+
+
+class MemoryWatch:
+    """
+    Samples the process tree's RSS (at most every `interval` seconds) and
+    keeps the peak; over_limit() is True while it is above `max_rss_mb`
+    """
+
+    def __init__(self, max_rss_mb=MAX_RSS_MB, interval=RSS_SAMPLE_INTERVAL):
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.interval = interval
+        self.current = None
+        self.peak = 0
+        self.restarts = 0
+        self._sampled = 0.0
+
+    def sample(self, force=False):
+        now = time.monotonic()
+        if force or now - self._sampled >= self.interval:
+            self._sampled = now
+            self.current = process_tree_rss()
+            if self.current is not None:
+                self.peak = max(self.peak, self.current)
+        return self.current
+
+    def over_limit(self):
+        rss = self.sample()
+        return bool(self.max_rss) and rss is not None and rss > self.max_rss
+
+    def print_summary(self):
+        self.sample(force=True)
+        if not self.peak:
+            return
+        limit = f"limit {self.max_rss / 2**20:.0f} MiB" if self.max_rss else "no limit"
+        print(f"🧠 Peak RSS {self.peak / 2**20:.0f} MiB ({limit}, "
+              f"{self.restarts} browser restarts for memory)")
@@ -0,0 +1,129 @@
+"""
+Durable run journal: an append-only JSONL file with one line per URL state
+change, so a crashed run can be resumed without scraping everything again
+
+    {"ts": 1718000000.0, "url": "...", "state": "pending", "attempt": 1}
+    {"ts": 1718000004.2, "url": "...", "state": "failed", "attempt": 1, "error": "timeout"}
+    {"ts": 1718000031.9, "url": "...", "state": "scraped", "attempt": 2}
+    {"ts": 1718000040.3, "url": "...", "state": "done", "attempt": 2}
+
+A URL is 'scraped' once its product is on its way to the sinks and 'done'
+only once every sink has written it (see pipeline.run_pipeline), so a
+resumed run scrapes again whatever a crash caught in a sink batch.
+Lines are flushed as they are written; replaying the file gives the last
+state and attempt count of every URL. A torn last line (crash mid-write)
+is ignored on resume.
+"""
+import json
+import os
+import time
+
+# Journal settings (configurable via env)
+JOURNAL_PATH = os.getenv('RUN_JOURNAL_PATH', 'run_journal.jsonl')  # '' disables the journal
+
+STATES = ('pending', 'scraped', 'done', 'failed')
+
+
+class RunJournal:
+    """
+    Without `resume` a new journal is started (the old file is replaced);
+    with `resume` the existing file is replayed and appended to
+    """
+
+    def __init__(self, path=JOURNAL_PATH, resume=False):
+        self.path = path
+        self.urls = {}  # url -> {'state': ..., 'attempts': ..., 'error': ...}
+        self.skipped = 0
+        if resume and os.path.exists(path):
+            self._replay()
+            self.file = open(path, 'a', encoding='utf-8')
+            if self.file.tell() and not self._ends_with_newline():
+                self.file.write('\n')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _replay(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('state') not in STATES:
+                    continue
+                self.urls[entry['url']] = {
+                    'state': entry['state'],
+                    'attempts': entry.get('attempt', 0),
+                    'error': entry.get('error')
+                }
+        done = sum(1 for entry in self.urls.values() if entry['state'] == 'done')
+        print(f"📓 Resuming run journal {self.path}: {done}/{len(self.urls)} URLs already done")
+
+    def is_done(self, url):
+        """
+        True if `url` finished in an earlier (resumed) run; counts it as skipped
+        """
+        entry = self.urls.get(url)
+        if entry is None or entry['state'] != 'done':
+            return False
+        self.skipped += 1
+        return True
+
+    def record(self, url, state, error=None):
+        """
+        Append a state change for `url`; 'pending' starts a new attempt
+        Returns the URL's attempt number (across resumed runs)
+        """
+        entry = self.urls.setdefault(url, {'state': None, 'attempts': 0, 'error': None})
+        if state == 'pending':
+            entry['attempts'] += 1
+        entry['state'] = state
+        entry['error'] = error
+        line = {'ts': round(time.time(), 3), 'url': url, 'state': state,
+                'attempt': entry['attempts']}
+        if error:
+            line['error'] = error
+        self.file.write(json.dumps(line, ensure_ascii=False) + '\n')
+        self.file.flush()
+        return entry['attempts']
+
+    def written(self, url):
+        """
+        Mark a scraped URL done once the sinks have written its product
+        (URLs in any other state, e.g. failed, are left as they are)
+        """
+        entry = self.urls.get(url)
+        if entry is not None and entry['state'] == 'scraped':
+            self.record(url, 'done')
+
+    def failed_urls(self):
+        """
+        URLs whose last recorded state is 'failed', with their error class
+        """
+        return {url: entry['error'] for url, entry in self.urls.items()
+                if entry['state'] == 'failed'}
+
+    def print_summary(self):
+        counts = {state: 0 for state in STATES}
+        for entry in self.urls.values():
+            counts[entry['state']] += 1
+        print(f"📓 Run journal: {counts['done']} done, {counts['scraped']} not written yet, "
+              f"{counts['failed']} failed, {counts['pending']} pending, {self.skipped} skipped as already done -> {self.path}")
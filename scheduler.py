@@ -0,0 +1,105 @@
+"""
+Scheduling helpers for concurrent scraping:
+per-host token-bucket rate limiting and adaptive concurrency
+"""
+import asyncio
+import time
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, up to `burst` saved up
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it
+        """
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostRateLimiter:
+    """
+    One token bucket per host, so each site gets its own request budget
+    """
+
+    def __init__(self, rate=2.0, burst=2):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    async def wait(self, url):
+        if not self.rate or self.rate <= 0:
+            return
+        host = urlparse(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit that adjusts itself (additive increase, multiplicative decrease)
+
+    Every `limit` successful pages in a row raise the limit by one.
+    An error, timeout or empty result halves it, at most once per `cooldown`
+    seconds so a burst of failures from the same moment counts only once.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, cooldown=5.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.peak = self.limit
+        self._streak = 0
+        self._last_backoff = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, outcome='ok'):
+        """
+        Give back a slot and adjust the limit based on the page outcome
+        outcome is one of: 'ok', 'empty', 'timeout', 'error'
+        """
+        async with self._cond:
+            self.in_flight -= 1
+            if outcome == 'ok':
+                self._streak += 1
+                if self._streak >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.peak = max(self.peak, self.limit)
+                    self._streak = 0
+            else:
+                self._streak = 0
+                now = time.monotonic()
+                if now - self._last_backoff >= self.cooldown and self.limit > self.minimum:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self._last_backoff = now
+                    print(f"🐢 Backing off to {self.limit} concurrent pages ({outcome})")
+            self._cond.notify_all()
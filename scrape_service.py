@@ -0,0 +1,292 @@
+"""
+Scrape service: current top-3 offers for one product over a local HTTP/JSON API
+
+Browsers are launched once at startup and kept warm, so a lookup costs one
+page render instead of a browser launch. Results are kept in a TTL cache,
+and concurrent lookups of the same URL share one in-flight scrape. At most
+SERVICE_WORKERS scrapes run at once; beyond SERVICE_MAX_PENDING waiting
+lookups new ones get 503 instead of queueing without bound.
+
+    GET  /product?url=<hind.ee product URL>[&max_age=<seconds>]
+    POST /products   {"urls": [...]}
+    GET  /health
+
+Run with:
+    python scrape_service.py --port 8080
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+
+from browser_pool import BrowserPool
+from extraction import ParseError
+from http_fetch import HttpFetcher
+from resources import MemoryWatch, TransferStats, is_allowed_domain
+from scheduler import HostRateLimiter
+
+# Service settings (configurable via env)
+SERVICE_HOST = os.getenv('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.getenv('SERVICE_PORT', '8080'))
+SERVICE_WORKERS = int(os.getenv('SERVICE_WORKERS', '4'))           # warm browsers / parallel scrapes
+SERVICE_CACHE_TTL = float(os.getenv('SERVICE_CACHE_TTL', '300'))    # seconds
+SERVICE_CACHE_MAX = int(os.getenv('SERVICE_CACHE_MAX', '10000'))    # cached products
+SERVICE_TIMEOUT = float(os.getenv('SERVICE_TIMEOUT', '60'))         # per lookup, seconds
+SERVICE_MAX_PENDING = int(os.getenv('SERVICE_MAX_PENDING', '100'))  # in-flight scrapes
+SERVICE_MAX_BATCH = 50
+
+STEP2_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2_scrape_product.py')
+
+
+def _load_step2():
+    spec = importlib.util.spec_from_file_location("step2", STEP2_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ResultCache:
+    """
+    Scraped products by URL, expiring after `ttl` seconds and bounded to
+    `max_entries` (least recently used dropped first)
+    """
+
+    def __init__(self, ttl=SERVICE_CACHE_TTL, max_entries=SERVICE_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # url -> (scraped_at, product)
+
+    def get(self, url, max_age=None):
+        """
+        Returns (product, age in seconds) or None if missing or too old
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        age = time.time() - entry[0]
+        if age > self.ttl:
+            del self.entries[url]
+            return None
+        if max_age is not None and age > max_age:
+            return None
+        self.entries.move_to_end(url)
+        return entry[1], age
+
+    def put(self, url, product):
+        self.entries[url] = (time.time(), product)
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class ServiceBusy(Exception):
+    """
+    Too many scrapes in flight to take another one
+    """
+
+
+class ScrapeService:
+    """
+    Warm browser pool + HTTP fetcher shared by every lookup
+    """
+
+    def __init__(self, workers=SERVICE_WORKERS, ttl=SERVICE_CACHE_TTL,
+                 max_entries=SERVICE_CACHE_MAX, max_pending=SERVICE_MAX_PENDING,
+                 timeout=SERVICE_TIMEOUT, step2=None):
+        self.step2 = step2 or _load_step2()
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.cache = ResultCache(ttl, max_entries)
+        self.inflight = {}  # url -> asyncio.Task of the shared scrape
+        self.slots = None  # created in start(), inside the app's event loop
+        self.rate_limiter = HostRateLimiter(rate=self.step2.HOST_RATE, burst=self.step2.HOST_BURST)
+        self.transfer = TransferStats()
+        self.memory = MemoryWatch()
+        self.fetcher = None
+        self.pool = None
+        self.started = time.time()
+        self.counts = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0, 'busy': 0}
+        self.scrape_seconds = []
+
+    async def start(self):
+        # Before Python 3.10 asyncio primitives bind to the loop current at
+        # creation, and web.run_app starts a new one
+        self.slots = asyncio.Semaphore(self.workers)
+        self.fetcher = await HttpFetcher(connections=self.workers * 2).__aenter__()
+        # Not lazy: browsers are warm before the first request comes in
+        # (in FETCH_MODE 'http' they are never needed, so none are started)
+        self.pool = BrowserPool(size=self.workers, lazy=self.step2.FETCH_MODE == 'http',
+                                transfer=self.transfer, memory=self.memory)
+        await self.pool.start()
+
+    async def close(self):
+        for task in list(self.inflight.values()):
+            task.cancel()
+        await asyncio.gather(*self.inflight.values(), return_exceptions=True)
+        if self.pool is not None:
+            await self.pool.close()
+        if self.fetcher is not None:
+            await self.fetcher.__aexit__(None, None, None)
+
+    async def _scrape(self, url):
+        async with self.slots:
+            await self.rate_limiter.wait(url)
+            started = time.perf_counter()
+            product = await self.step2.scrape_product_data(
+                url, pool=self.pool, fetcher=self.fetcher,
+                fetch_mode=self.step2.FETCH_MODE, quiet=True
+            )
+            self.scrape_seconds.append(time.perf_counter() - started)
+            del self.scrape_seconds[:-1000]
+        self.cache.put(url, product)
+        return product
+
+    async def lookup(self, url, max_age=None):
+        """
+        The product at `url`: from the cache if fresh enough, otherwise from
+        a scrape (joining one already running for the same URL)
+        Returns (product, source, age) with source 'cache', 'scrape' or 'coalesced'
+        Raises ServiceBusy, asyncio.TimeoutError or the scrape's error
+        """
+        cached = self.cache.get(url, max_age)
+        if cached is not None:
+            self.counts['hits'] += 1
+            return cached[0], 'cache', cached[1]
+
+        task = self.inflight.get(url)
+        if task is not None:
+            self.counts['coalesced'] += 1
+            source = 'coalesced'
+        else:
+            if len(self.inflight) >= self.max_pending:
+                self.counts['busy'] += 1
+                raise ServiceBusy(f"{len(self.inflight)} scrapes in flight")
+            self.counts['misses'] += 1
+            source = 'scrape'
+            task = self.inflight[url] = asyncio.create_task(self._scrape(url))
+            task.add_done_callback(lambda _: self.inflight.pop(url, None))
+        try:
+            # shield: a client giving up must not cancel the scrape others wait on
+            product = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except Exception:
+            self.counts['errors'] += 1
+            raise
+        return product, source, 0.0
+
+    def health(self):
+        ordered = sorted(self.scrape_seconds)
+        p50 = ordered[len(ordered) // 2] if ordered else 0.0
+        return {
+            'uptime': time.time() - self.started,
+            'workers': self.workers,
+            'in_flight': len(self.inflight),
+            'cached': len(self.cache.entries),
+            'scrape_p50_ms': round(p50 * 1000, 1),
+            'browsers_launched': self.pool.launched if self.pool else 0,
+            'peak_rss': self.memory.peak,
+            **self.counts,
+        }
+
+
+def _error_response(url, error):
+    if isinstance(error, ServiceBusy):
+        status = 503
+    elif isinstance(error, asyncio.TimeoutError):
+        status = 504
+    elif isinstance(error, ParseError):
+        status = 422
+    else:
+        status = 502
+    return status, {'url': url, 'error': type(error).__name__, 'message': str(error)}
+
+
+def _check_url(url):
+    if not url or not url.startswith(('http://', 'https://')) or not is_allowed_domain(url):
+        raise web.HTTPBadRequest(text="'url' must be a product page on an allowed domain")
+    return url
+
+
+def _max_age(request):
+    value = request.query.get('max_age')
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text="'max_age' must be a number of seconds")
+
+
+async def _lookup_json(service, url, max_age):
+    started = time.perf_counter()
+    try:
+        product, source, age = await service.lookup(url, max_age)
+    except Exception as e:
+        return _error_response(url, e)
+    return 200, {'url': url, 'source': source, 'age': round(age, 3),
+                 'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+                 'product': product}
+
+
+async def handle_product(request):
+    url = _check_url(request.query.get('url'))
+    status, body = await _lookup_json(request.app['service'], url, _max_age(request))
+    return web.json_response(body, status=status)
+
+
+async def handle_products(request):
+    try:
+        payload = await request.json()
+        urls = payload['urls']
+    except Exception:
+        raise web.HTTPBadRequest(text='expected {"urls": [...]}')
+    if not isinstance(urls, list) or len(urls) > SERVICE_MAX_BATCH:
+        raise web.HTTPBadRequest(text=f"'urls' must be a list of at most {SERVICE_MAX_BATCH} URLs")
+    urls = [_check_url(url) for url in urls]
+    service = request.app['service']
+    results = await asyncio.gather(*(_lookup_json(service, url, _max_age(request)) for url in urls))
+    return web.json_response({'results': [body for _, body in results]})
+
+
+async def handle_health(request):
+    return web.json_response(request.app['service'].health())
+
+
+def make_app(service=None):
+    """
+    The aiohttp application; the service's browsers start with the app
+    """
+    app = web.Application()
+
+    async def lifecycle(app):
+        app['service'] = service or ScrapeService()
+        await app['service'].start()
+        print(f"🛎️ Scrape service ready ({app['service'].workers} workers, "
+              f"cache TTL {app['service'].cache.ttl:g}s)")
+        yield
+        await app['service'].close()
+
+    app.cleanup_ctx.append(lifecycle)
+    app.router.add_get('/product', handle_product)
+    app.router.add_post('/products', handle_products)
+    app.router.add_get('/health', handle_health)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape service: product offers over HTTP/JSON")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS,
+                        help="warm browsers, i.e. scrapes running at once")
+    args = parser.parse_args(argv)
+    web.run_app(make_app(ScrapeService(workers=args.workers)), host=args.host, port=args.port,
+                print=lambda message: print(f"🛎️ {message}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,4 +7,5 @@ async def test_scrape():
         print("Success! Here's a sample of the content:")
         print(result.markdown[:500])  # First 500 characters
 
-asyncio.run(test_scrape())
+if __name__ == "__main__":
+    asyncio.run(test_scrape())
@@ -0,0 +1,238 @@
+"""
+Sharding of the scrape stage across processes and machines
+
+URLs are assigned by a stable hash, so the same product always lands on the
+same shard and its page cache stays warm between runs:
+
+- shard_filter() keeps one machine's slice of the catalogue (--shards N --shard-index i)
+- scrape_sharded() spreads a stream of URLs over worker processes, each with
+  its own event loop, browser pool and page cache, and merges their products
+  back into one stream for the pipeline
+"""
+import asyncio
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import queue
+
+# Sharding settings (configurable via env)
+PROCESSES = int(os.getenv('SCRAPER_PROCESSES', '1'))
+QUEUE_SIZE = int(os.getenv('SCRAPER_QUEUE_SIZE', '100'))
+
+STEP2_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2_scrape_product.py')
+
+
+def shard_of(url, shards, salt=''):
+    """
+    Stable shard number of `url` in [0, shards): the same in every process and run
+    (unlike hash(), which is randomized per process). Different `salt`s give
+    independent splits, so process shards do not line up with machine shards
+    """
+    digest = hashlib.blake2b(f"{salt}{url}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+async def _iterate(urls):
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+async def shard_filter(urls, shards, index):
+    """
+    Keep only the URLs of shard `index` out of `shards` (one machine's slice)
+    """
+    kept = 0
+    async for url in _iterate(urls):
+        if shard_of(url, shards) == index:
+            kept += 1
+            yield url
+    print(f"🧩 Shard {index + 1}/{shards}: {kept} URLs")
+
+
+class _Forward:
+    """
+    Stands in for the parent's SlugCache / RunJournal / Metrics inside a
+    worker: method calls (record, observe, ...) are sent back and applied
+    by the parent process
+    """
+    profiler = None  # the parse stage is only profiled in single-process runs
+
+    def __init__(self, results, kind):
+        self.results = results
+        self.kind = kind
+
+    def __getattr__(self, method):
+        def forward(*args, **kwargs):
+            self.results.put((self.kind, method, args, kwargs))
+        return forward
+
+    def is_done(self, url):
+        return False  # the parent only sends URLs that still need scraping
+
+    def print_summary(self):
+        pass
+
+
+def _load_step2():
+    spec = importlib.util.spec_from_file_location("step2", STEP2_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _shard_cache_path(cache_path, index):
+    if not cache_path:
+        return cache_path
+    root, ext = os.path.splitext(cache_path)
+    return f"{root}.shard{index}{ext}"
+
+
+def worker_main(index, urls, results, options, forward):
+    """
+    Worker process: scrape the URLs arriving on `urls` (None ends the stream)
+    and put ('product', product) messages on `results`, then ('done', index)
+    Lives at module level so it can be started with the 'spawn' method
+    """
+    step2 = _load_step2()
+    options = dict(options)
+    options['cache_path'] = _shard_cache_path(options.get('cache_path', step2.CACHE_PATH), index)
+    for kind in forward:
+        options[kind] = _Forward(results, kind)
+
+    async def url_stream():
+        while True:
+            url = await asyncio.to_thread(urls.get)
+            if url is None:
+                return
+            yield url
+
+    async def run():
+        async for product in step2.scrape_products_stream(url_stream(), **options):
+            await asyncio.to_thread(results.put, ('product', product))
+
+    try:
+        asyncio.run(run())
+    finally:
+        results.put(('done', index))
+
+
+async def scrape_sharded(urls, processes=PROCESSES, queue_size=QUEUE_SIZE,
+                         slug_cache=None, journal=None, metrics=None, **options):
+    """
+    Async generator like step 2's scrape_products_stream, but the URLs are split
+    by stable hash over `processes` worker processes
+    `options` go to scrape_products_stream in every worker; a `host_rate` is
+    divided between the workers so the site sees the same total rate.
+    Slug cache, journal and metrics updates are sent back and applied here.
+    URLs held by a worker that dies (or exits with an error) are journaled
+    as failed ('worker_crashed'), and RuntimeError is raised once the
+    surviving workers are done
+    """
+    if options.get('host_rate'):
+        options['host_rate'] = options['host_rate'] / processes
+    targets = {'slug_cache': slug_cache, 'journal': journal, 'metrics': metrics}
+    forward = [kind for kind, target in targets.items() if target is not None]
+
+    # 'spawn': forking a process that already runs an event loop and threads is unsafe
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue(maxsize=queue_size)
+    url_queues = [context.Queue(maxsize=queue_size) for _ in range(processes)]
+    workers = [
+        context.Process(target=worker_main, name=f"scraper-{index}",
+                        args=(index, url_queues[index], results, options, forward))
+        for index in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    print(f"🧩 Scraping with {processes} worker processes")
+
+    def send(index, url):
+        # A dead worker never drains its queue: False if it is gone
+        while workers[index].is_alive():
+            try:
+                url_queues[index].put(url, timeout=1.0)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    outstanding = [set() for _ in range(processes)]  # sent, no product back yet
+    lost = 0
+
+    def mark_lost(urls_lost):
+        nonlocal lost
+        for url in urls_lost:
+            # URLs that already failed on their own keep their error class
+            if journal is not None and journal.urls.get(url, {}).get('state') != 'failed':
+                journal.record(url, 'failed', 'worker_crashed')
+            lost += 1
+
+    async def feed():
+        try:
+            async for url in _iterate(urls):
+                if journal is not None and journal.is_done(url):
+                    continue
+                index = shard_of(url, processes, salt='process')
+                outstanding[index].add(url)
+                if not await asyncio.to_thread(send, index, url):
+                    outstanding[index].discard(url)
+                    mark_lost([url])
+        finally:
+            for index in range(processes):
+                await asyncio.to_thread(send, index, None)
+
+    def next_message():
+        while True:
+            try:
+                return results.get(timeout=1.0)
+            except queue.Empty:
+                for index, process in enumerate(workers):
+                    if index in running and not process.is_alive():
+                        # Died without saying goodbye (crash, OOM kill)
+                        return ('crashed', index)
+
+    feeder = asyncio.create_task(feed())
+    running = set(range(processes))
+    try:
+        while running:
+            message = await asyncio.to_thread(next_message)
+            kind = message[0]
+            if kind == 'product':
+                url = message[1]['product_url']
+                outstanding[shard_of(url, processes, salt='process')].discard(url)
+                yield message[1]
+            elif kind in targets:
+                _, method, args, kwargs = message
+                getattr(targets[kind], method)(*args, **kwargs)
+            elif kind == 'done':
+                running.discard(message[1])
+            elif kind == 'crashed':
+                running.discard(message[1])
+                print(f"❌ Worker {message[1]} exited with code {workers[message[1]].exitcode}")
+        await feeder  # surface errors from the URL source
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+        for process in workers:
+            if running and process.is_alive():
+                process.terminate()
+            await asyncio.to_thread(process.join)
+        for mp_queue in [results, *url_queues]:
+            mp_queue.cancel_join_thread()
+            mp_queue.close()
+    crashed = {index: process.exitcode for index, process in enumerate(workers)
+               if process.exitcode}
+    for index in crashed:
+        mark_lost(outstanding[index])
+    if journal is not None:
+        journal.print_summary()
+    if crashed:
+        codes = ', '.join(f"#{index}: {code}" for index, code in crashed.items())
+        raise RuntimeError(f"{len(crashed)} of {processes} worker processes exited abnormally "
+                           f"({codes}); {lost} URLs were not scraped")
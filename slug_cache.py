@@ -0,0 +1,149 @@
+"""
+Persistent model name -> hind.ee URL mapping with negative caching
+
+Guessed slugs that 404 or have no sellers are remembered as dead and
+skipped until their retry-after time (doubling on every failure), so runs
+stop spending render time on URLs we already know are dead. Optionally a
+dead guess is looked up once through hind.ee search and the real product
+URL is stored instead.
+"""
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import quote_plus, urljoin
+
+# Slug cache settings (configurable via env)
+SLUG_CACHE_PATH = os.getenv('SLUG_CACHE_PATH', 'slug_cache.sqlite')  # '' disables the cache
+DEAD_RETRY_AFTER = float(os.getenv('SLUG_DEAD_RETRY_HOURS', '24')) * 3600
+MAX_RETRY_AFTER = 30 * 24 * 3600
+SEARCH_ENABLED = os.getenv('SLUG_SEARCH', '0') == '1'
+SEARCH_URL = os.getenv('HINDEE_SEARCH_URL', 'https://www.hind.ee/search?q={query}')
+
+PRODUCT_LINK_RE = re.compile(r'href="((?:https?://(?:www\.)?hind\.ee)?/p/[^"?#]+)"')
+
+
+async def search_product_url(fetcher, model):
+    """
+    Look a model up through hind.ee search
+    Returns the first product page URL in the results, or None
+    """
+    search_url = SEARCH_URL.format(query=quote_plus(model))
+    try:
+        status, html, _ = await fetcher.fetch(search_url)
+    except Exception as e:
+        print(f"⚠️ Search failed for {model}: {type(e).__name__}: {e}")
+        return None
+    if status != 200:
+        return None
+    match = PRODUCT_LINK_RE.search(html or '')
+    return urljoin(search_url, match.group(1)) if match else None
+
+
+class SlugCache:
+    """
+    SQLite table: model -> (url, status, failures, retry_after, source)
+    status is 'unknown' (not scraped yet), 'ok' or 'dead';
+    source is 'guess' (slug from the name) or 'search'
+    """
+
+    def __init__(self, guess, path=SLUG_CACHE_PATH, retry_after=DEAD_RETRY_AFTER):
+        self.guess = guess
+        self.retry_after = retry_after
+        self.skipped = 0
+        self.resolved = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS slugs (
+                model TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'unknown',
+                failures INTEGER NOT NULL DEFAULT 0,
+                retry_after REAL NOT NULL DEFAULT 0,
+                source TEXT NOT NULL DEFAULT 'guess',
+                searched INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS slugs_url ON slugs (url)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def url_for(self, model):
+        """
+        URL to scrape for a model, or None while it is negative-cached
+        """
+        row = self.conn.execute(
+            "SELECT url, status, retry_after FROM slugs WHERE model = ?", (model,)
+        ).fetchone()
+        if row is None:
+            url = self.guess(model)
+            self.conn.execute(
+                "INSERT INTO slugs (model, url, updated_at) VALUES (?, ?, ?)",
+                (model, url, time.time())
+            )
+            return url
+        url, status, retry_after = row
+        if status == 'dead' and time.time() < retry_after:
+            self.skipped += 1
+            return None
+        return url
+
+    def needs_search(self, model):
+        """
+        True if the model's guessed slug is dead and search was not tried yet
+        """
+        row = self.conn.execute(
+            "SELECT status, source, searched FROM slugs WHERE model = ?", (model,)
+        ).fetchone()
+        return row is not None and row == ('dead', 'guess', 0)
+
+    async def resolve_with_search(self, fetcher, model):
+        """
+        Try hind.ee search once for a dead guess; stores and returns the URL found
+        """
+        url = await search_product_url(fetcher, model)
+        if url is None:
+            self.conn.execute("UPDATE slugs SET searched = 1 WHERE model = ?", (model,))
+            return None
+        self.resolved += 1
+        self.conn.execute(
+            "UPDATE slugs SET url = ?, status = 'unknown', failures = 0, retry_after = 0, "
+            "source = 'search', searched = 1, updated_at = ? WHERE model = ?",
+            (url, time.time(), model)
+        )
+        return url
+
+    def record(self, url, found):
+        """
+        Record a scrape result for a URL: found=False negative-caches it
+        """
+        now = time.time()
+        if found:
+            self.conn.execute(
+                "UPDATE slugs SET status = 'ok', failures = 0, retry_after = 0, updated_at = ? "
+                "WHERE url = ?", (now, url)
+            )
+            return
+        for model, failures in self.conn.execute(
+                "SELECT model, failures FROM slugs WHERE url = ?", (url,)).fetchall():
+            delay = min(MAX_RETRY_AFTER, self.retry_after * 2 ** failures)
+            self.conn.execute(
+                "UPDATE slugs SET status = 'dead', failures = ?, retry_after = ?, updated_at = ? "
+                "WHERE model = ?", (failures + 1, now + delay, now, model)
+            )
+
+    def print_summary(self):
+        dead = self.conn.execute("SELECT COUNT(*) FROM slugs WHERE status = 'dead'").fetchone()[0]
+        print(f"🪦 Slug cache: skipped {self.skipped} dead URLs, {dead} negative-cached, "
+              f"{self.resolved} resolved via search")
@@ -0,0 +1,123 @@
+"""
+Supabase sink: batched, parallel, idempotent writes to the laptop_prices table
+
+Rows are upserted on the natural key (product_url, store_name, scraped_date),
+so retrying a chunk never creates duplicates. Chunks are sent several at a
+time and a failed chunk is retried on its own.
+
+The table needs a unique constraint on that key:
+
+    alter table laptop_prices add column if not exists scraped_date date;
+    create unique index if not exists laptop_prices_natural_key
+        on laptop_prices (product_url, store_name, scraped_date);
+"""
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Supabase settings (configurable via env)
+SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://muegxjihaepqayvwuyjz.supabase.co')
+SUPABASE_KEY = os.getenv('SUPABASE_KEY', 'your-service-role-key-here')
+POSTGREST_URL = os.getenv('POSTGREST_URL')  # talk to a PostgREST server directly (e.g. a local stand-in)
+PRICES_TABLE = os.getenv('SUPABASE_PRICES_TABLE', 'laptop_prices')
+CHUNK_SIZE = int(os.getenv('SUPABASE_CHUNK_SIZE', '500'))
+PARALLEL_CHUNKS = int(os.getenv('SUPABASE_PARALLEL_CHUNKS', '4'))
+MAX_RETRIES = int(os.getenv('SUPABASE_MAX_RETRIES', '3'))
+ON_CONFLICT = 'product_url,store_name,scraped_date'
+
+_clients = {}
+
+
+def get_client(url=SUPABASE_URL, key=SUPABASE_KEY, postgrest_url=POSTGREST_URL):
+    """
+    Shared client, created once per target and reused for every write
+    Anything with a supabase-style .table(name) method works
+    """
+    target = postgrest_url or url
+    client = _clients.get(target)
+    if client is None:
+        if postgrest_url:
+            from postgrest import SyncPostgrestClient
+            client = SyncPostgrestClient(postgrest_url, headers={'apikey': key})
+        else:
+            from supabase import create_client
+            client = create_client(url, key)
+        _clients[target] = client
+    return client
+
+
+def offer_rows(products_data, scraped_at=None):
+    """
+    Flatten products into laptop_prices rows, one per offer
+    A store listed twice keeps its first, cheapest offer (offers come in
+    price order, and an upsert cannot touch a row twice)
+    """
+    scraped_at = scraped_at or datetime.now()
+    rows = {}
+    for product in products_data:
+        for offer in product['offers']:
+            # laptop_prices is a price history; a disappeared offer has no new price
+            if offer.get('change') == 'removed':
+                continue
+            key = (product['product_url'], offer['store_name'])
+            rows.setdefault(key, {
+                'product_name': product['product_name'],
+                'product_url': product['product_url'],
+                'store_name': offer['store_name'],
+                'store_link': offer['store_link'],
+                'price_text': offer['price_text'],
+                'price_value': offer['price_value'],
+                'position': offer['position'],
+                'scraped_at': scraped_at.isoformat(),
+                'scraped_date': scraped_at.date().isoformat()
+            })
+    return list(rows.values())
+
+
+class SupabaseSink:
+    """
+    Writes offers in chunks of `chunk_size`, `parallel` chunks at a time
+    """
+
+    def __init__(self, client=None, table=PRICES_TABLE, chunk_size=CHUNK_SIZE,
+                 parallel=PARALLEL_CHUNKS, max_retries=MAX_RETRIES, sleep=time.sleep):
+        self.client = client
+        self.table = table
+        self.chunk_size = max(1, chunk_size)
+        self.parallel = max(1, parallel)
+        self.max_retries = max_retries
+        self.sleep = sleep
+
+    def _write_chunk(self, chunk):
+        """
+        Upsert one chunk, retrying just this chunk on failure
+        Returns the number of rows written (0 if it gave up)
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.client.table(self.table).upsert(chunk, on_conflict=ON_CONFLICT).execute()
+                return len(chunk)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"❌ Supabase chunk of {len(chunk)} rows failed: {type(e).__name__}: {e}")
+                    return 0
+                delay = min(30.0, 2 ** attempt) + random.random()
+                print(f"⏳ Supabase chunk failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    def write(self, products_data):
+        """
+        Upsert all offers of `products_data`
+        Returns (rows saved, rows failed)
+        """
+        rows = offer_rows(products_data)
+        if not rows:
+            return 0, 0
+        if self.client is None:
+            self.client = get_client()
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        with ThreadPoolExecutor(max_workers=min(self.parallel, len(chunks))) as executor:
+            saved = sum(executor.map(self._write_chunk, chunks))
+        return saved, len(rows) - saved
@@ -0,0 +1,157 @@
+"""
+save_to_google_sheets against a fake gspread backend: quota (429) retries,
+Retry-After, backoff, and batches that fail part-way through
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+
+import gspread
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pipeline  # noqa: E402
+from price_state import PriceState  # noqa: E402
+
+spec = importlib.util.spec_from_file_location('step3', os.path.join(ROOT, '3_save_to_sheets.py'))
+step3 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(step3)
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+        self.text = ''
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'fake', 'status': 'FAKE'}}
+
+
+class FakeWorksheet:
+    """
+    Appends rows to a list; `failures` are raised by append_rows calls in
+    order (None lets that call through)
+    """
+
+    def __init__(self, failures=()):
+        self.rows = []
+        self.failures = list(failures)
+        self.calls = 0
+
+    def row_values(self, row):
+        return self.rows[row - 1] if len(self.rows) >= row else []
+
+    def append_row(self, row):
+        self.rows.append(row)
+
+    def append_rows(self, rows):
+        self.calls += 1
+        if self.failures:
+            failure = self.failures.pop(0)
+            if failure is not None:
+                raise gspread.exceptions.APIError(failure)
+        self.rows.extend(rows)
+
+
+class FakeSpreadsheet:
+    id = 'fake-sheet'
+
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+
+    def worksheet(self, name):
+        return self._worksheet
+
+
+class FakeClient:
+    def __init__(self, worksheet):
+        self.spreadsheet = FakeSpreadsheet(worksheet)
+
+    def open(self, name):
+        return self.spreadsheet
+
+
+def products(count, offers=2):
+    return [{
+        'product_name': f"Laptop {i}",
+        'product_url': f"https://hind.ee/p/laptop-{i}",
+        'offers': [{'position': n + 1, 'store_name': f"Store {n}", 'store_link': '',
+                    'price_text': '', 'price_value': 100.0 + i + n} for n in range(offers)],
+    } for i in range(count)]
+
+
+def test_retry_after_is_honoured():
+    worksheet = FakeWorksheet([FakeResponse(429, {'Retry-After': '7'}), None])
+    sleeps = []
+    saved = step3.save_to_google_sheets(products(3), client=FakeClient(worksheet),
+                                        sleep=sleeps.append, raise_errors=True)
+    assert saved == 6
+    assert sleeps == [7.0]
+    assert len(worksheet.rows) == 7  # header + 6 offers
+
+
+def test_backoff_without_retry_after():
+    worksheet = FakeWorksheet([FakeResponse(429), FakeResponse(503), None])
+    sleeps = []
+    step3.save_to_google_sheets(products(1), client=FakeClient(worksheet),
+                                sleep=sleeps.append, raise_errors=True)
+    assert len(sleeps) == 2
+    assert 1.0 <= sleeps[0] < 2.0 and 2.0 <= sleeps[1] < 3.0
+
+
+def test_gives_up_after_max_retries():
+    worksheet = FakeWorksheet([FakeResponse(429)] * (step3.SHEETS_MAX_RETRIES + 1))
+    sleeps = []
+    with pytest.raises(gspread.exceptions.APIError):
+        step3.save_to_google_sheets(products(1), client=FakeClient(worksheet),
+                                    sleep=sleeps.append, raise_errors=True)
+    assert len(sleeps) == step3.SHEETS_MAX_RETRIES
+    assert worksheet.rows == [step3.SHEETS_HEADERS]
+
+
+def test_client_errors_are_not_retried():
+    worksheet = FakeWorksheet([FakeResponse(400)])
+    sleeps = []
+    with pytest.raises(gspread.exceptions.APIError):
+        step3.save_to_google_sheets(products(1), client=FakeClient(worksheet),
+                                    sleep=sleeps.append, raise_errors=True)
+    assert sleeps == [] and worksheet.calls == 1
+
+
+def test_partial_write_reports_appended_products():
+    batch = products(5, offers=2)
+    worksheet = FakeWorksheet([None, None, FakeResponse(403)])
+    with pytest.raises(pipeline.PartialWriteError) as failure:
+        step3.save_to_google_sheets(batch, client=FakeClient(worksheet), chunk_size=4,
+                                    sleep=lambda _: None, raise_errors=True)
+    # Chunks of 4 rows = 2 products each; the third chunk failed
+    assert failure.value.written == batch[:4]
+    assert len(worksheet.rows) == 1 + 8
+
+
+def test_partially_written_batch_is_not_written_again(tmp_path):
+    batch = products(4, offers=2)
+    state = PriceState(str(tmp_path / 'state.sqlite'))
+
+    def write(to_write):
+        worksheet = FakeWorksheet([None, FakeResponse(403)])
+        step3.save_to_google_sheets(to_write, client=FakeClient(worksheet), chunk_size=4,
+                                    sleep=lambda _: None, raise_errors=True)
+
+    async def run():
+        queue = asyncio.Queue()
+        for product in batch:
+            await queue.put(state.diff(product, 'sheets'))
+        await queue.put(None)
+        sink = pipeline.Sink('sheets', write, retries=0)
+        return await pipeline.batch_consumer(queue, sink, price_state=state)
+
+    assert asyncio.run(run()) == 0
+    # The two products of the appended chunk are recorded, the rest are new again
+    changes = [{offer['change'] for offer in state.diff(product, 'sheets')['offers']}
+               for product in batch]
+    assert changes == [{'unchanged'}, {'unchanged'}, {'new'}, {'new'}]
+    state.close()
@@ -0,0 +1,132 @@
+"""
+SupabaseSink against a local PostgREST stand-in: upserts on the natural
+key, chunking, and per-chunk retries
+"""
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from supabase_sink import ON_CONFLICT, PRICES_TABLE, SupabaseSink, offer_rows  # noqa: E402
+
+postgrest = pytest.importorskip('postgrest')
+
+
+class PostgrestStandIn:
+    """
+    Minimal PostgREST: POST /<table>?on_conflict=... upserts rows keyed by
+    the on_conflict columns; the first `fail` requests get a 503
+    """
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.rows = {}
+        self.requests = []
+        self.loop = asyncio.new_event_loop()
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+
+    async def handle(self, request):
+        rows = await request.json()
+        self.requests.append({'rows': len(rows), 'prefer': request.headers.get('Prefer', ''),
+                              'on_conflict': request.query.get('on_conflict')})
+        if self.fail:
+            self.fail -= 1
+            return web.json_response({'message': 'unavailable'}, status=503)
+        keys = request.query['on_conflict'].split(',')
+        batch = set()
+        for row in rows:
+            key = tuple(row[k] for k in keys)
+            if key in batch:  # PostgreSQL: ON CONFLICT cannot affect a row twice
+                return web.json_response({'code': '21000', 'message': 'cannot affect row a second time'},
+                                         status=500)
+            batch.add(key)
+            self.rows[key] = row
+        return web.Response(status=201, text=json.dumps(rows), content_type='application/json')
+
+    def __enter__(self):
+        app = web.Application()
+        app.router.add_post(f"/{PRICES_TABLE}", self.handle)
+        self.runner = web.AppRunner(app)
+        ready = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.runner.setup())
+            site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+            self.loop.run_until_complete(site.start())
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        ready.wait(10)
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+
+
+def products(count, offers=3):
+    return [{
+        'product_name': f"Laptop {i}",
+        'product_url': f"https://hind.ee/p/laptop-{i}",
+        'offers': [{'position': n + 1, 'store_name': f"Store {n}", 'store_link': '',
+                    'price_text': '', 'price_value': 100.0 + n} for n in range(offers)],
+    } for i in range(count)]
+
+
+def sink_for(server, **options):
+    client = postgrest.SyncPostgrestClient(server.url, headers={'apikey': 'test'})
+    return SupabaseSink(client=client, **options)
+
+
+def test_duplicate_store_keeps_cheapest_offer():
+    product = products(1)[0]
+    product['offers'][2]['store_name'] = 'Store 0'  # listed again, at a higher price
+    rows = offer_rows([product])
+    assert [(row['store_name'], row['price_value']) for row in rows] == [
+        ('Store 0', 100.0), ('Store 1', 101.0)
+    ]
+
+
+def test_upsert_in_chunks_is_idempotent():
+    with PostgrestStandIn() as server:
+        sink = sink_for(server, chunk_size=4, parallel=2)
+        assert sink.write(products(5)) == (15, 0)
+        assert len(server.requests) == 4  # 15 rows in chunks of 4
+        assert all(r['on_conflict'] == ON_CONFLICT for r in server.requests)
+        assert all('merge-duplicates' in r['prefer'] for r in server.requests)
+        # Writing the same offers again updates the rows instead of adding more
+        assert sink.write(products(5)) == (15, 0)
+        assert len(server.rows) == 15
+
+
+def test_failed_chunk_is_retried_on_its_own():
+    sleeps = []
+    with PostgrestStandIn(fail=1) as server:
+        sink = sink_for(server, chunk_size=3, parallel=1, sleep=sleeps.append)
+        assert sink.write(products(2)) == (6, 0)
+        assert [r['rows'] for r in server.requests] == [3, 3, 3]  # first chunk sent twice
+        assert len(sleeps) == 1
+        assert len(server.rows) == 6
+
+
+def test_chunk_gives_up_after_max_retries():
+    sleeps = []
+    with PostgrestStandIn(fail=10) as server:
+        sink = sink_for(server, chunk_size=3, parallel=1, max_retries=2, sleep=sleeps.append)
+        assert sink.write(products(2)) == (0, 6)
+        assert len(server.requests) == 6  # 2 chunks x 3 attempts
+        assert len(sleeps) == 4